@@ -0,0 +1,106 @@
+'''
+Encoding of the selections of a ballot in a single plaintext, so a ballot
+with several selections is still one ciphertext for the mixnet.
+
+The selections are the digits of the plaintext in base max(number) + 2,
+the first one in the lowest digit, each one as its option number + 1, so
+the 0 digit isn't a valid selection and the number of selections is the
+number of digits. The order is kept, for ranked ballots.
+
+Ballots of questions with a single selection are just the option number,
+as they always were.
+
+The booth has the same encoding in javascript, decideEncode.
+
+>>> numbers = [1, 2, 3, 4]
+>>> encode([3], numbers)
+3
+>>> m = encode([3, 1], numbers, 2)
+>>> m
+16
+>>> decode(m, numbers, 2)
+[3, 1]
+>>> decode(14, numbers) is None
+True
+>>> decode(encode([4, 2, 1], numbers, 3), numbers, 2) is None
+True
+>>> ballots = [encode(s, numbers, 2) for s in ([3], [3, 1], [2])]
+>>> count(ballots + [99], numbers, 2)
+{1: 1, 2: 1, 3: 2, 4: 0}
+>>> capacity(numbers, 2 ** 160)
+61
+'''
+
+
+def base(numbers):
+    return max(numbers) + 2
+
+
+def pack(selections, base):
+    m = 0
+    for s in reversed(selections):
+        m = m * base + s + 1
+    return m
+
+
+def unpack(m, base):
+    selections = []
+    while m > 0:
+        m, d = divmod(m, base)
+        if not d:
+            return None
+        selections.append(d - 1)
+    return selections
+
+
+def encode(selections, numbers, size=1):
+    '''
+    Plaintext for a ballot with these selections, of a question with
+    these option numbers and up to size selections
+    '''
+
+    if size == 1:
+        return selections[0]
+    return pack(selections, base(numbers))
+
+
+def decode(m, numbers, size=1):
+    '''
+    Selections of a decrypted ballot, or None if it isn't valid: unknown
+    options, repeated options or too many selections
+    '''
+
+    if size == 1:
+        return [m] if m in numbers else None
+
+    selections = unpack(m, base(numbers))
+    if (not selections or len(selections) > size or
+            len(set(selections)) != len(selections) or
+            not set(selections) <= set(numbers)):
+        return None
+    return selections
+
+
+def count(plaintexts, numbers, size=1):
+    '''
+    Number of valid ballots with each option number among its selections
+    '''
+
+    counts = {n: 0 for n in numbers}
+    for m in plaintexts:
+        for s in decode(m, numbers, size) or []:
+            counts[s] += 1
+    return counts
+
+
+def capacity(numbers, bound):
+    '''
+    Maximum number of selections of a ballot, so any plaintext is lower
+    than bound, the modulus of the key
+    '''
+
+    b = base(numbers)
+    k, top = 0, b
+    while top <= bound:
+        k, top = k + 1, top * b
+    return k
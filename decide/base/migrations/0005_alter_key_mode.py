@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_key_mode'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='key',
+            name='mode',
+            field=models.CharField(choices=[('full', 'Full exponents'), ('qr', 'Quadratic residues, short exponents'), ('p256', 'Elliptic curve P-256')], default='full', max_length=4),
+        ),
+    ]
@@ -30,10 +30,25 @@ class Auth(models.Model):
 
 
 class Key(models.Model):
+    '''
+    ElGamal key. The mode is how the key is used, see mixnet.mixcrypt:
+    FULL keys use exponents of the size of p, QR keys short exponents and
+    the plaintexts encoded in the quadratic residues, and EC keys are in
+    the curve P-256, with g and y encoded points, see mixnet.ec
+    '''
+
+    FULL, QR, EC = 'full', 'qr', 'p256'
+    MODES = (
+        (FULL, 'Full exponents'),
+        (QR, 'Quadratic residues, short exponents'),
+        (EC, 'Elliptic curve P-256'),
+    )
+
     p = BigBigField()
     g = BigBigField()
     y = BigBigField()
     x = BigBigField(blank=True, null=True)
+    mode = models.CharField(max_length=4, choices=MODES, default=FULL)
 
     def __str__(self):
         if self.x:
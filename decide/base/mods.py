@@ -1,6 +1,21 @@
+import io
+import json
+import threading
+import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+
 import requests
+from django.apps import apps
 from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from base import wire
 
 
 def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
@@ -15,12 +30,25 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     This function returns the json returned. If there's a problem an
     execption will be raised.
 
+    If the module is in this deployment, its baseurl is our BASEURL, and
+    LOCAL_QUERIES is enabled, the view is called in-process, see
+    local_query, instead of making an HTTP request. The HTTP requests use
+    the pooled session of the baseurl, see session.
+
     Optional parameters
 
     This function can receive optional parameters to complete the query,
     you can complete the query with GET params using the **params** keyword
     and with json data, using the **json** keyword.
 
+    With the **binary** keyword the data is sent and asked in the binary
+    ciphertexts format of base.wire, if WIRE_BINARY is enabled. Use it for
+    queries with lists of ciphertexts. Responses returned with the
+    **response** keyword should be read with the parse function.
+
+    The **timeout** keyword is the (connect, read) timeout of the HTTP
+    request, by default the one of the module, see query_timeout.
+
     Examples
 
     >>> r = query('voting', params={'id': 1})
@@ -35,8 +63,7 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     else:
         mod = baseurl
 
-    q = getattr(requests, method)
-    url = '{}/{}{}'.format(mod, modname, entry_point)
+    path = '/{}{}'.format(modname, entry_point)
 
     headers = {}
     if 'HTTP_AUTHORIZATION' in kwargs:
@@ -44,18 +71,266 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
 
     params = kwargs.get('params', None)
     if params:
-        url += '?{}'.format(urllib.parse.urlencode(params))
+        path += '?{}'.format(urllib.parse.urlencode(params))
+
+    binary = kwargs.get('binary', False) and settings.WIRE_BINARY
+    if binary:
+        headers['Accept'] = wire.accept(settings.WIRE_COMPRESS)
 
+    data = None
     if method == 'get':
-        response = q(url, headers=headers)
+        pass
+    elif binary:
+        headers['Content-Type'] = wire.MEDIA_TYPE
+        data = wire.dumps(kwargs.get('json', {}), settings.WIRE_COMPRESS)
     else:
-        json_data = kwargs.get('json', {})
-        response = q(url, json=json_data, headers=headers)
+        headers['Content-Type'] = 'application/json'
+        data = json.dumps(kwargs.get('json', {})).encode()
+
+    timeout = kwargs.get('timeout', query_timeout(modname))
+    response = send(method, mod, path, data, headers, timeout)
 
     if kwargs.get('response', False):
         return response
     else:
-        return response.json()
+        return parse(response)
+
+
+def gather(*queries):
+    '''
+    Results of several queries made at the same time, in order. Each query
+    is a dict with the parameters of query.
+
+    The HTTP requests are made in a pool of QUERIES_POOL_SIZE threads,
+    with the pooled sessions, so their latencies overlap. The queries to
+    local modules, with no network to wait for, are made in this thread
+    while the HTTP ones are waiting, and so is a single HTTP request.
+
+    >>> voting, voter = gather({'modname': 'voting', 'params': {'id': 1}},
+    ...                        {'modname': 'authentication', 'entry_point': '/getuser/',
+    ...                         'method': 'post', 'json': {'token': token}})
+    '''
+
+    def local(q):
+        return is_local(q.get('baseurl') or settings.APIS.get(q['modname'], settings.BASEURL))
+
+    remote = [not local(q) for q in queries]
+    if sum(remote) < 2:
+        return [query(**q) for q in queries]
+
+    futures = [executor().submit(query, **q) if r else None for q, r in zip(queries, remote)]
+    return [f.result() if f else query(**q) for f, q in zip(futures, queries)]
+
+
+def query_timeout(modname):
+    '''
+    (connect, read) timeout of the queries to modname: QUERIES_TIMEOUT, or
+    MIXNET_QUERIES_TIMEOUT for the mixnet, whose chain calls last as long
+    as the shuffle or the decrypt of all the votes by the next auths
+    '''
+
+    if modname.split('/')[0] == 'mixnet':
+        return settings.MIXNET_QUERIES_TIMEOUT
+    return settings.QUERIES_TIMEOUT
+
+
+def send(method, baseurl, path, data=None, headers=None, timeout=None):
+    '''
+    Makes the request of a query to baseurl, in-process if the module is
+    local, and records its latency. timeout is the one of the HTTP request,
+    QUERIES_TIMEOUT if it isn't given.
+    '''
+
+    start = time.perf_counter()
+    if is_local(baseurl):
+        response = local_query(method, path, data, headers)
+    else:
+        response = session(baseurl).request(method, baseurl + path, data=data,
+                                            headers=headers,
+                                            timeout=timeout or settings.QUERIES_TIMEOUT)
+    latency(baseurl).add(time.perf_counter() - start)
+    return response
+
+
+_sessions = {}
+_latencies = {}
+_executor = None
+_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.QUERIES_POOL_SIZE)
+        return _executor
+
+
+def session(baseurl):
+    '''
+    requests session for the queries to baseurl, with a pool of up to
+    QUERIES_POOL_SIZE keep-alive connections, so the queries don't pay the
+    TCP and TLS handshakes each time.
+
+    The GET requests are retried up to QUERIES_RETRIES times on errors and
+    on 502, 503 and 504 responses, and any request if it couldn't connect,
+    the other ones aren't idempotent. The cookies aren't kept.
+    '''
+
+    with _lock:
+        s = _sessions.get(baseurl)
+        if s is None:
+            # allowed_methods was method_whitelist before urllib3 1.26
+            methods = ('allowed_methods' if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS')
+                       else 'method_whitelist')
+            retry = Retry(total=settings.QUERIES_RETRIES, backoff_factor=0.1,
+                          status_forcelist=(502, 503, 504), raise_on_status=False,
+                          **{methods: frozenset(['GET'])})
+            s = requests.Session()
+            s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            s.mount(baseurl, HTTPAdapter(pool_connections=1,
+                                         pool_maxsize=settings.QUERIES_POOL_SIZE,
+                                         max_retries=retry))
+            _sessions[baseurl] = s
+        return s
+
+
+class Latency:
+    '''
+    Latency, in seconds, of the queries to a baseurl
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.last = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return '<Latency count={} mean={:.4f} max={:.4f}>'.format(
+            self.count, self.mean, self.max)
+
+
+def latency(baseurl):
+    '''
+    Latency of the queries made to baseurl
+    '''
+
+    with _lock:
+        return _latencies.setdefault(baseurl, Latency())
+
+
+def in_process(modname):
+    '''
+    If the module is installed in this deployment and the others reach it
+    at BASEURL, so its models can be read here
+    '''
+
+    url = settings.APIS.get(modname, settings.BASEURL)
+    return apps.is_installed(modname) and url.rstrip('/') == settings.BASEURL.rstrip('/')
+
+
+def is_local(baseurl):
+    return (settings.LOCAL_QUERIES and
+            baseurl.rstrip('/') == settings.BASEURL.rstrip('/'))
+
+
+class LocalResponse:
+    '''
+    Response of a local_query, with the interface of the requests
+    responses that the modules use
+    '''
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.content = response.content
+        self.headers = CaseInsensitiveDict(response.items())
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def local_query(method, path, data=None, headers=None):
+    '''
+    Handles the request of path, with its query string, in this process,
+    as if it were an HTTP request with this body and these headers, and
+    returns a LocalResponse.
+
+    The request goes through the same middlewares, URL resolver and error
+    handling as the HTTP requests, so the errors are the same responses
+    too, a 404 for an unknown path, a 500 for an exception.
+    '''
+
+    path, _, qs = path.partition('?')
+    data = data or b''
+    base = urllib.parse.urlsplit(settings.BASEURL)
+    environ = {
+        'REQUEST_METHOD': method.upper(),
+        'PATH_INFO': path,
+        'QUERY_STRING': qs,
+        'SERVER_NAME': base.hostname or 'localhost',
+        'SERVER_PORT': str(base.port or (443 if base.scheme == 'https' else 80)),
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': base.netloc or 'localhost',
+        'CONTENT_LENGTH': str(len(data)),
+        'wsgi.input': io.BytesIO(data),
+        'wsgi.url_scheme': base.scheme or 'http',
+    }
+    for name, value in (headers or {}).items():
+        key = name.upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        environ[key] = value
+
+    return LocalResponse(handler().get_response(WSGIRequest(environ)))
+
+
+_handler = None
+
+
+def handler():
+    '''
+    Django request handler, with the middlewares loaded, for local_query
+    '''
+
+    global _handler
+    with _lock:
+        if _handler is None:
+            h = BaseHandler()
+            h.load_middleware()
+            _handler = h
+        return _handler
+
+
+def parse(response):
+    '''
+    Data of a query response, in json or in the binary ciphertexts format
+    '''
+
+    headers = getattr(response, 'headers', response)
+    if headers.get('Content-Type', '').startswith(wire.MEDIA_TYPE):
+        return wire.loads(response.content)
+    return response.json()
 
 
 def get(*args, **kwargs):
@@ -81,16 +356,24 @@ def mock_query(client):
 
         q = getattr(client, method)
 
+        extra = {}
+        binary = kwargs.get('binary', False) and settings.WIRE_BINARY
+        if binary:
+            extra['HTTP_ACCEPT'] = wire.accept(settings.WIRE_COMPRESS)
+
         if method == 'get':
-            response = q(url, format='json')
+            response = q(url, format='json', **extra)
+        elif binary:
+            data = wire.dumps(kwargs.get('json', {}), settings.WIRE_COMPRESS)
+            response = q(url, data=data, content_type=wire.MEDIA_TYPE, **extra)
         else:
             json_data = kwargs.get('json', {})
-            response = q(url, data=json_data, format='json')
+            response = q(url, data=json_data, format='json', **extra)
 
         if kwargs.get('response', False):
             return response
         else:
-            return response.json()
+            return parse(response)
 
     global query
     query = test_query
@@ -16,4 +16,4 @@ class KeySerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Key
-        fields = ('p', 'g', 'y')
+        fields = ('p', 'g', 'y', 'mode')
@@ -1,8 +1,21 @@
+import doctest
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test import override_settings
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
+from base import ballot
 from base import mods
+from base import wire
 
 
 class BaseTestCase(APITestCase):
@@ -34,3 +47,173 @@ class BaseTestCase(APITestCase):
 
     def logout(self):
         self.client.credentials()
+
+
+class WireTestCase(TestCase):
+
+    def test_doctests(self):
+        result = doctest.testmod(wire)
+        self.assertEqual(result.failed, 0)
+
+    def test_bad_message(self):
+        with self.assertRaises(ValueError):
+            wire.loads(b'{"msgs": []}')
+        with self.assertRaises(ValueError):
+            wire.loads(wire.dumps([[1, 2], [3, 4]])[:-1])
+
+    def test_compressed_bomb(self):
+        # a small header followed by much more compressed data
+        fields = wire.HEADER.unpack_from(wire.dumps([1]))
+        header = wire.HEADER.pack(wire.MAGIC, wire.COMPRESSED, *fields[2:])
+        with self.assertRaisesRegex(ValueError, 'Wrong message length'):
+            wire.loads(header + zlib.compress(b'null' + bytes(10 ** 7)))
+        with self.settings(WIRE_MAX_SIZE=100):
+            with self.assertRaisesRegex(ValueError, 'Message too large'):
+                wire.loads(wire.dumps(list(range(1000)), compress=True))
+
+    def test_parser_only_in_mixnet(self):
+        data = wire.dumps({'username': 'admin', 'password': 'qwerty'})
+        response = self.client.post('/authentication/login/', data,
+                                    content_type=wire.MEDIA_TYPE)
+        self.assertEqual(response.status_code, 415)
+
+
+class BallotTestCase(TestCase):
+
+    def test_doctests(self):
+        result = doctest.testmod(ballot)
+        self.assertEqual(result.failed, 0)
+
+
+class LocalQueryTestCase(BaseTestCase):
+
+    def query(self, method, path, data=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = 'Token ' + token
+        body = json.dumps(data).encode() if data is not None else None
+        return mods.local_query(method, path, body, headers)
+
+    def test_same_as_http(self):
+        response = self.query('post', '/authentication/login/',
+                              {'username': 'admin', 'password': 'qwerty'})
+        self.assertEqual(response.status_code, 200)
+        token = response.json()['token']
+        self.assertEqual(response.headers['content-type'], 'application/json')
+
+        response = self.query('post', '/authentication/getuser/', {'token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], 'admin')
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        for method, path, data in [
+                ('get', '/voting/?id=1', None),
+                ('post', '/voting/', {}),
+                ('put', '/voting/1/', {'action': 'start'}),
+                ('post', '/authentication/login/', {'username': 'admin'})]:
+            response = self.query(method, path, data, token)
+            expected = getattr(self.client, method)(path, data, format='json')
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.json(), expected.json())
+
+        response = self.query('post', '/voting/', {})
+        self.assertEqual(response.status_code, 401)
+
+    def test_middlewares(self):
+        response = self.query('get', '/voting/?id=1')
+        self.assertEqual(response.headers['X-Frame-Options'], 'SAMEORIGIN')
+
+        # the django views that aren't exempt need the csrf token
+        response = self.query('post', '/admin/login/', {})
+        self.assertEqual(response.status_code, 403)
+
+    def test_not_found(self):
+        response = self.query('get', '/nomodule/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.ok)
+
+    def test_is_local(self):
+        with override_settings(BASEURL='http://localhost:8000/', LOCAL_QUERIES=True):
+            self.assertTrue(mods.is_local('http://localhost:8000'))
+            self.assertFalse(mods.is_local('http://127.0.0.1:8000'))
+        with override_settings(BASEURL='http://localhost:8000', LOCAL_QUERIES=False):
+            self.assertFalse(mods.is_local('http://localhost:8000'))
+
+
+class PooledQueryTestCase(TestCase):
+
+    def setUp(self):
+        connections = self.connections = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            timeout = 5
+
+            def setup(self):
+                connections.append(self.client_address)
+                super().setup()
+
+            def do_GET(self):
+                body = json.dumps({'path': self.path}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.baseurl = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        mods.session(self.baseurl).close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for i in range(3):
+            response = mods.send('get', self.baseurl, '/voting/?id={}'.format(i))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mods.parse(response), {'path': '/voting/?id={}'.format(i)})
+        self.assertEqual(len(self.connections), 1)
+        self.assertIs(mods.session(self.baseurl), mods.session(self.baseurl))
+        self.assertEqual(mods.latency(self.baseurl).count, 3)
+
+    def test_timeouts(self):
+        self.assertEqual(mods.query_timeout('mixnet'), settings.MIXNET_QUERIES_TIMEOUT)
+        self.assertEqual(mods.query_timeout('census/1'), settings.QUERIES_TIMEOUT)
+        with mock.patch.object(mods.requests.Session, 'request') as request:
+            mods.send('post', self.baseurl, '/mixnet/shuffle/1/', b'{}', {}, (5, None))
+            mods.send('get', self.baseurl, '/voting/')
+        self.assertEqual(request.call_args_list[0][1]['timeout'], (5, None))
+        self.assertEqual(request.call_args_list[1][1]['timeout'], settings.QUERIES_TIMEOUT)
+
+    def test_retries(self):
+        adapter = mods.session(self.baseurl).get_adapter(self.baseurl + '/voting/')
+        retry = adapter.max_retries
+        self.assertEqual(retry.total, settings.QUERIES_RETRIES)
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertFalse(retry.is_retry('POST', 503))
+
+    def test_gather(self):
+        def slow_query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
+            time.sleep(0.2)
+            return modname, threading.get_ident()
+
+        queries = [{'modname': str(i), 'baseurl': self.baseurl} for i in range(4)]
+        with mock.patch.object(mods, 'query', slow_query):
+            start = time.perf_counter()
+            results = mods.gather(*queries)
+            elapsed = time.perf_counter() - start
+            with self.settings(LOCAL_QUERIES=True):
+                local = mods.gather({'modname': 'voting', 'baseurl': settings.BASEURL},
+                                    {'modname': '4', 'baseurl': self.baseurl})
+
+        self.assertEqual([m for m, _ in results], ['0', '1', '2', '3'])
+        self.assertLess(elapsed, 0.6)
+        # one local and one HTTP query, both in this thread
+        self.assertEqual(local, [('voting', threading.get_ident()),
+                                 ('4', threading.get_ident())])
@@ -0,0 +1,199 @@
+'''
+Compact binary format for the ciphertexts sent between modules.
+
+Lists of ciphertexts are sent as fixed-width big endian integers instead
+of JSON decimal numbers, that are slow to convert for big integers and
+much larger. The rest of the data is sent as JSON in the same message, so
+any data can be sent in this format:
+
+ * a list of ciphertexts, [[a, b]] or plain integers [m]
+ * a dict with the ciphertexts in "msgs", as the mixnet requests
+ * a list of votes with the ciphertexts in "a" and "b", as the store
+
+A message is a header, the JSON part, and then the integers. Everything
+after the header can be compressed with zlib.
+
+>>> data = {"msgs": [[1, 2], [3, 2**200]], "pk": {"p": 23}}
+>>> loads(dumps(data)) == data
+True
+>>> loads(dumps([5, 7, 11], compress=True))
+[5, 7, 11]
+>>> loads(dumps([{"voter_id": 1, "a": 2, "b": 3}]))
+[{'voter_id': 1, 'a': 2, 'b': 3}]
+>>> loads(dumps({"detail": "Not found."}))
+{'detail': 'Not found.'}
+>>> loads(dumps(None)) is None
+True
+
+The size of a message, once decompressed, is limited, 16 bytes here:
+
+>>> loads(dumps([2**100], compress=True), limit=16)
+Traceback (most recent call last):
+  ...
+ValueError: Message too large
+'''
+
+import json
+import struct
+import zlib
+
+from django.conf import settings
+from django.http.multipartparser import parse_header
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+MEDIA_TYPE = 'application/vnd.decide.ciphertexts'
+
+MAGIC = b'DCW1'
+
+# magic, flags, kind, integers by ciphertext, width, ciphertexts and
+# length of the JSON part
+HEADER = struct.Struct('>4sBBBxIQI')
+
+COMPRESSED = 1
+
+# where the ciphertexts are in the data
+JSON, LIST, MSGS, VOTES = range(4)
+
+
+def isint(n):
+    return isinstance(n, int) and not isinstance(n, bool) and n >= 0
+
+
+def arity(msgs):
+    '''
+    Integers by ciphertext, 1 or 2, or None if msgs isn't a list of
+    ciphertexts
+    '''
+
+    if not isinstance(msgs, (list, tuple)):
+        return None
+    if all(isint(m) for m in msgs):
+        return 1
+    if all(isinstance(m, (list, tuple)) and len(m) == 2 and
+           isint(m[0]) and isint(m[1]) for m in msgs):
+        return 2
+    return None
+
+
+def isvotes(data):
+    return (isinstance(data, (list, tuple)) and data and
+            all(isinstance(v, dict) and isint(v.get('a')) and isint(v.get('b'))
+                for v in data))
+
+
+def dumps(data, compress=False):
+    kind, meta, msgs = JSON, data, []
+    if arity(data):
+        kind, meta, msgs = LIST, None, data
+    elif isinstance(data, dict) and arity(data.get('msgs')):
+        msgs = data['msgs']
+        kind, meta = MSGS, {k: v for k, v in data.items() if k != 'msgs'}
+    elif isvotes(data):
+        msgs = [(v['a'], v['b']) for v in data]
+        meta = [{k: i for k, i in v.items() if k not in ('a', 'b')} for v in data]
+        kind = VOTES
+
+    n = arity(msgs)
+    values = msgs if n == 1 else [i for m in msgs for i in m]
+    width = max(1, (max(values, default=0).bit_length() + 7) // 8)
+
+    meta = json.dumps(meta, cls=JSONEncoder).encode()
+    body = meta + b''.join(i.to_bytes(width, 'big') for i in values)
+    flags = 0
+    if compress:
+        body = zlib.compress(body)
+        flags |= COMPRESSED
+
+    return HEADER.pack(MAGIC, flags, kind, n, width, len(msgs), len(meta)) + body
+
+
+def loads(data, limit=None):
+    '''
+    Data of a message, that can't be larger than limit bytes after the
+    header once decompressed, WIRE_MAX_SIZE if it isn't given
+    '''
+
+    if len(data) < HEADER.size or not data.startswith(MAGIC):
+        raise ValueError('Not a ciphertexts message')
+    _, flags, kind, n, width, count, metalen = HEADER.unpack_from(data)
+
+    # the header says the size, nothing beyond it is decompressed
+    size = metalen + count * n * width
+    if size > (limit or settings.WIRE_MAX_SIZE):
+        raise ValueError('Message too large')
+
+    body = data[HEADER.size:]
+    if flags & COMPRESSED:
+        d = zlib.decompressobj()
+        try:
+            body = d.decompress(body, size + 1)
+        except zlib.error as e:
+            raise ValueError(str(e))
+        if not d.eof or d.unconsumed_tail:
+            raise ValueError('Wrong message length')
+    if len(body) != size:
+        raise ValueError('Wrong message length')
+
+    meta = json.loads(body[:metalen].decode())
+    values = [int.from_bytes(body[i:i + width], 'big')
+              for i in range(metalen, len(body), width)]
+    if n == 2:
+        it = iter(values)
+        msgs = [list(m) for m in zip(it, it)]
+    else:
+        msgs = values
+
+    if kind == LIST:
+        return msgs
+    if kind == MSGS:
+        meta['msgs'] = msgs
+    elif kind == VOTES:
+        for v, (a, b) in zip(meta, msgs):
+            v['a'], v['b'] = a, b
+    return meta
+
+
+def accept(compress=False):
+    if compress:
+        return '{}; compress=zlib'.format(MEDIA_TYPE)
+    return MEDIA_TYPE
+
+
+class CiphertextParser(BaseParser):
+    '''
+    Only for the views that receive ciphertexts, in parser_classes, see
+    PARSERS
+    '''
+
+    media_type = MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except ValueError as e:
+            raise ParseError('Ciphertexts parse error - {}'.format(e))
+
+
+# parser_classes of the views that receive ciphertexts
+PARSERS = tuple(api_settings.DEFAULT_PARSER_CLASSES) + (CiphertextParser,)
+
+
+class CiphertextRenderer(BaseRenderer):
+    '''
+    The response is compressed if it's asked with compress=zlib in the
+    Accept header
+    '''
+
+    media_type = MEDIA_TYPE
+    format = 'ciphertexts'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        _, params = parse_header((accepted_media_type or '').encode('iso-8859-1'))
+        return dumps(data, compress=params.get('compress') == b'zlib')
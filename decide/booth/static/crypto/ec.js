@@ -0,0 +1,94 @@
+// ElGamal over the curve P-256, for the voting keys of mode 'p256', as
+// mixnet/ec.py: the points are integers, their compressed SEC1 encoding,
+// and the plaintext m is the point of x = m * 2^8 + i, the first i that
+// gives a point.
+
+ECElGamal = {};
+ECElGamal.P = new BigInt("ffffffff00000001000000000000000000000000ffffffffffffffffffffffff", 16);
+ECElGamal.B = new BigInt("5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b", 16);
+ECElGamal.N = new BigInt("ffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551", 16);
+ECElGamal.MASK = BigInt.ONE.shiftLeft(256).subtract(BigInt.ONE);
+ECElGamal.SHIFT = 8;
+
+ECElGamal.encode = function(pt) {
+  var prefix = BigInt.fromInt(pt.y.testBit(0) ? 3 : 2);
+  return prefix.shiftLeft(256).or(pt.x);
+};
+
+ECElGamal.decode = function(n) {
+  var p = ECElGamal.P;
+  var prefix = n.shiftRight(256).intValue();
+  var x = n.and(ECElGamal.MASK);
+  if ((prefix != 2 && prefix != 3) || x.compareTo(p) >= 0)
+    return null;
+  var rhs = x.multiply(x).multiply(x).subtract(x.multiply(BigInt.fromInt(3)))
+             .add(ECElGamal.B).mod(p);
+  var y = rhs.modPow(p.add(BigInt.ONE).shiftRight(2), p);
+  if (!y.multiply(y).mod(p).equals(rhs))
+    return null;
+  if (y.testBit(0) != (prefix == 3))
+    y = p.subtract(y);
+  return {x: x, y: y};
+};
+
+ECElGamal.double = function(pt) {
+  var p = ECElGamal.P;
+  if (!pt || pt.y.signum() == 0)
+    return null;
+  var three = BigInt.fromInt(3);
+  var l = pt.x.multiply(pt.x).subtract(BigInt.ONE).multiply(three)
+            .multiply(pt.y.shiftLeft(1).modInverse(p)).mod(p);
+  var x = l.multiply(l).subtract(pt.x.shiftLeft(1)).mod(p);
+  var y = l.multiply(pt.x.subtract(x)).subtract(pt.y).mod(p);
+  return {x: x, y: y};
+};
+
+ECElGamal.add = function(p1, p2) {
+  var p = ECElGamal.P;
+  if (!p1) return p2;
+  if (!p2) return p1;
+  if (p1.x.equals(p2.x)) {
+    if (p1.y.equals(p2.y))
+      return ECElGamal.double(p1);
+    return null;
+  }
+  var l = p2.y.subtract(p1.y)
+            .multiply(p2.x.subtract(p1.x).mod(p).modInverse(p)).mod(p);
+  var x = l.multiply(l).subtract(p1.x).subtract(p2.x).mod(p);
+  var y = l.multiply(p1.x.subtract(x)).subtract(p1.y).mod(p);
+  return {x: x, y: y};
+};
+
+ECElGamal.mul = function(pt, k) {
+  var r = null;
+  for (var i = k.bitLength() - 1; i >= 0; i--) {
+    r = ECElGamal.double(r);
+    if (k.testBit(i))
+      r = ECElGamal.add(r, pt);
+  }
+  return r;
+};
+
+ECElGamal.messagePoint = function(m) {
+  var x = m.shiftLeft(ECElGamal.SHIFT);
+  var prefix = BigInt.fromInt(2).shiftLeft(256);
+  for (var i = 0; i < (1 << ECElGamal.SHIFT); i++) {
+    var pt = ECElGamal.decode(prefix.or(x.add(BigInt.fromInt(i))));
+    if (pt)
+      return pt;
+  }
+  throw "Plaintext without a point";
+};
+
+// pk.g and pk.y are encoded points
+ECElGamal.encrypt = function(pk, m, r) {
+  if (!r) {
+    r = ElGamal.getRandomInteger(ECElGamal.N.subtract(BigInt.ONE)).add(BigInt.ONE);
+  }
+
+  var alpha = ECElGamal.mul(ECElGamal.decode(pk.g), r);
+  var beta = ECElGamal.add(ECElGamal.mul(ECElGamal.decode(pk.y), r),
+                           ECElGamal.messagePoint(m));
+
+  return { alpha: ECElGamal.encode(alpha), beta: ECElGamal.encode(beta) };
+};
@@ -26,3 +26,46 @@ ElGamal.encrypt = function(pk, m, r) {
 
   return { alpha: alpha, beta: beta };
 };
+
+// Disjunctive Chaum-Pedersen proof that (alpha, beta) encrypts g^v for
+// some v < n, with the random exponent r, as _prove_range in
+// mixnet/proofs.py. The challenge is the sha256 of the decimal numbers
+// joined with commas.
+ElGamal.rangeChallenge = function(pk, q, alpha, beta, commitments) {
+  var values = [pk.p, pk.g, pk.y, alpha, beta].concat(commitments);
+  var text = values.map(i => i.toString()).join(',');
+  var hex = sjcl.codec.hex.fromBits(sjcl.hash.sha256.hash(text));
+  return new BigInt(hex, 16).mod(q);
+};
+
+ElGamal.rangeCommitment = function(pk, q, alpha, beta, j, c, s) {
+  // g^s / alpha^c and y^s / (beta / g^j)^c, the inverses as powers of q - c
+  var bj = beta.multiply(pk.g.modPow(q.subtract(BigInt.fromInt(j)), pk.p)).mod(pk.p);
+  var e = q.subtract(c).mod(q);
+  return [pk.g.modPow(s, pk.p).multiply(alpha.modPow(e, pk.p)).mod(pk.p),
+          pk.y.modPow(s, pk.p).multiply(bj.modPow(e, pk.p)).mod(pk.p)];
+};
+
+ElGamal.proveRange = function(pk, alpha, beta, r, v, n) {
+  var q = pk.p.subtract(BigInt.ONE).shiftRight(1);
+  var cs = [], ss = [], commitments = [];
+  var w = ElGamal.getRandomInteger(q);
+  for (var j = 0; j < n; j++) {
+    if (j == v) {
+      cs.push(BigInt.ZERO);
+      ss.push(BigInt.ZERO);
+      commitments.push(pk.g.modPow(w, pk.p), pk.y.modPow(w, pk.p));
+    } else {
+      cs.push(ElGamal.getRandomInteger(q));
+      ss.push(ElGamal.getRandomInteger(q));
+      commitments = commitments.concat(
+        ElGamal.rangeCommitment(pk, q, alpha, beta, j, cs[j], ss[j]));
+    }
+  }
+
+  var c = ElGamal.rangeChallenge(pk, q, alpha, beta, commitments);
+  cs.forEach(cj => { c = c.subtract(cj); });
+  cs[v] = c.mod(q);
+  ss[v] = w.add(cs[v].multiply(r)).mod(q);
+  return cs.concat(ss).map(i => i.toString());
+};
@@ -0,0 +1,73 @@
+'''
+In-memory index of the census of each voting, the sorted ids of its
+voters, so checking if a voter is in the census of a voting is a binary
+search.
+
+The census of a voting is loaded the first time it's checked and kept
+with its version, the last id and the number of rows of the voting in
+Census. Every check compares it with the database, one aggregate on the
+(voting_id, voter_id) index, so the voters added or removed by any
+process are seen at once.
+'''
+
+from array import array
+from bisect import bisect_left
+
+from django.db.models import Count, Max
+
+from .models import Census
+
+
+_census = {}
+
+
+def version(voting_id):
+    v = Census.objects.filter(voting_id=voting_id).aggregate(last=Max('id'), count=Count('id'))
+    return v['last'], v['count']
+
+
+def voters(voting_id):
+    '''
+    Sorted array of the ids of the voters in the census of voting_id
+    '''
+
+    current = version(voting_id)
+    cached = _census.get(voting_id)
+    if cached and cached[0] == current:
+        return cached[1]
+
+    # if it changes meanwhile, the next check loads it again
+    ids = array('Q', Census.objects.filter(voting_id=voting_id)
+                                   .order_by('voter_id')
+                                   .values_list('voter_id', flat=True))
+    _census[voting_id] = (current, ids)
+    return ids
+
+
+def contains(voting_id, voter_id):
+    '''
+    If voter_id is in the census of voting_id, False for ids that aren't
+    numbers
+    '''
+
+    try:
+        voting_id, voter_id = int(voting_id), int(voter_id)
+    except (TypeError, ValueError):
+        return False
+    if voter_id < 0:
+        return False
+
+    ids = voters(voting_id)
+    i = bisect_left(ids, voter_id)
+    return i < len(ids) and ids[i] == voter_id
+
+
+def invalidate(voting_id=None):
+    '''
+    Drops the census of voting_id, or all of them
+    '''
+
+    if voting_id is None:
+        _census.clear()
+    else:
+        _census.pop(voting_id, None)
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.test import TestCase
 from rest_framework.test import APIClient
 
+from . import index
 from .models import Census
 from base import mods
 from base.tests import BaseTestCase
@@ -12,6 +13,7 @@ class CensusTestCase(BaseTestCase):
 
     def setUp(self):
         super().setUp()
+        index.invalidate()
         self.census = Census(voting_id=1, voter_id=1)
         self.census.save()
 
@@ -73,3 +75,27 @@ class CensusTestCase(BaseTestCase):
         response = self.client.delete('/census/{}/'.format(1), data, format='json')
         self.assertEqual(response.status_code, 204)
         self.assertEqual(0, Census.objects.count())
+
+    def test_index(self):
+        self.assertTrue(index.contains(1, 1))
+        self.assertFalse(index.contains(1, 2))
+        self.assertFalse(index.contains(1, 'x'))
+        self.assertFalse(index.contains(2, 1))
+
+        self.login()
+        data = {'voting_id': 1, 'voters': [5, 3, 4]}
+        response = self.client.post('/census/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(index.voters(1)), [1, 3, 4, 5])
+
+        response = self.client.delete('/census/1/', {'voters': [1, 4]}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(index.voters(1)), [3, 5])
+        self.assertFalse(index.contains(1, 1))
+        self.assertTrue(index.contains('1', '5'))
+
+        # as other processes, without signals
+        Census.objects.bulk_create([Census(voting_id=1, voter_id=7)])
+        self.assertTrue(index.contains(1, 7))
+        Census.objects.filter(voting_id=1, voter_id=3)._raw_delete(Census.objects.db)
+        self.assertFalse(index.contains(1, 3))
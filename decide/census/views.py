@@ -1,5 +1,4 @@
 from django.db.utils import IntegrityError
-from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework.status import (
@@ -11,6 +10,7 @@ from rest_framework.status import (
 )
 
 from base.perms import UserIsStaff
+from . import index
 from .models import Census
 
 
@@ -44,8 +44,6 @@ class CensusDetail(generics.RetrieveDestroyAPIView):
 
     def retrieve(self, request, voting_id, *args, **kwargs):
         voter = request.GET.get('voter_id')
-        try:
-            Census.objects.get(voting_id=voting_id, voter_id=voter)
-        except ObjectDoesNotExist:
+        if not index.contains(voting_id, voter):
             return Response('Invalid voter', status=ST_401)
         return Response('Valid voter')
@@ -45,6 +45,22 @@ APIS = {
     'voting': BASEURL,
 }
 
+# the queries of base.mods to the modules of APIS in this deployment, the
+# ones at BASEURL, are handled in-process instead of over HTTP
+LOCAL_QUERIES = False
+
+# the other ones use a pool of keep-alive connections per base url, with
+# (connect, read) timeouts in seconds, and the GET queries are retried
+QUERIES_POOL_SIZE = 10
+QUERIES_TIMEOUT = (5, 300)
+QUERIES_RETRIES = 2
+# the mixnet chain calls wait for all the next auths, so no read timeout
+MIXNET_QUERIES_TIMEOUT = (5, None)
+
+# seconds the store uses the dates and key of a voting without checking
+# its version, see store.windows
+STORE_WINDOW_TTL = 5
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -68,7 +84,17 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ),
-    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.QueryParameterVersioning'
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.QueryParameterVersioning',
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'base.wire.CiphertextRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 AUTHENTICATION_BACKENDS = [
@@ -187,10 +213,90 @@ STATIC_URL = '/static/'
 # number of bits for the key, all auths should use the same number of bits
 KEYBITS = 161
 
+# mode of the new voting keys, 'qr' for short exponents and the plaintexts
+# encoded in the quadratic residues, or 'full'. The first auth chooses it.
+# The booths and auths must support 'qr' before it's enabled
+KEYMODE = 'full'
+
+# number of processes used by the mixnet to shuffle and decrypt, with 1 the
+# work is done in the request process
+MIXNET_PROCESSES = 1
+
+# folder for the pools of precomputed reencryption factors, see the
+# fillpool command
+MIXNET_POOL_DIR = os.path.join(BASE_DIR, 'pool')
+
+# chunked tally: number of votes in each chunk sent to the mixnet, 0 to
+# send all the votes at once, and requests sent at the same time
+MIXNET_CHUNK_SIZE = 0
+MIXNET_CHUNK_WINDOW = 4
+
+# decrypt asking all the auths at the same time for their decryption
+# factors, instead of a chain through all of them
+MIXNET_PARALLEL_DECRYPT = False
+# create the key asking all the auths for their key share at the same
+# time, instead of in a chain through all of them
+MIXNET_PARALLEL_KEYS = False
+
+# folder where the mixnet stores the chunks of a chunked shuffle
+MIXNET_SPOOL_DIR = os.path.join(BASE_DIR, 'spool')
+
+# folder where each auth keeps its output until the next auths are done,
+# to resume a failed tally, None to not keep it
+MIXNET_CHECKPOINT_DIR = os.path.join(BASE_DIR, 'checkpoints')
+
+# each auth proves its shuffle, and saves the proof to verify the cascade
+# with the verifyshuffles command. Chunked shuffles aren't proved, and only
+# QR keys can be proved, mixnets with other keys are refused
+MIXNET_SHUFFLE_PROOFS = False
+
+# each auth proves its decryptions, or decryption factors, with a proof for
+# each batch, to verify them with the verifydecryptions command. The
+# decrypt step doesn't shuffle again with proofs
+MIXNET_DECRYPT_PROOFS = False
+
+# tally jobs run in a background thread, and the tally request returns
+# right away, instead of running in the request until the tally is done
+TALLY_ASYNC = True
+# a tally job without progress for TALLY_STALE seconds is taken as dead, its
+# worker restarted, and a new one can be queued. Background jobs send a
+# heartbeat every TALLY_HEARTBEAT seconds while a step runs
+TALLY_STALE = 600
+TALLY_HEARTBEAT = 60
+
+# lists of ciphertexts between modules in the binary format of base.wire
+# instead of json, and compressed with zlib. The endpoints answer in the
+# format the client accepts, so browsers and old modules keep getting json,
+# but the binary bodies are only understood by modules with base.wire. So
+# json is the default, and it's enabled once all the modules and auths of
+# the deployment support it
+WIRE_BINARY = False
+WIRE_COMPRESS = False
+# bytes of a binary message once decompressed, larger ones are rejected
+WIRE_MAX_SIZE = 2 ** 30
+
 # Versioning
 ALLOWED_VERSIONS = ['v1', 'v2']
 DEFAULT_VERSION = 'v1'
 
+# the mixnet reports its arithmetic backend at startup, and the pools it
+# can't use in a tally
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'mixnet': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 try:
     from local_settings import *
 except ImportError:
@@ -206,4 +312,5 @@ if os.path.exists("config.jsonnet"):
 
 
 INSTALLED_APPS = INSTALLED_APPS + MODULES
-django_heroku.settings(locals())
+# LOGGING is ours, not the heroku one
+django_heroku.settings(locals(), logging=False)
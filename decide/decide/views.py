@@ -10,7 +10,8 @@ def home(request):
 
 
 def listaVotaciones(request):
-    votaciones=Voting.objects.all().filter(public = True)
+    # the template shows the question of each voting
+    votaciones=Voting.objects.all().filter(public = True).select_related('question')
     cuestiones=Question.objects.all()
     censo=Census.objects.all()
     autoridades=Auth.objects.all()
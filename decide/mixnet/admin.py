@@ -1,6 +1,9 @@
 from django.contrib import admin
 
-from .models import Mixnet
+from .models import Mixnet, Group, ShuffleProof, DecryptProof
 
 
 admin.site.register(Mixnet)
+admin.site.register(Group)
+admin.site.register(ShuffleProof)
+admin.site.register(DecryptProof)
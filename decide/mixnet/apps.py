@@ -1,5 +1,14 @@
+import logging
+
 from django.apps import AppConfig
 
 
+logger = logging.getLogger(__name__)
+
+
 class MixnetConfig(AppConfig):
     name = 'mixnet'
+
+    def ready(self):
+        from . import backend
+        logger.info("Mixnet arithmetic backend: %s", backend.NAME)
@@ -0,0 +1,74 @@
+'''
+Big integer arithmetic used by the mixnet.
+
+With gmpy2 installed the GMP implementation is used, that is much faster
+with big keys. If it's not installed python builtins are used instead.
+Both give the same results, but numbers returned by gmpy2 are mpz, so
+they should be converted with int before leaving the mixnet.
+
+>>> powmod(156, 130, 167) == pow(156, 130, 167)
+True
+>>> int((invert(89, 167) * 89) % 167)
+1
+>>> int(gcd(12, 18))
+6
+>>> [jacobi(a, 167) for a in (89, 53, 0)]
+[1, -1, 0]
+'''
+
+from Crypto.Util.number import GCD, inverse
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+def _jacobi(a, n):
+    '''
+    Jacobi symbol (a/n) for an odd n > 0, the Legendre symbol if n is prime
+    '''
+
+    a %= n
+    result = 1
+    while a:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def use(name):
+    '''
+    Selects the backend, 'gmpy2' or 'python'
+    '''
+
+    global NAME, mpz, powmod, invert, gcd, jacobi
+
+    if name == 'gmpy2':
+        if not gmpy2:
+            raise ValueError('gmpy2 is not installed')
+        mpz = gmpy2.mpz
+        powmod = gmpy2.powmod
+        invert = gmpy2.invert
+        gcd = gmpy2.gcd
+        jacobi = gmpy2.jacobi
+    elif name == 'python':
+        mpz = int
+        powmod = pow
+        invert = inverse
+        gcd = GCD
+        jacobi = _jacobi
+    else:
+        raise ValueError('Unknown backend {}'.format(name))
+
+    NAME = name
+
+
+DEFAULT = 'gmpy2' if gmpy2 else 'python'
+use(DEFAULT)
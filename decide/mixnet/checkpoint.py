@@ -0,0 +1,54 @@
+'''
+Output of a shuffle or a decrypt of this auth, saved until the next auths
+have done their part.
+
+If a later auth fails, the tally is retried with the same input, and the
+saved output is returned again instead of shuffling or decrypting all
+the messages again. It's the same output the next auth already received,
+so nothing new is revealed.
+
+A checkpoint without a path doesn't save anything, for the last auth and
+when MIXNET_CHECKPOINT_DIR is None.
+'''
+
+import hashlib
+import os
+
+from base import wire
+
+
+class Checkpoint:
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def digest(cls, msgs, pk):
+        data = {"msgs": msgs, "pk": [int(i) for i in pk]}
+        return hashlib.sha256(wire.dumps(data)).hexdigest()
+
+    def load(self):
+        if not self.path:
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                return wire.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, msgs):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = '{}.tmp'.format(self.path)
+        with open(tmp, 'wb') as f:
+            f.write(wire.dumps(msgs, compress=True))
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if not self.path:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,432 @@
+'''
+ElGamal over the elliptic curve P-256, for the keys of mode EC, with the
+same interface as MixCrypt.
+
+The points are sent and stored as integers, their compressed SEC1
+encoding, so a ciphertext is two integers of 33 bytes, instead of twice
+the size of p for finite field keys, and the wire format, the store and
+the spools work as they are.
+
+The plaintexts are mapped to points as the x coordinate m * 2^SHIFT + i,
+with the first i that gives a point, so any m < MESSAGE_BOUND can be
+encrypted, as the packed ballots, and it's decoded without a discrete
+log. The mixnet keeps the decrypted points, see plaintext.
+
+The arithmetic is in jacobian coordinates with the backend integers, and
+the exponentiations of the generator and the public key use tables of
+precomputed points, as the FixedBase tables of mixcrypt.
+
+>>> from mixnet.mixcrypt import gen_multiple_key
+>>> k1, k2 = ECMixCrypt(), ECMixCrypt()
+>>> k3 = gen_multiple_key(k1, k2)
+>>> clears = [2, 3, 5, 7, 2 ** 200]
+>>> cipher = [k3.encrypt(m) for m in clears]
+>>> max(int(i).bit_length() for c in cipher for i in c)
+258
+>>> pk = k3.parse_pubkey()
+>>> shuffled = k2.shuffle(k1.shuffle(cipher, pk), pk)
+>>> d = [plaintext(m) for m in k2.multiple_decrypt(k1.multiple_decrypt(shuffled, False))]
+>>> sorted(d) == sorted(clears)
+True
+>>> alphas = [a for a, b in cipher]
+>>> factors = [decrypt_factors(alphas, k.k.x) for k in (k1, k2)]
+>>> [plaintext(m) for m in combine_factors(cipher, factors)] == clears
+True
+>>> check_ciphertexts([cipher[0], (5, cipher[0][1]), (cipher[0][0], 0)])
+[(1, 'a not in the key group'), (2, 'b not in the key group')]
+'''
+
+from functools import lru_cache
+
+from . import backend
+from .mixcrypt import EC, WINDOW, MixCrypt, _random, batch_invert
+
+
+# P-256, FIPS 186-4 D.1.2.3, y^2 = x^3 - 3x + B mod P, of prime order N
+P = 2 ** 256 - 2 ** 224 + 2 ** 192 + 2 ** 96 - 1
+B = 0x5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b
+N = 0xffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551
+GX = 0x6b17d1f2e12c4247f8bce6e563a440f277037d812deb33a0f4a13945d898c296
+GY = 0x4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5
+
+# bits of the x coordinate of a plaintext point left for the counter i
+SHIFT = 8
+
+# plaintexts must be lower than this
+MESSAGE_BOUND = P >> SHIFT
+
+MASK = (1 << 256) - 1
+
+_p = backend.mpz(P)
+
+
+def encode(point):
+    '''
+    The compressed SEC1 encoding of an affine point as an integer
+
+    >>> hex(G)[:4], decode(G) == (GX, GY)
+    ('0x36', True)
+    '''
+
+    x, y = point
+    return ((2 | int(y) & 1) << 256) | int(x)
+
+
+def decode(n):
+    '''
+    The affine point of an encoded one, ValueError if it isn't in the curve
+    '''
+
+    n = int(n)
+    prefix, x = n >> 256, n & MASK
+    if prefix not in (2, 3) or x >= P:
+        raise ValueError('Not a point')
+    x = backend.mpz(x)
+    rhs = (x * x * x - 3 * x + B) % _p
+    # P = 3 mod 4, so this is the square root if there's one
+    y = backend.powmod(rhs, (P + 1) // 4, _p)
+    if (y * y) % _p != rhs:
+        raise ValueError('Not a point')
+    if int(y) & 1 != prefix & 1:
+        y = _p - y
+    return x, y
+
+
+G = encode((GX, GY))
+
+
+def double(pt):
+    X, Y, Z = pt
+    if not Z:
+        return pt
+    delta = (Z * Z) % _p
+    gamma = (Y * Y) % _p
+    beta = (X * gamma) % _p
+    alpha = (3 * (X - delta) * (X + delta)) % _p
+    X3 = (alpha * alpha - 8 * beta) % _p
+    Z3 = ((Y + Z) * (Y + Z) - gamma - delta) % _p
+    Y3 = (alpha * (4 * beta - X3) - 8 * gamma * gamma) % _p
+    return X3, Y3, Z3
+
+
+def add_affine(pt, q):
+    '''
+    Jacobian point pt plus the affine point q
+    '''
+
+    X1, Y1, Z1 = pt
+    x2, y2 = q
+    if not Z1:
+        return x2, y2, backend.mpz(1)
+
+    Z1Z1 = (Z1 * Z1) % _p
+    H = (x2 * Z1Z1 - X1) % _p
+    r = 2 * (y2 * Z1 * Z1Z1 - Y1) % _p
+    if not H:
+        return double(pt) if not r else (1, 1, 0)
+
+    HH = (H * H) % _p
+    I = 4 * HH
+    J = (H * I) % _p
+    V = (X1 * I) % _p
+    X3 = (r * r - J - 2 * V) % _p
+    Y3 = (r * (V - X3) - 2 * Y1 * J) % _p
+    Z3 = ((Z1 + H) * (Z1 + H) - Z1Z1 - HH) % _p
+    return X3, Y3, Z3
+
+
+def to_affine(points):
+    '''
+    Affine points of a list of jacobian ones, with a single inversion
+    '''
+
+    inverses = batch_invert([Z for X, Y, Z in points], _p)
+    affine = []
+    for (X, Y, Z), i in zip(points, inverses):
+        i2 = (i * i) % _p
+        affine.append(((X * i2) % _p, (Y * i2 * i) % _p))
+    return affine
+
+
+def neg(point):
+    x, y = point
+    return x, (_p - y) % _p
+
+
+class FixedBase:
+    '''
+    Precomputed affine points for multiplications of a fixed point, the
+    row i holds j * 2^(w*i) * point for every j < 2^w, as the FixedBase of
+    mixcrypt, so a multiplication is an addition by window.
+
+    >>> fb = FixedBase(G)
+    >>> encode(to_affine([fb.mul(N - 1)])[0]) == encode(neg(decode(G)))
+    True
+    '''
+
+    def __init__(self, point, bits=256, w=WINDOW):
+        self.w = w
+        self.mask = (1 << w) - 1
+
+        rows = []
+        base = decode(point) + (backend.mpz(1),)
+        for i in range(0, bits, w):
+            row = [base]
+            for j in range(self.mask - 1):
+                row.append(add_affine(row[-1], base[:2]))
+            rows.append(row)
+            base = to_affine([add_affine(row[-1], base[:2])])[0] + (backend.mpz(1),)
+
+        flat = to_affine([pt for row in rows for pt in row])
+        self.table = [[None] + flat[i:i + self.mask]
+                      for i in range(0, len(flat), self.mask)]
+
+    def mul(self, e):
+        return multi_mul((self,), e)[0]
+
+
+def multi_mul(tables, e):
+    '''
+    e times the point of every FixedBase in tables, as jacobian points, in
+    a single pass over the windows of e, e < N
+    '''
+
+    mask, w = tables[0].mask, tables[0].w
+    rows = list(zip(*(t.table for t in tables)))
+    rs = [(1, 1, 0)] * len(tables)
+    for row in rows:
+        if not e:
+            break
+        d = e & mask
+        if d:
+            rs = [add_affine(r, t[d]) for r, t in zip(rs, row)]
+        e >>= w
+    return rs
+
+
+@lru_cache(maxsize=16)
+def fixed_base(point):
+    return FixedBase(point)
+
+
+def key_tables(g, y):
+    '''
+    FixedBase tables for g and y, cached as fixed_base_tables
+    '''
+
+    return fixed_base(int(g)), fixed_base(int(y))
+
+
+def mul(point, e):
+    '''
+    e times an affine point, as a jacobian point, with windows of 4 bits
+
+    >>> encode(to_affine([mul(decode(G), 3)])[0]) == \\
+    ...     encode(to_affine([add_affine(double(decode(G) + (1,)), decode(G))])[0])
+    True
+    '''
+
+    jac = [point + (backend.mpz(1),)]
+    for i in range(14):
+        jac.append(add_affine(jac[-1], point))
+    table = [None] + to_affine(jac)
+
+    r = (1, 1, 0)
+    for shift in range((int(e).bit_length() - 1) // 4 * 4, -1, -4):
+        for i in range(4):
+            r = double(r)
+        d = (e >> shift) & 15
+        if d:
+            r = add_affine(r, table[d])
+    return r
+
+
+def rand_scalar():
+    return _random.getrandbits(256 + 64) % (N - 1) + 1
+
+
+def message_point(m):
+    '''
+    The point of the plaintext m, 0 <= m < MESSAGE_BOUND
+
+    >>> plaintext(encode(message_point(42)))
+    42
+    '''
+
+    m = int(m)
+    if not 0 <= m < MESSAGE_BOUND:
+        raise ValueError('Plaintext out of range')
+    for i in range(1 << SHIFT):
+        try:
+            return decode((2 << 256) | (m << SHIFT) + i)
+        except ValueError:
+            pass
+    raise ValueError('Plaintext without a point')
+
+
+def plaintext(n):
+    '''
+    The plaintext of an encoded plaintext point
+    '''
+
+    return (int(n) & MASK) >> SHIFT
+
+
+def decrypt_factors(alphas, x):
+    '''
+    Partial decryption factors x * a of one auth, as mixcrypt.decrypt_factors
+    '''
+
+    return [encode(pt) for pt in to_affine([mul(decode(a), int(x)) for a in alphas])]
+
+
+def combine_factors(msgs, factors):
+    '''
+    Decrypts the (a, b) ciphertexts with the factors of each auth: b minus
+    the sum of the factors, the encoded plaintext points
+    '''
+
+    sums = []
+    for (a, b), fs in zip(msgs, zip(*factors)):
+        r = decode(b) + (backend.mpz(1),)
+        for f in fs:
+            r = add_affine(r, neg(decode(f)))
+        sums.append(r)
+    return [encode(pt) for pt in to_affine(sums)]
+
+
+def check_ciphertexts(msgs):
+    '''
+    Checks that a and b of each ciphertext are points of the curve, and
+    returns a list of (index, reason) for the invalid ones, as
+    mixcrypt.check_ciphertexts. The order of the curve is prime, so any
+    point is in the group.
+    '''
+
+    errors = []
+    for i, (a, b) in enumerate(msgs):
+        for name, v in (('a', a), ('b', b)):
+            try:
+                decode(v)
+            except ValueError:
+                errors.append((i, '{} not in the key group'.format(name)))
+                break
+    return errors
+
+
+class ECKey:
+    '''
+    EC key, with the fields of the ElGamal keys, p is the prime of the
+    curve and g and y are encoded points
+    '''
+
+    def __init__(self, p, g, y, x=None):
+        self.p, self.g, self.y = int(p), int(g), int(y)
+        self.x = int(x) if x is not None else None
+
+    def has_private(self):
+        return self.x is not None
+
+
+class ECMixCrypt(MixCrypt):
+    '''
+    MixCrypt for EC keys, the bits are ignored. The decrypted messages are
+    plaintext points, they're decoded with plaintext
+    '''
+
+    def __init__(self, k=None, bits=256, mode=EC):
+        super().__init__(k, bits, EC)
+
+    def genk(self):
+        return self.getk(P, G)
+
+    def getk(self, p, g):
+        x = rand_scalar()
+        y = encode(to_affine([fixed_base(int(g)).mul(x)])[0])
+        self.k = ECKey(p, g, y, x)
+        return self.k
+
+    def setk(self, p, g, y, x):
+        self.k = ECKey(p, g, y, x)
+        return self.k
+
+    def join_keys(self, ys):
+        r = (1, 1, 0)
+        for y in ys:
+            r = add_affine(r, decode(y))
+        return ECKey(self.k.p, self.k.g, encode(to_affine([r])[0]))
+
+    def encrypt(self, m, k=None):
+        k = k or self.k
+        tg, ty = key_tables(k.g, k.y)
+        a, b = multi_mul((tg, ty), rand_scalar())
+        a, b = to_affine([a, add_affine(b, message_point(m))])
+        return encode(a), encode(b)
+
+    def decrypt(self, c):
+        return plaintext(self.multiple_decrypt([c])[0])
+
+    def multiple_decrypt(self, msgs, last=True):
+        clears = combine_factors(msgs, [decrypt_factors([a for a, b in msgs], self.k.x)])
+        if last:
+            return clears
+        return [(a, clear) for (a, b), clear in zip(msgs, clears)]
+
+    def reencrypt(self, cipher, pubkey=None):
+        return self.reencrypt_batch([cipher], pubkey)[0]
+
+    def reencrypt_batch(self, msgs, pubkey=None, pairs=()):
+        '''
+        >>> k = ECMixCrypt()
+        >>> cipher = [k.encrypt(m) for m in [2, 3, 4]]
+        >>> cipher2 = k.reencrypt_batch(cipher, k.parse_pubkey())
+        >>> [k.decrypt(c) for c in cipher2]
+        [2, 3, 4]
+        >>> any(c1 == c2 for c1, c2 in zip(cipher, cipher2))
+        False
+        >>> k.reencrypt_batch(cipher, (P, G, 5))
+        Traceback (most recent call last):
+        ...
+        ValueError: Invalid EC key components
+        '''
+
+        p, g, y = self.parse_pubkey(pubkey)
+        if len(pairs) < len(msgs):
+            tables = key_tables(g, y)
+
+        points = []
+        for i, (a, b) in enumerate(msgs):
+            if i < len(pairs):
+                a1, b1 = (decode(v) + (backend.mpz(1),) for v in pairs[i])
+            else:
+                a1, b1 = multi_mul(tables, rand_scalar())
+            points += [add_affine(a1, decode(a)), add_affine(b1, decode(b))]
+
+        it = iter(encode(pt) for pt in to_affine(points))
+        return list(zip(it, it))
+
+    def parse_pubkey(self, pubkey=None):
+        if not pubkey:
+            return self.k.p, self.k.g, self.k.y
+
+        p, g, y = map(int, pubkey)
+        try:
+            decode(y)
+        except ValueError:
+            raise ValueError("Invalid EC key components")
+        if p != P or g != G:
+            raise ValueError("Invalid EC key components")
+        return p, g, y
+
+
+def pairs(pk, n):
+    '''
+    n (r * g, r * y) reencryption factors for the public key, for the
+    randomness pool
+    '''
+
+    p, g, y = map(int, pk)
+    tables = key_tables(g, y)
+    points = [pt for i in range(n) for pt in multi_mul(tables, rand_scalar())]
+    it = iter(encode(pt) for pt in to_affine(points))
+    return list(zip(it, it))
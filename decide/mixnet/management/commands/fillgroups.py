@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mixnet.models import Group, B
+
+
+class Command(BaseCommand):
+    help = 'Generate or load the group parameters used for new mixnet keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bits', type=int, default=B,
+                            help='number of bits of the groups to generate')
+        parser.add_argument('--stock', type=int, default=10,
+                            help='number of groups to keep for these bits')
+        parser.add_argument('--file',
+                            help='json file with a list of {"p": int, "g": int} '
+                                 'to load instead of generating them')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file']) as f:
+                groups = json.load(f)
+            for data in groups:
+                p, g = int(data['p']), int(data['g'])
+                group = Group(p=p, g=g, bits=p.bit_length())
+                try:
+                    group.validate()
+                except ValueError as e:
+                    raise CommandError('Invalid group: {}'.format(e))
+                if not Group.objects.filter(bits=group.bits, p=p, g=g).exists():
+                    group.save()
+        else:
+            bits = options['bits']
+            missing = options['stock'] - Group.objects.filter(bits=bits).count()
+            for i in range(missing):
+                Group.generate(bits)
+
+        for bits in sorted(set(Group.objects.values_list('bits', flat=True))):
+            self.stdout.write('{} bits: {} groups'.format(
+                bits, Group.objects.filter(bits=bits).count()))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mixnet.models import Mixnet
+from mixnet.pool import PoolKeyError
+
+
+class Command(BaseCommand):
+    help = 'Precompute reencryption factors for the tally of a voting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+        parser.add_argument('--stock', type=int, default=1000,
+                            help='number of pairs to keep in the pool')
+
+    def handle(self, *args, **options):
+        voting_id = options['voting_id']
+        for mn in Mixnet.objects.filter(voting_id=voting_id):
+            # every auth reencrypts with the voting key, not with its share
+            key = mn.voting_key()
+            if not key:
+                raise CommandError('Voting {} has no public key'.format(voting_id))
+            pool = mn.pool()
+
+            try:
+                remaining = pool.stats(key)['remaining']
+            except PoolKeyError:
+                # fill discards the pool for the old key
+                remaining = 0
+
+            missing = options['stock'] - remaining
+            if missing > 0:
+                pool.fill(key, missing, mn.key.mode)
+
+            stats = pool.stats()
+            self.stdout.write('Voting {}, position {}: {} pairs, {} used, '
+                              '{} remaining, {:.2f} pairs/s'.format(
+                                  voting_id, mn.auth_position, stats['size'],
+                                  stats['used'], stats['remaining'], stats['rate']))
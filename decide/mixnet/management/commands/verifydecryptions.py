@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mixnet.models import DecryptProof
+
+
+class Command(BaseCommand):
+    help = 'Verify the decryption proofs of all the auths of a voting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+
+    def handle(self, *args, **options):
+        voting_id = options['voting_id']
+        saved = (DecryptProof.objects.filter(mixnet__voting_id=voting_id)
+                 .order_by('mixnet__auth_position', 'pk'))
+        if not saved:
+            raise CommandError('No decryption proofs for voting {}'.format(voting_id))
+
+        start = time.time()
+        for dp in saved:
+            if not dp.verify():
+                raise CommandError('Invalid decryption of position {}, proof {}'.format(
+                    dp.mixnet.auth_position, dp.pk))
+            self.stdout.write('Position {}: proof {} verified, proved in {:.2f}s'.format(
+                dp.mixnet.auth_position, dp.pk, dp.seconds))
+
+        self.stdout.write('Voting {}: {} decryptions verified in {:.2f}s'.format(
+            voting_id, len(saved), time.time() - start))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mixnet import proofs
+from mixnet.models import ShuffleProof
+
+
+class Command(BaseCommand):
+    help = 'Verify the shuffle proofs of all the auths of a voting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+
+    def handle(self, *args, **options):
+        voting_id = options['voting_id']
+        saved = (ShuffleProof.objects.filter(mixnet__voting_id=voting_id)
+                 .order_by('mixnet__auth_position'))
+        if not saved:
+            raise CommandError('No shuffle proofs for voting {}'.format(voting_id))
+
+        steps = []
+        for sp in saved:
+            msgs, shuffled, proof, pk = sp.load()
+            if not steps:
+                first, key = msgs, pk
+            steps.append((shuffled, proof))
+            self.stdout.write('Position {}: {} ciphertexts, shuffle {:.2f}s, '
+                              'proof {:.2f}s'.format(sp.mixnet.auth_position, len(msgs),
+                                                     sp.shuffle_seconds, sp.seconds))
+
+        start = time.time()
+        invalid = proofs.verify_cascade(first, steps, key)
+        seconds = time.time() - start
+        if invalid >= 0:
+            raise CommandError('Invalid shuffle of position {}'.format(
+                saved[invalid].mixnet.auth_position))
+
+        self.stdout.write('Voting {}: {} shuffles verified in {:.2f}s'.format(
+            voting_id, len(steps), seconds))
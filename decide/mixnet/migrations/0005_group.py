@@ -0,0 +1,23 @@
+# Generated by Django 2.0 on 2026-10-18 20:17
+
+import base.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0004_auto_20180605_0842'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Group',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('p', base.models.BigBigField()),
+                ('g', base.models.BigBigField()),
+                ('bits', models.PositiveIntegerField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.0 on 2026-10-18 21:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0005_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShuffleProof',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('msgs', models.BinaryField()),
+                ('shuffled', models.BinaryField()),
+                ('proof', models.BinaryField()),
+                ('seconds', models.FloatField()),
+                ('shuffle_seconds', models.FloatField()),
+                ('created', models.DateTimeField(auto_now=True)),
+                ('mixnet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='proof', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
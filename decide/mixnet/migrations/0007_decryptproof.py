@@ -0,0 +1,27 @@
+# Generated by Django 2.0 on 2026-10-18 21:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0006_shuffleproof'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DecryptProof',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('factors', models.BooleanField(default=False)),
+                ('msgs', models.BinaryField()),
+                ('decrypted', models.BinaryField()),
+                ('proof', models.BinaryField()),
+                ('seconds', models.FloatField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='decrypt_proofs', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-19 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0007_decryptproof'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mixnet',
+            name='voting_url',
+            field=models.URLField(blank=True),
+        ),
+    ]
@@ -3,7 +3,7 @@
 >>> k1 = MixCrypt(bits=B)
 >>> k2 = MixCrypt(k=k1.k, bits=B)
 >>> k3 = gen_multiple_key(k1, k2)
->>> N = 4
+>>> N = 8
 >>> clears = [random.StrongRandom().randint(1, B) for i in range(N)]
 >>> cipher = [k3.encrypt(i) for i in clears]
 >>> d = multiple_decrypt_shuffle(cipher, k1, k2)
@@ -15,17 +15,18 @@ True
 >>> B = 256
 >>> k1 = MixCrypt(bits=B)
 >>> k1.setk(167,156,89,130) #doctest: +ELLIPSIS
-<Crypto.PublicKey.ElGamal.ElGamalobj object at 0x...>
+<Crypto.PublicKey.ElGamal.ElGamal... object at 0x...>
 >>> k2 = MixCrypt(bits=B)
 >>> k2.setk(167,156,53,161) #doctest: +ELLIPSIS
-<Crypto.PublicKey.ElGamal.ElGamalobj object at 0x...>
+<Crypto.PublicKey.ElGamal.ElGamal... object at 0x...>
 >>> k3 = MixCrypt(bits=B)
->>> k3.k = ElGamal.construct((167, 156, 4717))
->>> k3.k.p, k3.k.g, k3.k.y
-(167, 156, 4717)
->>> N = 4
->>> clears = [2,3,6,4]
->>> cipher = [(161, 109), (17, 101), (148, 163), (71, 37)]
+>>> k3.k = ElGamal.construct((167, 156, (89 * 53) % 167))
+>>> int(k3.k.p), int(k3.k.g), int(k3.k.y)
+(167, 156, 41)
+>>> N = 8
+>>> clears = [2,3,6,4,5,7,8,9]
+>>> cipher = [(161, 109), (17, 101), (148, 163), (71, 37),
+...           (90, 64), (131, 125), (148, 106), (34, 69)]
 >>> d = multiple_decrypt_shuffle(cipher, k2, k1)
 >>> clears == d
 False
@@ -34,28 +35,575 @@ True
 '''
 
 
+from array import array
+from functools import lru_cache
 from pprint import pprint
 
 from Crypto.PublicKey import ElGamal
+from Crypto.Util.number import isPrime
 from Crypto.Random import random
 from Crypto import Random
-from Crypto.Util.number import GCD
+
+from . import backend
+
+
+# bits per window in the fixed-base tables, bigger windows means less
+# multiplications per exponentiation but bigger tables
+WINDOW = 5
+
+# modes of the keys. FULL keys use random exponents of the size of p and
+# any plaintext. QR keys work in the quadratic residues of the safe prime,
+# with the plaintexts encoded in them, see encode, and short exponents. EC
+# keys are in the curve P-256, see the ec module
+QR, FULL, EC = 'qr', 'full', 'p256'
+
+# bits of the random exponents of QR keys, twice the security level of
+# the 2048 and 3072 bits groups, as RFC 3526 recommends
+EXPONENT_BITS = 256
+
+
+class FixedBase:
+    '''
+    Precomputed table for exponentiations with a fixed base and modulus.
+
+    The exponent is split in windows of w bits and the row i of the table
+    holds base^(j * 2^(w*i)) mod p for every j < 2^w, so an exponentiation
+    is just a product of one table entry per window, without squarings.
+
+    >>> fb = FixedBase(156, 167)
+    >>> all(fb.pow(e) == pow(156, e, 167) for e in range(0, 500))
+    True
+    '''
+
+    def __init__(self, base, p, bits=None, w=WINDOW):
+        bits = bits or int(p).bit_length()
+        p = backend.mpz(p)
+
+        self.p = p
+        self.w = w
+        self.mask = (1 << w) - 1
+        self.table = []
+
+        b = backend.mpz(base) % p
+        for i in range(0, bits, w):
+            row = [1]
+            for j in range(self.mask):
+                row.append((row[-1] * b) % p)
+            self.table.append(row)
+            b = (row[-1] * b) % p
+        self.next = b
+
+    def pow(self, e):
+        p, w, mask = self.p, self.w, self.mask
+        r = 1
+        for row in self.table:
+            if not e:
+                break
+            d = e & mask
+            if d:
+                r = (r * row[d]) % p
+            e >>= w
+
+        if e:
+            # exponent bigger than the table, the rest is done the slow way
+            r = (r * backend.powmod(self.next, e, p)) % p
+        return r
+
+
+def multi_pow(tables, e):
+    '''
+    Computes base^e for every FixedBase in tables, all of them with the
+    same modulus and window, in a single pass over the windows of e.
+
+    >>> tables = FixedBase(156, 167), FixedBase(89, 167)
+    >>> multi_pow(tables, 130) == (pow(156, 130, 167), pow(89, 130, 167))
+    True
+    '''
+
+    first = tables[0]
+    p, w, mask = first.p, first.w, first.mask
+    rows = list(zip(*(t.table for t in tables)))
+    rs = [1] * len(tables)
+    for row in rows:
+        if not e:
+            break
+        d = e & mask
+        if d:
+            rs = [(r * t[d]) % p for r, t in zip(rs, row)]
+        e >>= w
+
+    if e:
+        rs = [(r * backend.powmod(t.next, e, p)) % p for r, t in zip(rs, tables)]
+    return tuple(rs)
+
+
+@lru_cache(maxsize=8)
+def fixed_base_tables(p, g, y, bits=None):
+    '''
+    Returns the FixedBase tables for g and y, for exponents of bits.
+
+    The tables are cached by key, so all the encryptions and
+    reencryptions with the same key in this process share them.
+    '''
+
+    return FixedBase(g, p, bits), FixedBase(y, p, bits)
+
+
+def key_tables(p, g, y, mode=FULL):
+    '''
+    fixed_base_tables for the exponents of the key mode
+    '''
+
+    return fixed_base_tables(int(p), int(g), int(y), exponent_bits(p, mode))
+
+
+def multi_exp(bases, exps, p):
+    '''
+    Product of b^e mod p for all the bases and exponents, e >= 0.
+
+    Big batches use Pippenger's bucket method: for each window of the
+    exponents, each base is multiplied into the bucket of its digit and the
+    buckets are summed up with two multiplications each, so the cost is
+    about one multiplication by base and window, instead of an
+    exponentiation by base.
+
+    >>> bases, exps = list(range(2, 102)), [e ** 7 for e in range(100)]
+    >>> multi_exp(bases, exps, 167) == multi_exp(bases[:5], exps[:5], 167) * \\
+    ...     multi_exp(bases[5:], exps[5:], 167) % 167
+    True
+    >>> r = 1
+    >>> for b, e in zip(bases, exps): r = r * pow(b, e, 167) % 167
+    >>> multi_exp(bases, exps, 167) == r
+    True
+    '''
+
+    mp = backend.mpz(p)
+    pairs = [(backend.mpz(b), int(e)) for b, e in zip(bases, exps) if e]
+    if len(pairs) < 32:
+        r = backend.mpz(1)
+        for b, e in pairs:
+            r = (r * backend.powmod(b, e, mp)) % mp
+        return int(r)
+
+    bits = max(e.bit_length() for b, e in pairs)
+    c = max(2, len(pairs).bit_length() - 3)
+    mask = (1 << c) - 1
+
+    r = backend.mpz(1)
+    for shift in range((bits - 1) // c * c, -1, -c):
+        for i in range(c):
+            r = (r * r) % mp
+        buckets = [None] * (mask + 1)
+        for b, e in pairs:
+            d = (e >> shift) & mask
+            if d:
+                buckets[d] = b if buckets[d] is None else (buckets[d] * b) % mp
+
+        # sum of d * bucket[d], with running products from the top bucket
+        acc = total = backend.mpz(1)
+        for d in range(mask, 0, -1):
+            if buckets[d] is not None:
+                acc = (acc * buckets[d]) % mp
+            total = (total * acc) % mp
+        r = (r * total) % mp
+    return int(r)
+
+
+def batch_invert(values, p):
+    '''
+    Inverses mod p of all the values with a single modular inversion
+    (Montgomery's trick): the product of all the values is inverted and
+    each inverse is taken from it with the prefix products, that is three
+    multiplications by value.
+
+    >>> batch_invert([2, 3, 89], 167) == [pow(v, 165, 167) for v in [2, 3, 89]]
+    True
+    '''
+
+    p = backend.mpz(p)
+    prefix = []
+    acc = backend.mpz(1)
+    for v in values:
+        prefix.append(acc)
+        acc = (acc * v) % p
+
+    inv = backend.invert(acc, p)
+    result = [None] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        result[i] = (inv * prefix[i]) % p
+        inv = (inv * values[i]) % p
+    return result
+
+
+def decrypt_batch(msgs, p, x):
+    '''
+    Decrypts all the (a, b) ciphertexts in msgs with the secret x, and
+    returns the b * a^-x values.
+
+    The exponent is chosen once for the whole batch: a^(p-1-x) is the
+    inverse of a^x, but if x is shorter it's cheaper to compute a^x and
+    invert all of them at once with batch_invert.
+
+    >>> k = MixCrypt(bits=256)
+    >>> k.setk(167, 156, 89, 130) #doctest: +ELLIPSIS
+    <Crypto.PublicKey.ElGamal.ElGamal... object at 0x...>
+    >>> cipher = [k.encrypt(m) for m in [2, 3, 4]]
+    >>> decrypt_batch(cipher, 167, 130)
+    [2, 3, 4]
+    >>> k.setk(167, 156, pow(156, 3, 167), 3) #doctest: +ELLIPSIS
+    <Crypto.PublicKey.ElGamal.ElGamal... object at 0x...>
+    >>> cipher = [k.encrypt(m) for m in [2, 3, 4]]
+    >>> decrypt_batch(cipher, 167, 3)
+    [2, 3, 4]
+    '''
+
+    p, x = int(p), int(x)
+    mp = backend.mpz(p)
+    xinv = p - 1 - x
+
+    if x.bit_length() < xinv.bit_length() and all(int(a) % p for a, b in msgs):
+        factors = batch_invert([backend.powmod(a, x, mp) for a, b in msgs], mp)
+    else:
+        factors = [backend.powmod(a, xinv, mp) for a, b in msgs]
+
+    return [int((backend.mpz(b) * f) % mp) for (a, b), f in zip(msgs, factors)]
+
+
+def decrypt_factors(alphas, p, x):
+    '''
+    Partial decryption factors a^x of one auth for the a of a list of
+    ciphertexts, to be combined with the ones of the other auths with
+    combine_factors, so the auths can work at the same time.
+    '''
+
+    mp, x = backend.mpz(p), int(x)
+    return [int(backend.powmod(a, x, mp)) for a in alphas]
+
+
+def combine_factors(msgs, factors, p):
+    '''
+    Decrypts the (a, b) ciphertexts in msgs with the list of factors of
+    each auth: b / (a^x1 * a^x2 * ...), with a single inversion.
+
+    >>> cipher = [(161, 109), (17, 101), (148, 163), (71, 37)]
+    >>> alphas = [a for a, b in cipher]
+    >>> f1 = decrypt_factors(alphas, 167, 130)
+    >>> f2 = decrypt_factors(alphas, 167, 161)
+    >>> combine_factors(cipher, [f1, f2], 167)
+    [2, 3, 6, 4]
+    '''
+
+    mp = backend.mpz(p)
+    prods = []
+    for fs in zip(*factors):
+        r = backend.mpz(1)
+        for f in fs:
+            r = (r * f) % mp
+        prods.append(r)
+
+    inverses = batch_invert(prods, mp)
+    return [int((backend.mpz(b) * i) % mp) for (a, b), i in zip(msgs, inverses)]
+
+
+# bits of the random exponents of the batch subgroup test, a value out of
+# the subgroup passes the test with probability 2^-BATCH_BITS at most
+BATCH_BITS = 64
+
+
+@lru_cache(maxsize=8)
+def subgroup_order(p, g):
+    '''
+    Order q of the quadratic residues if p is a safe prime, p = 2q + 1, and
+    g is one of them, as the keys generated by pycryptodome. None if it
+    isn't known, then the values only have to be in range.
+
+    >>> subgroup_order(167, 4)
+    83
+    >>> subgroup_order(167, 156) is None
+    True
+    '''
+
+    q = (int(p) - 1) // 2
+    if isPrime(q) and backend.powmod(g, q, p) == 1:
+        return q
+    return None
+
+
+def not_in_subgroup(values, p, q):
+    '''
+    Indexes of the values, all of them in 0 < v < p, that aren't in the
+    subgroup of order q of Z_p*.
+
+    For a safe prime the subgroup is the quadratic residues, so each value
+    is checked with its Legendre symbol, without exponentiations.
+
+    Otherwise the values are checked together with a small-exponent batch
+    test, prod(v_i^s_i)^q == 1 for random s_i of BATCH_BITS, that costs a
+    single full exponentiation for the whole batch. If the test fails the
+    batch is split in halves to find the bad values. The Legendre symbol is
+    checked too, so the test is sound as long as (p-1)/2q has no small
+    factors.
+
+    >>> not_in_subgroup([89, 53, 4, 1], 167, 83)
+    [1]
+    >>> p, q = 2038000002439487, 1019
+    >>> g = pow(2, (p - 1) // q, p)
+    >>> values = [pow(g, e, p) for e in range(1, 100)]
+    >>> not_in_subgroup(values, p, q)
+    []
+    >>> values[7] = (values[7] * 3) % p
+    >>> values[42] = 4
+    >>> not_in_subgroup(values, p, q)
+    [7, 42]
+    '''
+
+    p, q = int(p), int(q)
+    bad = [i for i, v in enumerate(values) if backend.jacobi(v, p) != 1]
+    if p == 2 * q + 1:
+        return bad
+
+    mp = backend.mpz(p)
+
+    def search(idx):
+        if not idx:
+            return []
+        if len(idx) == 1:
+            return [] if backend.powmod(values[idx[0]], q, mp) == 1 else idx
+
+        r = backend.mpz(1)
+        for i in idx:
+            r = (r * backend.powmod(values[i], _random.getrandbits(BATCH_BITS), mp)) % mp
+        if backend.powmod(r, q, mp) == 1:
+            return []
+        half = len(idx) // 2
+        return search(idx[:half]) + search(idx[half:])
+
+    skip = set(bad)
+    bad += search([i for i in range(len(values)) if i not in skip])
+    return sorted(bad)
+
+
+def check_ciphertexts(msgs, p, g, q=None, exponential=False):
+    '''
+    Checks the (a, b) ciphertexts in msgs for the key group (p, g) and
+    returns a list of (index, reason) for the invalid ones.
+
+    Both a and b must be in 0 < v < p, and a = g^r must be in the subgroup
+    of g, of order q. In exponential ElGamal, b = g^m * y^r, so b must be
+    in the subgroup too. If q isn't given it's found with subgroup_order.
+
+    >>> check_ciphertexts([(150, 109), (0, 101), (18, 167), (53, 37)], 167, 4)
+    [(1, 'a out of range'), (2, 'b out of range'), (3, 'a not in the key group')]
+    >>> check_ciphertexts([(150, 53)], 167, 4, exponential=True)
+    [(0, 'b not in the key group')]
+    '''
+
+    p = int(p)
+    q = q or subgroup_order(p, int(g))
+
+    errors = {}
+    members = []
+    for i, (a, b) in enumerate(msgs):
+        for name, v, grouped in (('a', a, True), ('b', b, exponential)):
+            if not 0 < v < p:
+                errors.setdefault(i, '{} out of range'.format(name))
+            elif grouped and q:
+                members.append((i, name, v))
+
+    if members:
+        for j in not_in_subgroup([v for i, name, v in members], p, q):
+            i, name, v = members[j]
+            errors.setdefault(i, '{} not in the key group'.format(name))
+    return sorted(errors.items())
+
+
+@lru_cache(maxsize=8)
+def baby_steps(p, g, m):
+    '''
+    Table {g^j: j} for every j < m, and g^-m, for dlog
+    '''
+
+    mp = backend.mpz(p)
+    table = {}
+    e = backend.mpz(1)
+    for j in range(m):
+        table.setdefault(int(e), j)
+        e = (e * g) % mp
+    return table, int(backend.invert(e, mp))
+
+
+def dlog(h, g, p, bound):
+    '''
+    The smallest e <= bound with g^e = h mod p, or None, with baby-step
+    giant-step.
+
+    The table of baby steps is cached and its size is rounded to a power of
+    two, so all the options of a tally, and the next tallies of similar
+    size, use the same table.
+
+    >>> dlog(pow(156, 45, 167), 156, 167, 80)
+    45
+    >>> dlog(1, 156, 167, 80)
+    0
+    >>> dlog(pow(156, 45, 167), 156, 167, 30) is None
+    True
+    '''
+
+    m = 1
+    while m * m <= bound:
+        m <<= 1
+
+    table, factor = baby_steps(int(p), int(g), m)
+    mp = backend.mpz(p)
+    y = backend.mpz(h) % mp
+    for i in range(bound // m + 1):
+        j = table.get(int(y))
+        if j is not None:
+            e = i * m + j
+            return e if e <= bound else None
+        y = (y * factor) % mp
+    return None
+
+
+# one CSPRNG for all the random exponents and permutations, it reads from
+# the os on every call so it's safe to use after a fork
+_random = random.StrongRandom()
 
 
 def rand(p):
     while True:
-        k = random.StrongRandom().randint(1, int(p) - 1)
-        if GCD(k, int(p) - 1) == 1: break
+        k = _random.randint(1, int(p) - 1)
+        if backend.gcd(k, int(p) - 1) == 1: break
     return k
 
 
+def exponent_bits(p, mode=FULL):
+    '''
+    Bits of the random exponents of a key of modulus p in this mode
+
+    >>> exponent_bits(2 ** 2047 + 1, QR), exponent_bits(2 ** 2047 + 1)
+    (256, 2048)
+    >>> exponent_bits(167, QR)
+    6
+    '''
+
+    bits = int(p).bit_length()
+    if mode == QR:
+        return min(EXPONENT_BITS, bits - 2)
+    return bits
+
+
+def rand_exponent(p, mode=FULL):
+    '''
+    Random exponent for the keys and the encryptions, of exponent_bits
+    with the top bit set in QR mode, so it's never 0
+    '''
+
+    if mode != QR:
+        return rand(p)
+    bits = exponent_bits(p, mode)
+    return _random.getrandbits(bits - 1) | (1 << (bits - 1))
+
+
+def encode(m, p):
+    '''
+    Encodes the plaintext m, 0 < m <= (p-1)/2, in the quadratic residues of
+    the safe prime p: -1 isn't a residue, so either m or p - m is one.
+
+    >>> [encode(m, 167) for m in (2, 4, 5)]
+    [2, 4, 162]
+    >>> [decode(encode(m, 167), 167) for m in range(1, 84)] == list(range(1, 84))
+    True
+    '''
+
+    m, p = int(m), int(p)
+    return m if backend.jacobi(m, p) == 1 else p - m
+
+
+def decode(m, p):
+    '''
+    The plaintext of an encoded message, so plaintexts that weren't
+    encoded, up to (p-1)/2, are decoded to themselves
+    '''
+
+    m, p = int(m), int(p)
+    return m if m <= (p - 1) // 2 else p - m
+
+
+class Permutation:
+    '''
+    Random permutation of n elements, made in place with Fisher-Yates over
+    an array of indexes. The element i of the output is the element
+    perm[i] of the input.
+
+    >>> perm = Permutation(10)
+    >>> sorted(perm) == list(range(10))
+    True
+    >>> msgs = list('abcdefghij')
+    >>> out = perm.apply(msgs)
+    >>> out == [msgs[i] for i in perm]
+    True
+    >>> [m for chunk in perm.apply_chunks(msgs, 4) for m in chunk] == out
+    True
+    >>> [len(chunk) for chunk in perm.apply_chunks(msgs, 4)]
+    [4, 4, 2]
+    '''
+
+    def __init__(self, n):
+        perm = array('L', range(n))
+        for i in range(n - 1, 0, -1):
+            j = _random.randint(0, i)
+            perm[i], perm[j] = perm[j], perm[i]
+        self.perm = perm
+
+    def __len__(self):
+        return len(self.perm)
+
+    def __iter__(self):
+        return iter(self.perm)
+
+    def __getitem__(self, i):
+        return self.perm[i]
+
+    def apply(self, msgs):
+        return [msgs[i] for i in self.perm]
+
+    def apply_chunks(self, source, size):
+        '''
+        Applies the permutation and yields the output in chunks of size
+        elements. The source only needs random access by index, so it can
+        be a file backed sequence and the output is never fully in memory.
+        '''
+
+        for start in range(0, len(self.perm), size):
+            yield [source[i] for i in self.perm[start:start + size]]
+
+
+def crypt_class(mode=FULL):
+    '''
+    The MixCrypt class for the keys of mode
+    '''
+
+    if mode == EC:
+        from .ec import ECMixCrypt
+        return ECMixCrypt
+    return MixCrypt
+
+
+def element_width(p, mode=FULL):
+    '''
+    Bytes of each integer of a ciphertext for a key of modulus p, the
+    points of EC keys have a byte more than their coordinates
+    '''
+
+    width = (int(p).bit_length() + 7) // 8
+    return width + 1 if mode == EC else width
+
+
 def gen_multiple_key(*crypts):
     k1 = crypts[0]
-    k = MixCrypt(k=k1.k, bits=k1.bits)
-    k.k.y = 1
-    for kx in crypts:
-        k.k.y *= kx.k.y
-    k.k.y = k.k.y % k.k.p
+    k = type(k1)(k=k1.k, bits=k1.bits, mode=k1.mode)
+    k.k = k.join_keys([kx.k.y for kx in crypts])
     return k
 
 
@@ -104,8 +652,27 @@ def multiple_decrypt_shuffle2(ciphers, *crypts, pubkey=None):
 
 
 class MixCrypt:
-    def __init__(self, k=None, bits=256):
+    '''
+    ElGamal key of one auth. In QR mode, see the QR constant, the messages
+    are encoded by encrypt and decoded by decrypt, but the ones of
+    multiple_decrypt are kept encoded, as they may be proved, and they're
+    decoded by whoever gets the plaintexts.
+
+    >>> k = MixCrypt(bits=256, mode=QR)
+    >>> k.setk(167, 4, 150, 10) #doctest: +ELLIPSIS
+    <Crypto.PublicKey.ElGamal.ElGamal... object at 0x...>
+    >>> cipher = [k.encrypt(m) for m in [2, 3, 4]]
+    >>> check_ciphertexts(cipher, 167, 4, exponential=True)
+    []
+    >>> [k.decrypt(c) for c in cipher]
+    [2, 3, 4]
+    >>> sorted(decode(m, 167) for m in k.multiple_decrypt(k.shuffle(cipher)))
+    [2, 3, 4]
+    '''
+
+    def __init__(self, k=None, bits=256, mode=FULL):
         self.bits = bits
+        self.mode = mode
         if k:
             self.k = self.getk(k.p, k.g)
         else:
@@ -113,11 +680,15 @@ class MixCrypt:
 
     def genk(self):
         self.k = ElGamal.generate(self.bits, Random.new().read)
+        if self.mode == QR:
+            # a short secret too
+            self.getk(self.k.p, self.k.g)
         return self.k
 
     def getk(self, p, g):
-        x = rand(p)
-        y = pow(g, x, p)
+        p, g = int(p), int(g)
+        x = rand_exponent(p, self.mode)
+        y = int(backend.powmod(g, x, p))
         self.k = ElGamal.construct((p, g, y, x))
         return self.k
 
@@ -125,42 +696,48 @@ class MixCrypt:
         self.k = ElGamal.construct((p, g, y, x))
         return self.k
 
+    def join_keys(self, ys):
+        '''
+        Public key for the combination of the public keys ys, in the group
+        of our key, to encrypt for all their owners
+        '''
+
+        p = backend.mpz(int(self.k.p))
+        y = 1
+        for yx in ys:
+            y = (y * int(yx)) % p
+        return ElGamal.construct((int(self.k.p), int(self.k.g), int(y)))
+
     def encrypt(self, m, k=None):
-        r = rand(self.k.p)
         if not k:
             k = self.k
-        a, b = k._encrypt(m, r)
-        return a, b
+        p = int(k.p)
+        tg, ty = key_tables(p, k.g, k.y, self.mode)
+        r = rand_exponent(p, self.mode)
+        if self.mode == QR:
+            m = encode(m, p)
+        a = tg.pow(r)
+        b = (ty.pow(r) * m) % p
+        return int(a), int(b)
 
     def decrypt(self, c):
-        m = self.k._decrypt(c)
-        return m
+        p, x = int(self.k.p), int(self.k.x)
+        a, b = c
+        # a^(p-1-x) is the inverse of a^x
+        m = (backend.mpz(b) * backend.powmod(a, p - 1 - x, p)) % p
+        if self.mode == QR:
+            return decode(m, p)
+        return int(m)
 
     def multiple_decrypt(self, msgs, last=True):
-        msgs2 = []
-        for a, b in msgs:
-            clear = self.decrypt((a, b))
-            if last:
-                msg = clear
-            else:
-                msg = (a, clear)
-            msgs2.append(msg)
-        return msgs2
+        clears = decrypt_batch(msgs, self.k.p, self.k.x)
+        if last:
+            return clears
+        return [(a, clear) for (a, b), clear in zip(msgs, clears)]
 
     def shuffle_decrypt(self, msgs, last=True):
-        msgs2 = msgs.copy()
-        msgs3 = []
-        while msgs2:
-            n = random.StrongRandom().randint(0, len(msgs2) - 1)
-            a, b = msgs2.pop(n)
-            clear = self.decrypt((a, b))
-            if last:
-                msg = clear
-            else:
-                msg = (a, clear)
-            msgs3.append(msg)
-
-        return msgs3
+        perm = self.gen_perm(len(msgs))
+        return self.multiple_decrypt(perm.apply(msgs), last)
 
     def reencrypt(self, cipher, pubkey=None):
         '''
@@ -177,40 +754,73 @@ class MixCrypt:
         True
         '''
 
-        if pubkey:
-            p, g, y = pubkey
-            k = ElGamal.construct((p, g, y))
-        else:
-            k = self.k
+        p, g, y = self.parse_pubkey(pubkey)
+        a1, b1 = multi_pow(key_tables(p, g, y, self.mode), rand_exponent(p, self.mode))
 
         a, b = map(int, cipher)
-        a1, b1 = map(int, self.encrypt(1, k=k))
-        p = int(k.p)
+        return (int((a * a1) % p), int((b * b1) % p))
+
+    def reencrypt_batch(self, msgs, pubkey=None, pairs=()):
+        '''
+        Reencrypt a list of ciphertexts, all of them with the same key.
+
+        The key is parsed and validated only once and the work is done
+        over plain integers. Precomputed (g^r, y^r) pairs can be given in
+        pairs, to be used for the first ciphertexts.
+
+        >>> B = 256
+        >>> k = MixCrypt(bits=B)
+        >>> clears = [random.StrongRandom().randint(1, B) for i in range(5)]
+        >>> cipher = [k.encrypt(i) for i in clears]
+        >>> pk = (k.k.p, k.k.g, k.k.y)
+        >>> cipher2 = k.reencrypt_batch(cipher, pk)
+        >>> clears == [k.decrypt(i) for i in cipher2]
+        True
+        >>> any(c1 == c2 for c1, c2 in zip(cipher, cipher2))
+        False
+        >>> k.reencrypt_batch(cipher, (167, 1, 89))
+        Traceback (most recent call last):
+        ...
+        ValueError: Invalid ElGamal key components
+        '''
 
-        return ((a * a1) % p, (b * b1) % p)
+        p, g, y = self.parse_pubkey(pubkey)
+        if len(pairs) < len(msgs):
+            tables = key_tables(p, g, y, self.mode)
+
+        msgs2 = []
+        for i, (a, b) in enumerate(msgs):
+            if i < len(pairs):
+                a1, b1 = pairs[i]
+            else:
+                a1, b1 = multi_pow(tables, rand_exponent(p, self.mode))
+            msgs2.append((int((a * a1) % p), int((b * b1) % p)))
+        return msgs2
+
+    def parse_pubkey(self, pubkey=None):
+        '''
+        Returns the (p, g, y) integers of pubkey, or of our own key if
+        pubkey is None.
+        '''
+
+        if not pubkey:
+            return int(self.k.p), int(self.k.g), int(self.k.y)
+
+        p, g, y = map(int, pubkey)
+        if not (1 < g < p and 1 < y < p):
+            raise ValueError("Invalid ElGamal key components")
+        return p, g, y
 
     def gen_perm(self, l):
-        x = list(range(l))
-        for i in range(l):
-            d = random.StrongRandom().randint(0, i)
-            if i != d:
-                x[i] = x[d]
-                x[d] = i
-        return x
-
-    def shuffle(self, msgs, pubkey=None):
+        return Permutation(l)
+
+    def shuffle(self, msgs, pubkey=None, pairs=()):
         '''
         Reencrypt and shuffle
         '''
 
-        msgs2 = msgs.copy()
         perm = self.gen_perm(len(msgs))
-        for i, p in enumerate(perm):
-            m = msgs[p]
-            nm = self.reencrypt(m, pubkey)
-            msgs2[i] = nm
-
-        return msgs2
+        return self.reencrypt_batch(perm.apply(msgs), pubkey, pairs)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,24 @@
+import logging
+import os
+import time
+
+from Crypto import Random
+from Crypto.PublicKey import ElGamal
+from Crypto.Util.number import isPrime
 from django.db import models
 
-from .mixcrypt import MixCrypt
+from .mixcrypt import (MixCrypt, Permutation, crypt_class, decrypt_factors,
+                       element_width, subgroup_order)
+from .checkpoint import Checkpoint
+from .pool import PoolKeyError, RandomnessPool
+from .spool import Spool
+from . import ec
+from . import parallel
+from . import proofs
 
 from base import mods
-from base.models import Auth, Key
+from base import wire
+from base.models import Auth, Key, BigBigField
 from base.serializers import AuthSerializer
 from django.conf import settings
 
@@ -11,6 +26,47 @@ from django.conf import settings
 # number of bits for the key, all auths should use the same number of bits
 B = settings.KEYBITS
 
+logger = logging.getLogger(__name__)
+
+
+class ChainError(Exception):
+    pass
+
+
+class Group(models.Model):
+    '''
+    Vetted group parameters, a safe prime p and a generator g, for new
+    mixnets of that number of bits, so they only generate their private
+    key instead of a new safe prime
+    '''
+
+    p = BigBigField()
+    g = BigBigField()
+    bits = models.PositiveIntegerField(db_index=True)
+
+    def __str__(self):
+        return "{} bits: {},{}".format(self.bits, self.p, self.g)
+
+    @classmethod
+    def generate(cls, bits=B):
+        k = ElGamal.generate(bits, Random.new().read)
+        return cls.objects.create(p=int(k.p), g=int(k.g), bits=bits)
+
+    @classmethod
+    def pick(cls, bits=B):
+        return cls.objects.filter(bits=bits).order_by('?').first()
+
+    def validate(self):
+        '''
+        Raises ValueError if p isn't a safe prime or g isn't valid
+        '''
+
+        p, g = int(self.p), int(self.g)
+        if not isPrime(p) or not isPrime((p - 1) // 2):
+            raise ValueError('p is not a safe prime')
+        if not 1 < g < p - 1:
+            raise ValueError('g is out of range')
+
 
 class Mixnet(models.Model):
     voting_id = models.PositiveIntegerField()
@@ -22,41 +78,213 @@ class Mixnet(models.Model):
     pubkey = models.ForeignKey(Key, blank=True, null=True,
                                related_name="mixnets_pub",
                                on_delete=models.SET_NULL)
+    # the voting module that asked for the key
+    voting_url = models.URLField(blank=True)
 
     def __str__(self):
         auths = ", ".join(a.name for a in self.auths.all())
         return "Voting: {}, Auths: {}\nPubKey: {}".format(self.voting_id,
                                                           auths, self.pubkey)
 
-    def shuffle(self, msgs, pk):
-        crypt = MixCrypt(bits=B)
-        k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
+    def crypt(self):
+        # built from our key, so there's no need to generate a new one
+        crypt = crypt_class(self.key.mode)(k=self.key, bits=B, mode=self.key.mode)
+        crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
+        return crypt
+
+    # the parallel functions and the decryption proofs are for finite field
+    # keys, EC keys work in the request process and aren't proved. Shuffles
+    # are only proved with QR keys, see mixnet.proofs
+
+    def in_parallel(self, processes):
+        return processes > 1 and self.key.mode != Key.EC
+
+    def provable(self):
+        return self.key.mode != Key.EC
+
+    def shuffle_provable(self):
+        return self.key.mode == Key.QR
 
-        return crypt.shuffle(msgs, pk)
+    def voting_key(self):
+        '''
+        (p, g, y) of the key the votes are encrypted with, or None if the
+        voting has no key yet. Only the first auth joins all the shares,
+        the others ask the voting module that asked for the key, which
+        isn't in their deployment.
+        '''
 
-    def decrypt(self, msgs, pk, last=False):
-        crypt = MixCrypt(bits=B)
-        k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
+        if self.auth_position == 0:
+            key = self.pubkey and (self.pubkey.p, self.pubkey.g, self.pubkey.y)
+        else:
+            votings = mods.get('voting', baseurl=self.voting_url or None,
+                               params={'id': self.voting_id})
+            key = votings and votings[0]['pub_key']
+            key = key and (key['p'], key['g'], key['y'])
+        return tuple(map(int, key)) if key else None
+
+    def reencrypt(self, msgs, pk, processes=1):
+        crypt = self.crypt()
+
+        try:
+            pairs = self.pool().take(pk, len(msgs))
+        except PoolKeyError as e:
+            # the shuffle doesn't fail for the pool, see the pool view
+            logger.warning("Voting %s, position %s: %s, reencrypting without the pool",
+                           self.voting_id, self.auth_position, e)
+            pairs = ()
+        if self.in_parallel(processes):
+            return parallel.reencrypt(crypt, msgs, pk, processes, pairs)
+        return crypt.reencrypt_batch(msgs, pk, pairs)
+
+    def shuffle(self, msgs, pk, processes=1):
+        perm = Permutation(len(msgs))
+        return self.reencrypt(perm.apply(msgs), pk, processes)
+
+    def shuffle_proved(self, msgs, pk):
+        '''
+        Shuffle with a proof, that is saved with the input and the output
+        to verify the whole cascade later, see the verifyshuffles command.
+        The time spent in the shuffle and in the proof is saved too.
+        '''
+
+        start = time.time()
+        shuffled, perm, rs = proofs.shuffle(msgs, pk, self.key.mode)
+        shuffle_seconds = time.time() - start
+        proof = proofs.prove(msgs, shuffled, perm, rs, pk)
+        seconds = time.time() - start - shuffle_seconds
+
+        ShuffleProof.objects.update_or_create(mixnet=self, defaults={
+            'msgs': wire.dumps({'msgs': msgs, 'pk': [int(i) for i in pk]}),
+            'shuffled': wire.dumps(shuffled),
+            'proof': proofs.dumps(proof),
+            'seconds': seconds,
+            'shuffle_seconds': shuffle_seconds,
+        })
+        return shuffled
+
+    def decrypt(self, msgs, pk, last=False, processes=1):
+        crypt = self.crypt()
+
+        if self.in_parallel(processes):
+            return parallel.shuffle_decrypt(crypt, msgs, last, processes)
         return crypt.shuffle_decrypt(msgs, last)
 
-    def gen_key(self, p=0, g=0):
-        crypt = MixCrypt(bits=B)
+    def factors(self, alphas, processes=1):
+        crypt = self.crypt()
+
+        if self.key.mode == Key.EC:
+            return ec.decrypt_factors(alphas, crypt.k.x)
+        if self.in_parallel(processes):
+            return parallel.factors(crypt, alphas, processes)
+        return decrypt_factors(alphas, crypt.k.p, crypt.k.x)
+
+    def share(self):
+        return int(self.key.p), int(self.key.g), int(self.key.y)
+
+    def decrypt_proved(self, msgs, last=False, processes=1):
+        '''
+        Decrypt with a proof, that is saved with the input and the output
+        to verify it later, see the verifydecryptions command.
+
+        The messages aren't shuffled again, so the output can be checked
+        against the input, they're shuffled with a proof in the shuffle.
+        '''
+
+        crypt = self.crypt()
+        if self.in_parallel(processes):
+            decrypted = parallel.multiple_decrypt(crypt, msgs, last, processes)
+        else:
+            decrypted = crypt.multiple_decrypt(msgs, last)
+
+        start = time.time()
+        proof = proofs.prove_decryption(msgs, decrypted, self.key.x, self.share())
+        self.save_decrypt_proof(msgs, decrypted, proof, time.time() - start)
+        return decrypted
+
+    def factors_proved(self, alphas, processes=1):
+        '''
+        Decryption factors with a proof, as decrypt_proved
+        '''
+
+        factors = self.factors(alphas, processes)
+
+        start = time.time()
+        proof = proofs.prove_factors(alphas, factors, self.key.x, self.share())
+        self.save_decrypt_proof(alphas, factors, proof, time.time() - start,
+                                factors=True)
+        return factors
+
+    def save_decrypt_proof(self, msgs, decrypted, proof, seconds, factors=False):
+        DecryptProof.objects.create(
+            mixnet=self,
+            factors=factors,
+            msgs=wire.dumps({'msgs': msgs, 'pk': list(self.share())}),
+            decrypted=wire.dumps(decrypted),
+            proof=wire.dumps(proof),
+            seconds=seconds,
+        )
+
+    def spool(self, session):
+        name = '{}-{}-{}'.format(self.voting_id, self.auth_position, session)
+        width = element_width(self.key.p, self.key.mode)
+        return Spool(os.path.join(settings.MIXNET_SPOOL_DIR, name), width)
+
+    def shuffle_chunk(self, session, offset, total, msgs, pk, processes=1):
+        '''
+        Reencrypts a chunk of a chunked shuffle and stores it in the spool.
+
+        Returns True if this is the chunk that completes the total number
+        of messages, so the shuffle can go on.
+        '''
+
+        spool = self.spool(session)
+        spool.write('in', offset, self.reencrypt(msgs, pk, processes))
+        return spool.received(offset, len(msgs)) >= total and spool.claim('done')
+
+    def shuffled_chunks(self, session, total, size):
+        '''
+        Permutes the reencrypted messages of a chunked shuffle and yields
+        them in chunks of size messages.
+        '''
+
+        perm = Permutation(total)
+        with self.spool(session).sequence('in', total) as msgs:
+            yield from perm.apply_chunks(msgs, size)
+
+    def gen_key(self, p=0, g=0, mode=Key.FULL):
         if self.key:
-            k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
-        elif (not g or not p):
-            k = crypt.genk()
-            key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
-            key.save()
-
-            self.key = key
-            self.save()
+            return
+
+        # MixCrypt generates a new safe prime if it doesn't get p and g
+        group = Key(p=p, g=g) if p and g else Group.pick(B)
+        if mode == Key.EC:
+            # there's only one curve
+            k = crypt_class(mode)().k
+        elif group:
+            # QR keys need g in the quadratic residues
+            if mode == Key.QR and not subgroup_order(int(group.p), int(group.g)):
+                mode = Key.FULL
+            k = MixCrypt(k=group, bits=B, mode=mode).k
         else:
-            k = crypt.getk(p, g)
-            key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
-            key.save()
+            k = MixCrypt(bits=B, mode=mode).k
+
+        key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x), mode=mode)
+        key.save()
 
-            self.key = key
-            self.save()
+        self.key = key
+        self.save()
+
+    def checkpoint(self, phase, msgs, pk):
+        # there's nothing to resume if there's no next auth to fail
+        if not settings.MIXNET_CHECKPOINT_DIR or not self.next_auths().exists():
+            return Checkpoint(None)
+        name = '{}-{}-{}-{}'.format(self.voting_id, self.auth_position, phase,
+                                    Checkpoint.digest(msgs, pk))
+        return Checkpoint(os.path.join(settings.MIXNET_CHECKPOINT_DIR, name))
+
+    def pool(self):
+        name = '{}-{}.pool'.format(self.voting_id, self.auth_position)
+        return RandomnessPool(os.path.join(settings.MIXNET_POOL_DIR, name))
 
     def chain_call(self, path, data):
         next_auths=self.next_auths()
@@ -64,17 +292,43 @@ class Mixnet(models.Model):
         data.update({
             "auths": AuthSerializer(next_auths, many=True).data,
             "voting": self.voting_id,
+            "voting_url": self.voting_url,
             "position": self.auth_position + 1,
         })
 
         if next_auths:
-            auth = next_auths.first().url
-            r = mods.post('mixnet', entry_point=path,
-                           baseurl=auth, json=data)
-            return r
+            auth = next_auths[0].url
+            r = mods.post('mixnet', entry_point=path, response=True,
+                           baseurl=auth, json=data, binary=True)
+            if r.status_code != 200:
+                raise ChainError('{}{}: {}'.format(auth, path, r.status_code))
+            return mods.parse(r)
 
         return None
 
+    def next_keys(self, data):
+        '''
+        y of the key shares of the next auths, asked at the same time
+        instead of in a chain. Each auth gets the auths from it on, as in
+        the chain, but doesn't call the ones after it.
+        '''
+
+        next_auths = list(self.next_auths())
+        queries = []
+        for i, auth in enumerate(next_auths):
+            d = dict(data, chain=False, voting=self.voting_id,
+                     voting_url=self.voting_url, position=self.auth_position + 1 + i,
+                     auths=AuthSerializer(next_auths[i:], many=True).data)
+            queries.append({'modname': 'mixnet', 'method': 'post', 'baseurl': auth.url,
+                            'json': d, 'response': True})
+
+        keys = []
+        for auth, r in zip(next_auths, mods.gather(*queries)):
+            if r.status_code != 200:
+                raise ChainError('{}/: {}'.format(auth.url, r.status_code))
+            keys.append(mods.parse(r)["y"])
+        return keys
+
     def next_auths(self):
         next_auths = self.auths.filter(me=False)
 
@@ -82,3 +336,64 @@ class Mixnet(models.Model):
             next_auths = next_auths[1:]
 
         return next_auths
+
+
+class ShuffleProof(models.Model):
+    '''
+    Proof of the last shuffle of a mixnet, with its input and output, as
+    wire messages, and the seconds spent proving and shuffling
+    '''
+
+    mixnet = models.OneToOneField(Mixnet, related_name='proof', on_delete=models.CASCADE)
+    msgs = models.BinaryField()
+    shuffled = models.BinaryField()
+    proof = models.BinaryField()
+    seconds = models.FloatField()
+    shuffle_seconds = models.FloatField()
+    created = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{}: {:.2f}s'.format(self.mixnet, self.seconds)
+
+    def load(self):
+        '''
+        Returns the input, the output, the proof and the public key
+        '''
+
+        data = wire.loads(bytes(self.msgs))
+        return (data['msgs'], wire.loads(bytes(self.shuffled)),
+                proofs.loads(bytes(self.proof)), data['pk'])
+
+
+class DecryptProof(models.Model):
+    '''
+    Proof of a decryption of a mixnet, or of its decryption factors, with
+    its input and output, as wire messages, and the seconds spent proving.
+    There's one for each batch, so a chunked tally has many of them.
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name='decrypt_proofs', on_delete=models.CASCADE)
+    factors = models.BooleanField(default=False)
+    msgs = models.BinaryField()
+    decrypted = models.BinaryField()
+    proof = models.BinaryField()
+    seconds = models.FloatField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{}: {:.2f}s'.format(self.mixnet, self.seconds)
+
+    def load(self):
+        '''
+        Returns the input, the output, the proof and the key share
+        '''
+
+        data = wire.loads(bytes(self.msgs))
+        return (data['msgs'], wire.loads(bytes(self.decrypted)),
+                wire.loads(bytes(self.proof)), data['pk'])
+
+    def verify(self):
+        msgs, decrypted, proof, pk = self.load()
+        if self.factors:
+            return proofs.verify_factors(msgs, decrypted, proof, pk)
+        return proofs.verify_decryption(msgs, decrypted, proof, pk)
@@ -0,0 +1,162 @@
+'''
+Parallel shuffle and decryption for one authority, using a process pool.
+
+The ciphertexts are packed as fixed-width big endian integers in a shared
+memory buffer that the workers inherit. Each worker processes a chunk of
+the buffer and writes the result back in place, so the big integers are
+never pickled as python tuples.
+'''
+
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+from .mixcrypt import decrypt_batch, decrypt_factors, key_tables, multi_pow, rand_exponent
+
+
+# chunks per process, more chunks balance better the load between workers
+CHUNKS = 4
+
+# buffer and key inherited by the pool workers
+_shared = {}
+
+
+def _init(buf, width, key):
+    _shared['buf'] = view(buf)
+    _shared['width'] = width
+    _shared['key'] = key
+
+
+def _read(buf, width, i):
+    return int.from_bytes(buf[i * width:(i + 1) * width], 'big')
+
+
+def _write(buf, width, i, n):
+    buf[i * width:(i + 1) * width] = int(n).to_bytes(width, 'big')
+
+
+def _reencrypt_chunk(chunk):
+    buf, width = _shared['buf'], _shared['width']
+    p, g, y, mode = _shared['key']
+    tables = key_tables(p, g, y, mode)
+
+    for i in range(*chunk):
+        a, b = _read(buf, width, 2 * i), _read(buf, width, 2 * i + 1)
+        a1, b1 = multi_pow(tables, rand_exponent(p, mode))
+        _write(buf, width, 2 * i, (a * a1) % p)
+        _write(buf, width, 2 * i + 1, (b * b1) % p)
+
+
+def _decrypt_chunk(chunk):
+    buf, width = _shared['buf'], _shared['width']
+    p, x = _shared['key']
+
+    msgs = [(_read(buf, width, 2 * i), _read(buf, width, 2 * i + 1))
+            for i in range(*chunk)]
+    for i, m in zip(range(*chunk), decrypt_batch(msgs, p, x)):
+        _write(buf, width, 2 * i + 1, m)
+
+
+def _factors_chunk(chunk):
+    buf, width = _shared['buf'], _shared['width']
+    p, x = _shared['key']
+
+    alphas = [_read(buf, width, 2 * i) for i in range(*chunk)]
+    for i, f in zip(range(*chunk), decrypt_factors(alphas, p, x)):
+        _write(buf, width, 2 * i + 1, f)
+
+
+def view(buf):
+    return memoryview(buf).cast('B')
+
+
+def pack(msgs, width):
+    buf = RawArray('B', 2 * width * len(msgs))
+    mv = view(buf)
+    for i, (a, b) in enumerate(msgs):
+        _write(mv, width, 2 * i, int(a))
+        _write(mv, width, 2 * i + 1, int(b))
+    return buf
+
+
+def unpack(buf, width, n):
+    buf = view(buf)
+    return [(_read(buf, width, 2 * i), _read(buf, width, 2 * i + 1))
+            for i in range(n)]
+
+
+def chunks(n, processes):
+    size = max(1, -(-n // (processes * CHUNKS)))
+    return [(i, min(i + size, n)) for i in range(0, n, size)]
+
+
+def run(func, msgs, p, key, processes):
+    '''
+    Runs func over all the msgs in a pool of processes and returns the
+    packed buffer with the results.
+    '''
+
+    width = (int(p).bit_length() + 7) // 8
+    buf = pack(msgs, width)
+    with multiprocessing.Pool(processes, initializer=_init,
+                              initargs=(buf, width, key)) as pool:
+        pool.map(func, chunks(len(msgs), processes))
+    return buf, width
+
+
+def reencrypt(crypt, msgs, pubkey=None, processes=None, pairs=()):
+    '''
+    Parallel version of MixCrypt.reencrypt_batch
+    '''
+
+    p, g, y = crypt.parse_pubkey(pubkey)
+
+    # precomputed pairs only need a multiplication, no need to send them
+    # to the workers
+    n = len(pairs)
+    head = crypt.reencrypt_batch(msgs[:n], (p, g, y), pairs)
+    if n >= len(msgs):
+        return head
+
+    buf, width = run(_reencrypt_chunk, msgs[n:], p, (p, g, y, crypt.mode), processes)
+    return head + unpack(buf, width, len(msgs) - n)
+
+
+def shuffle(crypt, msgs, pubkey=None, processes=None, pairs=()):
+    '''
+    Parallel version of MixCrypt.shuffle
+    '''
+
+    msgs2 = crypt.gen_perm(len(msgs)).apply(msgs)
+    return reencrypt(crypt, msgs2, pubkey, processes, pairs)
+
+
+def multiple_decrypt(crypt, msgs, last=True, processes=None):
+    '''
+    Parallel version of MixCrypt.multiple_decrypt
+    '''
+
+    p, x = int(crypt.k.p), int(crypt.k.x)
+    buf, width = run(_decrypt_chunk, msgs, p, (p, x), processes)
+    msgs2 = unpack(buf, width, len(msgs))
+    if last:
+        return [b for a, b in msgs2]
+    return msgs2
+
+
+def shuffle_decrypt(crypt, msgs, last=True, processes=None):
+    '''
+    Parallel version of MixCrypt.shuffle_decrypt
+    '''
+
+    msgs2 = crypt.gen_perm(len(msgs)).apply(msgs)
+    return multiple_decrypt(crypt, msgs2, last, processes)
+
+
+def factors(crypt, alphas, processes=None):
+    '''
+    Parallel version of mixcrypt.decrypt_factors
+    '''
+
+    p, x = int(crypt.k.p), int(crypt.k.x)
+    buf, width = run(_factors_chunk, [(a, 0) for a in alphas], p, (p, x), processes)
+    return [f for a, f in unpack(buf, width, len(alphas))]
@@ -0,0 +1,169 @@
+'''
+Pool of precomputed reencryption factors.
+
+Each record of the pool is a (g^r mod p, y^r mod p) pair for a random r
+and the voting public key, so a reencryption in the tally is just two
+multiplications. The pool is filled in advance, while the voting is open,
+and every pair is used only once: taken pairs are wiped from the file.
+
+The pool is a file with a small header followed by fixed-width big endian
+records, memory-mapped to take the pairs.
+'''
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+from . import ec
+from .mixcrypt import EC, FULL, element_width, key_tables, multi_pow, rand_exponent
+
+
+MAGIC = b'DCDPOOL1'
+
+# magic, width, key fingerprint, size, used, generated pairs and seconds
+# spent generating them
+HEADER = struct.Struct('>8sI32sQQQd')
+FIELDS = ('width', 'fingerprint', 'size', 'used', 'generated', 'seconds')
+
+
+class PoolKeyError(Exception):
+    pass
+
+
+def fingerprint(pk):
+    p, g, y = map(int, pk)
+    return hashlib.sha256('{},{},{}'.format(p, g, y).encode()).digest()
+
+
+class RandomnessPool:
+
+    def __init__(self, path):
+        self.path = path
+
+    def read_header(self, f):
+        f.seek(0)
+        data = f.read(HEADER.size)
+        if len(data) < HEADER.size or not data.startswith(MAGIC):
+            return None
+        return dict(zip(FIELDS, HEADER.unpack(data)[1:]))
+
+    def pack_header(self, h):
+        return HEADER.pack(MAGIC, *(h[k] for k in FIELDS))
+
+    def offset(self, h, i):
+        return HEADER.size + i * 2 * h['width']
+
+    def fill(self, pk, n, mode=FULL):
+        '''
+        Generates n new pairs for the public key pk, with the random
+        exponents of the key mode, and adds them to the pool. A pool for
+        another key is discarded.
+        '''
+
+        p, g, y = map(int, pk)
+        width = element_width(p, mode)
+
+        start = time.time()
+        if mode == EC:
+            pairs = ec.pairs(pk, n)
+        else:
+            tables = key_tables(p, g, y, mode)
+            pairs = (multi_pow(tables, rand_exponent(p, mode)) for i in range(n))
+
+        data = bytearray()
+        for a, b in pairs:
+            data += int(a).to_bytes(width, 'big') + int(b).to_bytes(width, 'big')
+        seconds = time.time() - start
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with open(fd, 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            h = self.read_header(f)
+            if not h or h['fingerprint'] != fingerprint(pk):
+                h = {'width': width, 'fingerprint': fingerprint(pk),
+                     'size': 0, 'used': 0, 'generated': 0, 'seconds': 0.0}
+
+            # the used pairs are dropped when the pool is refilled
+            f.seek(self.offset(h, h['used']))
+            remaining = f.read(self.offset(h, h['size']) - f.tell())
+
+            h['size'] = h['size'] - h['used'] + n
+            h['used'] = 0
+            h['generated'] += n
+            h['seconds'] += seconds
+
+            f.seek(0)
+            f.truncate()
+            f.write(self.pack_header(h))
+            f.write(remaining)
+            f.write(data)
+
+    def take(self, pk, n):
+        '''
+        Returns up to n pairs for the public key pk, removing them from
+        the pool. The list is empty if there's no pool, and PoolKeyError
+        is raised if the pool is for another key.
+        '''
+
+        if not n or not os.path.exists(self.path):
+            return []
+
+        with open(self.path, 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            h = self.read_header(f)
+            if not h:
+                return []
+            self.check_key(h, pk)
+
+            n = min(n, h['size'] - h['used'])
+            if not n:
+                return []
+
+            width = h['width']
+            start, end = self.offset(h, h['used']), self.offset(h, h['used'] + n)
+            with mmap.mmap(f.fileno(), 0) as mm:
+                pairs = []
+                for i in range(start, end, 2 * width):
+                    a = int.from_bytes(mm[i:i + width], 'big')
+                    b = int.from_bytes(mm[i + width:i + 2 * width], 'big')
+                    pairs.append((a, b))
+                mm[start:end] = bytes(end - start)
+
+                h['used'] += n
+                mm[:HEADER.size] = self.pack_header(h)
+                mm.flush()
+
+        return pairs
+
+    def check_key(self, h, pk):
+        if h['fingerprint'] != fingerprint(pk):
+            raise PoolKeyError('{}: the pool is for another key'.format(self.path))
+
+    def stats(self, pk=None):
+        '''
+        Pool size, used and remaining pairs, and the fill rate in pairs per
+        second. If pk is given, PoolKeyError is raised if the pool is for
+        another key.
+        '''
+
+        h = None
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                h = self.read_header(f)
+
+        if not h:
+            return {'size': 0, 'used': 0, 'remaining': 0, 'rate': 0}
+        if pk:
+            self.check_key(h, pk)
+
+        return {
+            'size': h['size'],
+            'used': h['used'],
+            'remaining': h['size'] - h['used'],
+            'rate': h['generated'] / h['seconds'] if h['seconds'] else 0,
+        }
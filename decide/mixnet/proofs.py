@@ -0,0 +1,589 @@
+'''
+Proofs of a correct shuffle and of a correct decryption, so anyone can
+check that the output of each auth is a reencryption of a permutation of
+its input, or its partial decryption.
+
+This is the Terelius-Wikström proof, as in the pseudo-code of Haenni et
+al., "Pseudo-Code Algorithms for Verifiable Re-Encryption Mix-Nets". The
+proof is non-interactive, the challenges are hashes of the statement and
+the commitments, and it works in the quadratic residues of a safe prime
+p = 2q + 1, with g one of them, the keys generated by pycryptodome.
+
+The proof is about the (a, b^2) ciphertexts, with the key y^2 and the
+same randomness. Only QR keys can be proved: their b is in the subgroup,
+where squaring is a bijection, and the verifier rejects any other b. The
+plaintexts of FULL keys aren't encoded in the subgroup, and b^2 would
+hide a changed sign of b, p - m instead of m.
+
+Some changes to make the verification cheaper:
+
+ * challenges of CHALLENGE_BITS, instead of the size of q
+ * the s' responses are computed over the integers, so they're short
+ * the N equations of the commitment chain are checked together with
+   random small exponents, all the products with multi_exp
+
+so the verifier does a few multi-exponentiations with short exponents of
+N bases, and the prover about three exponentiations by ciphertext, with
+fixed-base tables, besides the shuffle.
+
+>>> pk = (167, 4, 150)
+>>> msgs = [(18, 4), (150, 9), (122, 16), (89, 25), (4, 36)]
+>>> shuffled, perm, rs = shuffle(msgs, pk)
+>>> proof = prove(msgs, shuffled, perm, rs, pk)
+>>> verify(msgs, shuffled, proof, pk)
+True
+>>> loads(dumps(proof)) == proof
+True
+>>> verify(msgs, shuffled[1:] + shuffled[:1], proof, pk)
+False
+>>> a, b = shuffled[0]
+>>> verify(msgs, [(a, b * 2 % 167)] + shuffled[1:], proof, pk)
+False
+>>> verify(msgs, [(a, 167 - b)] + shuffled[1:], proof, pk)
+False
+>>> shuffled2, perm2, rs2 = shuffle(shuffled, pk)
+>>> proof2 = prove(shuffled, shuffled2, perm2, rs2, pk)
+>>> verify_cascade(msgs, [(shuffled, proof), (shuffled2, proof2)], pk)
+-1
+>>> verify_cascade(msgs, [(shuffled, proof2), (shuffled2, proof2)], pk)
+0
+
+The decryption proof is a single Chaum-Pedersen proof for a random linear
+combination of the whole batch, see prove_decryption.
+
+>>> share = (167, 4, pow(4, 10, 167))
+>>> decrypted = [b * pow(a, 167 - 1 - 10, 167) % 167 for a, b in shuffled]
+>>> proof = prove_decryption(shuffled, decrypted, 10, share)
+>>> verify_decryption(shuffled, decrypted, proof, share)
+True
+>>> verify_decryption(shuffled, decrypted[::-1], proof, share)
+False
+>>> alphas = [a for a, b in shuffled]
+>>> factors = [pow(a, 10, 167) for a in alphas]
+>>> proof = prove_factors(alphas, factors, 10, share)
+>>> verify_factors(alphas, factors, proof, share)
+True
+>>> verify_factors(alphas, factors[:-1] + [4], proof, share)
+False
+
+The ballots of homomorphic votings, g^0 or g^1 for each option, are
+proved with a disjunctive Chaum-Pedersen proof for each option and one
+more for their product, that it encrypts at most max_selections, see
+prove_vector.
+
+>>> vector, proof = encrypt_vector([0, 1, 0], pk)
+>>> verify_vector(vector, proof, 1, pk)
+True
+>>> vector2, proof2 = encrypt_vector([1, 1, 0], pk)
+>>> verify_vector(vector2, proof2, 1, pk)
+False
+>>> verify_vector(vector2, proof2, 2, pk)
+True
+>>> verify_vector(vector2, proof, 2, pk)
+False
+'''
+
+import hashlib
+
+from base import wire
+
+from . import backend
+from .mixcrypt import (QR, FixedBase, Permutation, _random, key_tables,
+                       multi_exp, multi_pow, not_in_subgroup, rand_exponent,
+                       subgroup_order)
+
+
+# bits of the challenges, the soundness of the proof
+CHALLENGE_BITS = 128
+
+# extra random bits of the s' responses, to hide the witness
+HIDING_BITS = 128
+
+# lists of the proof with an element by ciphertext
+FIELDS = ('commitments', 'chain', 'that', 'shat', 'sprime')
+
+
+def group(pk):
+    p, g, y = map(int, pk)
+    q = subgroup_order(p, g)
+    if not q:
+        raise ValueError('The key has no prime order subgroup')
+    return p, q, g, y
+
+
+def statement(msgs, p):
+    return [(int(a), int(b) * int(b) % p) for a, b in msgs]
+
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(wire.dumps([int(i) for i in part]))
+    return h.digest()
+
+
+def challenge(seed, i=0):
+    data = hashlib.sha256(seed + i.to_bytes(8, 'big')).digest()
+    return int.from_bytes(data[:CHALLENGE_BITS // 8], 'big')
+
+
+def rand_q(q):
+    # randint is much slower, and the 64 extra bits make the bias negligible
+    return _random.getrandbits(q.bit_length() + 64) % q
+
+
+def generators(p, n):
+    '''
+    n independent generators of the quadratic residues of p, squares of
+    hashes, so nobody knows the discrete log of one in terms of the others
+    '''
+
+    size = (p.bit_length() + 7) // 8 + 16
+    seed = b'decide-generators' + p.to_bytes(size, 'big')
+    gens = []
+    for i in range(n):
+        h = hashlib.shake_256(seed + i.to_bytes(8, 'big')).digest(size)
+        x = int.from_bytes(h, 'big') % p
+        gens.append(x * x % p)
+    return gens
+
+
+def shuffle(msgs, pk, mode=QR):
+    '''
+    Shuffles and reencrypts msgs as MixCrypt.shuffle, with the random
+    exponents of the key mode, and returns the output with the permutation
+    and the randomness used for each output ciphertext, needed for the
+    proof. Only QR keys can be proved.
+    '''
+
+    if mode != QR:
+        raise ValueError('Only shuffles with QR keys can be proved')
+
+    p, g, y = map(int, pk)
+    tables = key_tables(p, g, y, mode)
+    perm = Permutation(len(msgs))
+
+    shuffled, rs = [], []
+    for a, b in perm.apply(msgs):
+        r = rand_exponent(p, mode)
+        a1, b1 = multi_pow(tables, r)
+        shuffled.append((int((int(a) * a1) % p), int((int(b) * b1) % p)))
+        rs.append(r)
+    return shuffled, perm, rs
+
+
+def prove(msgs, shuffled, perm, rs, pk):
+    '''
+    Proof that shuffled[i] is msgs[perm[i]] reencrypted with rs[i]
+    '''
+
+    p, q, g, y = group(pk)
+    e, e2 = statement(msgs, p), statement(shuffled, p)
+    y2 = y * y % p
+    n = len(msgs)
+    mp = backend.mpz(p)
+    tg = FixedBase(g, p)
+
+    def zq():
+        return rand_q(q)
+
+    hs = generators(p, n + 1)
+    h, hs = hs[0], hs[1:]
+
+    # commitment to the permutation
+    r = [zq() for i in range(n)]
+    c = [None] * n
+    for i in range(n):
+        j = perm[i]
+        c[j] = int((tg.pow(r[j]) * hs[i]) % mp)
+
+    seed = digest(*zip(*e), *zip(*e2), c, pk)
+    u = [challenge(seed, i) for i in range(n)]
+    u2 = [u[perm[i]] for i in range(n)]
+
+    # commitment chain
+    rhat = [zq() for i in range(n)]
+    chat = []
+    prev = h
+    for i in range(n):
+        prev = int((tg.pow(rhat[i]) * backend.powmod(prev, u2[i], mp)) % mp)
+        chat.append(prev)
+
+    w1, w2, w3, w4 = zq(), zq(), zq(), zq()
+    what = [zq() for i in range(n)]
+    wprime = [_random.getrandbits(2 * CHALLENGE_BITS + HIDING_BITS) for i in range(n)]
+
+    t = [
+        int(tg.pow(w1)),
+        int(tg.pow(w2)),
+        int((tg.pow(w3) * multi_exp(hs, wprime, p)) % mp),
+        int((tg.pow(q - w4) * multi_exp([a for a, b in e2], wprime, p)) % mp),
+        int((backend.powmod(y2, q - w4, mp) * multi_exp([b for a, b in e2], wprime, p)) % mp),
+    ]
+    that = []
+    for i in range(n):
+        prev = chat[i - 1] if i else h
+        that.append(int((tg.pow(what[i]) * backend.powmod(prev, wprime[i], mp)) % mp))
+
+    ch = challenge(digest(*zip(*e), *zip(*e2), c, chat, pk, t, that))
+
+    v = [1] * n
+    for i in range(n - 1, 0, -1):
+        v[i - 1] = (u2[i] * v[i]) % q
+
+    s = [
+        (w1 + ch * sum(r)) % q,
+        (w2 + ch * sum(ri * vi for ri, vi in zip(rhat, v))) % q,
+        (w3 + ch * sum(ri * ui for ri, ui in zip(r, u))) % q,
+        (w4 + ch * sum(ri * ui for ri, ui in zip(rs, u2))) % q,
+    ]
+
+    return {
+        'commitments': c,
+        'chain': chat,
+        't': t,
+        'that': that,
+        's': s,
+        'shat': [(wi + ch * ri) % q for wi, ri in zip(what, rhat)],
+        'sprime': [wi + ch * ui for wi, ui in zip(wprime, u2)],
+    }
+
+
+def verify(msgs, shuffled, proof, pk):
+    '''
+    Checks the proof that shuffled is a shuffle of msgs, returns a bool
+    '''
+
+    try:
+        return _verify(msgs, shuffled, proof, pk)
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return False
+
+
+def _verify(msgs, shuffled, proof, pk):
+    p, q, g, y = group(pk)
+    e, e2 = statement(msgs, p), statement(shuffled, p)
+    y2 = y * y % p
+    n = len(msgs)
+    mp = backend.mpz(p)
+
+    c, chat, t, that = proof['commitments'], proof['chain'], proof['t'], proof['that']
+    s, shat, sprime = proof['s'], proof['shat'], proof['sprime']
+    if len(e2) != n or len(t) != 5 or len(s) != 4:
+        return False
+    if any(len(proof[f]) != n for f in FIELDS):
+        return False
+
+    # the group elements of the proof and the ciphertexts must be in the
+    # subgroup, for the batch check and the soundness of the proof. b too,
+    # so the b^2 of the statement is a bijection
+    elements = c + chat + that + t + [int(i) for m in list(msgs) + list(shuffled) for i in m]
+    if not all(0 < i < p for i in elements):
+        return False
+    if not_in_subgroup(elements, p, q):
+        return False
+    bound = 1 << (2 * CHALLENGE_BITS + HIDING_BITS + 1)
+    if not all(0 <= i < q for i in s + shat) or not all(0 <= i < bound for i in sprime):
+        return False
+
+    hs = generators(p, n + 1)
+    h, hs = hs[0], hs[1:]
+    seed = digest(*zip(*e), *zip(*e2), c, pk)
+    u = [challenge(seed, i) for i in range(n)]
+    ch = challenge(digest(*zip(*e), *zip(*e2), c, chat, pk, t, that))
+    cu = [ch * ui for ui in u]
+
+    def pow(b, x):
+        return backend.powmod(b, x, mp)
+
+    def prod(values):
+        r = backend.mpz(1)
+        for v in values:
+            r = (r * v) % mp
+        return r
+
+    # t1 * (prod(c) / prod(h))^ch == g^s1
+    cbar = (prod(c) * backend.invert(prod(hs), mp)) % mp
+    if (t[0] * pow(cbar, ch)) % mp != pow(g, s[0]):
+        return False
+
+    # t2 * (chat_n / h^prod(u))^ch == g^s2
+    uprod = 1
+    for ui in u:
+        uprod = (uprod * ui) % q
+    clast = (chat[-1] * backend.invert(pow(h, uprod), mp)) % mp
+    if (t[1] * pow(clast, ch)) % mp != pow(g, s[1]):
+        return False
+
+    # t3 * prod(c^u)^ch == g^s3 * prod(h^s')
+    if (t[2] * multi_exp(c, cu, p)) % mp != (pow(g, s[2]) * multi_exp(hs, sprime, p)) % mp:
+        return False
+
+    # t4 * prod(e^u)^ch * (g, y2)^s4 == prod(e2^s')
+    if ((t[3] * multi_exp([a for a, b in e], cu, p) * pow(g, s[3])) % mp !=
+            multi_exp([a for a, b in e2], sprime, p)):
+        return False
+    if ((t[4] * multi_exp([b for a, b in e], cu, p) * pow(y2, s[3])) % mp !=
+            multi_exp([b for a, b in e2], sprime, p)):
+        return False
+
+    # that_i * chat_i^ch == g^shat_i * chat_(i-1)^s'_i, all of them at once
+    # with random exponents l_i
+    ls = [_random.getrandbits(64) | 1 for i in range(n)]
+    left = (multi_exp(that, ls, p) * multi_exp(chat, [ch * l for l in ls], p)) % mp
+    prevs = [h] + chat[:-1]
+    gexp = sum(l * si for l, si in zip(ls, shat)) % q
+    right = (pow(g, gexp) * multi_exp(prevs, [l * si for l, si in zip(ls, sprime)], p)) % mp
+    return left == right
+
+
+def verify_cascade(msgs, steps, pk):
+    '''
+    Checks a cascade of shuffles, steps is a list of (shuffled, proof) of
+    each auth, in order, and the input of each one is the output of the
+    previous one. Returns the index of the first invalid step, or -1.
+    '''
+
+    for i, (shuffled, proof) in enumerate(steps):
+        if not verify(msgs, shuffled, proof, pk):
+            return i
+        msgs = shuffled
+    return -1
+
+
+def dumps(proof):
+    msgs = [int(i) for f in FIELDS for i in proof[f]]
+    return wire.dumps({'msgs': msgs, 't': proof['t'], 's': proof['s']})
+
+
+def loads(data):
+    data = wire.loads(data)
+    msgs = data.pop('msgs')
+    n = len(msgs) // len(FIELDS)
+    for i, f in enumerate(FIELDS):
+        data[f] = msgs[i * n:(i + 1) * n]
+    return data
+
+
+def decrypted_values(decrypted):
+    '''
+    The b / a^x of each ciphertext, the output of a decrypt is a list of
+    them or of (a, b / a^x) if it isn't the last auth
+    '''
+
+    return [int(m[1]) if isinstance(m, (list, tuple)) else int(m) for m in decrypted]
+
+
+def prove_factors(alphas, factors, x, pk):
+    '''
+    Proof that factors[i] is alphas[i]^x, for the key share y = g^x in pk.
+
+    The statement is combined with random exponents l_i, hashes of the
+    whole statement, into A = prod(alphas^l) and D = prod(factors^l), and a
+    Chaum-Pedersen proof shows that log_g(y) = log_A(D). If any factor is
+    wrong, D isn't A^x but with probability 2^-CHALLENGE_BITS, so a single
+    proof of two elements covers the whole batch.
+    '''
+
+    p, q, g, y = group(pk)
+    seed = digest(alphas, factors, pk)
+    ls = [challenge(seed, i) for i in range(len(alphas))]
+    A = multi_exp(alphas, ls, p)
+    return _dleq(p, q, g, y, A, backend.powmod(A, int(x), p), int(x), seed)
+
+
+def verify_factors(alphas, factors, proof, pk):
+    '''
+    Checks a prove_factors proof, returns a bool
+    '''
+
+    try:
+        p, q, g, y = group(pk)
+        alphas, factors = [int(a) for a in alphas], [int(f) for f in factors]
+        if len(alphas) != len(factors) or not all(0 < i < p for i in alphas + factors):
+            return False
+        if not_in_subgroup(alphas + factors, p, q):
+            return False
+
+        seed = digest(alphas, factors, pk)
+        ls = [challenge(seed, i) for i in range(len(alphas))]
+        A, D = multi_exp(alphas, ls, p), multi_exp(factors, ls, p)
+        return _dleq_check(p, q, g, y, A, D, seed, proof)
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def prove_decryption(msgs, decrypted, x, pk):
+    '''
+    Proof that each decrypted b' is b / a^x of the (a, b) in msgs, for the
+    key share y = g^x in pk. It's the proof of prove_factors for the
+    factors b / b', that the prover doesn't need to compute.
+    '''
+
+    p, q, g, y = group(pk)
+    alphas = [int(a) for a, b in msgs]
+    seed = digest(alphas, [b for a, b in msgs], decrypted_values(decrypted), pk)
+    ls = [challenge(seed, i) for i in range(len(alphas))]
+    A = multi_exp(alphas, ls, p)
+    return _dleq(p, q, g, y, A, backend.powmod(A, int(x), p), int(x), seed)
+
+
+def verify_decryption(msgs, decrypted, proof, pk):
+    '''
+    Checks a prove_decryption proof, returns a bool.
+
+    D = prod((b / b')^l) is computed as prod(b^l) / prod(b'^l), so the
+    whole check is three multi-exponentiations and a few exponentiations.
+    '''
+
+    try:
+        p, q, g, y = group(pk)
+        alphas = [int(a) for a, b in msgs]
+        betas = [int(b) for a, b in msgs]
+        values = decrypted_values(decrypted)
+        if len(values) != len(msgs) or not all(0 < i < p for i in alphas + betas + values):
+            return False
+        if any(isinstance(m, (list, tuple)) and int(m[0]) != a
+               for m, a in zip(decrypted, alphas)):
+            return False
+
+        # b / b' = a^x must be in the subgroup, so b and b' have the same
+        # Legendre symbol, whatever the plaintext
+        if not_in_subgroup(alphas, p, q):
+            return False
+        if any(backend.jacobi(b, p) != backend.jacobi(v, p) for b, v in zip(betas, values)):
+            return False
+
+        seed = digest(alphas, betas, values, pk)
+        ls = [challenge(seed, i) for i in range(len(alphas))]
+        A = multi_exp(alphas, ls, p)
+        D = (multi_exp(betas, ls, p) * backend.invert(multi_exp(values, ls, p), p)) % p
+        return _dleq_check(p, q, g, y, A, int(D), seed, proof)
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return False
+
+
+def _dleq(p, q, g, y, A, D, x, seed):
+    w = rand_q(q)
+    t = [int(backend.powmod(g, w, p)), int(backend.powmod(A, w, p))]
+    c = challenge(seed + digest([y, A, D], t))
+    return {'t': t, 's': (w + c * x) % q}
+
+
+def _dleq_check(p, q, g, y, A, D, seed, proof):
+    t, s = [int(i) for i in proof['t']], int(proof['s'])
+    if len(t) != 2 or not all(0 < i < p for i in t) or not 0 <= s < q:
+        return False
+    if not_in_subgroup(t, p, q):
+        return False
+
+    c = challenge(seed + digest([y, A, D], t))
+    return (backend.powmod(g, s, p) == (t[0] * backend.powmod(y, c, p)) % p and
+            backend.powmod(A, s, p) == (t[1] * backend.powmod(D, c, p)) % p)
+
+def encrypt_vector(votes, pk):
+    '''
+    Encrypts g^v for each v of votes, 0 or 1, and returns the vector of
+    ciphertexts and its prove_vector proof. The booth does the same in
+    javascript, decideEncryptVector.
+    '''
+
+    p, q, g, y = group(pk)
+    rs = [rand_q(q) for v in votes]
+    vector = [(int(backend.powmod(g, r, p)),
+               int((backend.powmod(y, r, p) * backend.powmod(g, v, p)) % p))
+              for v, r in zip(votes, rs)]
+    return vector, prove_vector(vector, votes, rs, sum(votes), pk)
+
+
+def prove_vector(vector, votes, rs, max_selections, pk):
+    '''
+    Proof that each (a, b) of vector encrypts g^0 or g^1, and that their
+    product encrypts g^k with k <= max_selections, for the votes and the
+    random exponents rs of the encryption.
+
+    Each one is a disjunctive Chaum-Pedersen proof, that log_g(a) is
+    log_y(b / g^j) for some j in range(n): the proof for the real j and
+    simulated ones for the rest, with challenges that add up to the hash
+    of the commitments. The hash is of the decimal numbers joined with
+    commas, so the booth can compute it.
+    '''
+
+    p, q, g, y = group(pk)
+    options = [_prove_range(p, q, g, y, int(a), int(b), r, v, 2)
+               for (a, b), v, r in zip(vector, votes, rs)]
+    a, b = _product(vector, p)
+    total = _prove_range(p, q, g, y, a, b, sum(rs), sum(votes), max_selections + 1)
+    return {'options': options, 'sum': total}
+
+
+def verify_vector(vector, proof, max_selections, pk):
+    '''
+    Checks a prove_vector proof, returns a bool
+    '''
+
+    try:
+        p, q, g, y = group(pk)
+        vector = [(int(a), int(b)) for a, b in vector]
+        values = [v for m in vector for v in m]
+        if len(proof['options']) != len(vector) or not all(0 < v < p for v in values):
+            return False
+        if not_in_subgroup(values, p, q):
+            return False
+
+        for (a, b), option in zip(vector, proof['options']):
+            if not _check_range(p, q, g, y, a, b, 2, option):
+                return False
+        a, b = _product(vector, p)
+        return _check_range(p, q, g, y, a, b, int(max_selections) + 1, proof['sum'])
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def _product(vector, p):
+    a, b = 1, 1
+    for ai, bi in vector:
+        a, b = (a * int(ai)) % p, (b * int(bi)) % p
+    return a, b
+
+
+def _range_challenge(p, q, g, y, a, b, commitments):
+    text = ','.join(str(int(i)) for i in [p, g, y, a, b] + commitments)
+    return int(hashlib.sha256(text.encode()).hexdigest(), 16) % q
+
+
+def _range_commitment(p, q, g, y, a, b, j, c, s):
+    # g^s / a^c and y^s / (b / g^j)^c, the inverses as powers of q - c
+    bj = (b * backend.powmod(g, q - j, p)) % p
+    return [int((backend.powmod(g, s, p) * backend.powmod(a, (q - c) % q, p)) % p),
+            int((backend.powmod(y, s, p) * backend.powmod(bj, (q - c) % q, p)) % p)]
+
+
+def _prove_range(p, q, g, y, a, b, r, v, n):
+    if not 0 <= v < n:
+        raise ValueError('The plaintext is out of the range')
+
+    cs, ss, commitments = [0] * n, [0] * n, []
+    w = rand_q(q)
+    for j in range(n):
+        if j == v:
+            commitments += [int(backend.powmod(g, w, p)), int(backend.powmod(y, w, p))]
+        else:
+            cs[j], ss[j] = rand_q(q), rand_q(q)
+            commitments += _range_commitment(p, q, g, y, a, b, j, cs[j], ss[j])
+
+    cs[v] = (_range_challenge(p, q, g, y, a, b, commitments) - sum(cs)) % q
+    ss[v] = (w + cs[v] * r) % q
+    return cs + ss
+
+
+def _check_range(p, q, g, y, a, b, n, proof):
+    proof = [int(i) for i in proof]
+    if len(proof) != 2 * n or not all(0 <= i < q for i in proof):
+        return False
+
+    cs, ss = proof[:n], proof[n:]
+    commitments = []
+    for j in range(n):
+        commitments += _range_commitment(p, q, g, y, a, b, j, cs[j], ss[j])
+    return sum(cs) % q == _range_challenge(p, q, g, y, a, b, commitments)
@@ -0,0 +1,107 @@
+'''
+On-disk storage for the ciphertexts of a chunked shuffle.
+
+Ciphertexts are stored as fixed-width big endian pairs, so each chunk is
+written at its own offset as soon as it's processed, whatever the order
+the chunks arrive in, and the whole list can be read back with random
+access without loading it in memory.
+'''
+
+import mmap
+import os
+import shutil
+
+
+class Spool:
+
+    def __init__(self, path, width):
+        self.path = path
+        self.width = width
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def pack(self, msgs):
+        w = self.width
+        return b''.join(int(a).to_bytes(w, 'big') + int(b).to_bytes(w, 'big')
+                        for a, b in msgs)
+
+    def unpack(self, data):
+        w = self.width
+        return [(int.from_bytes(data[i:i + w], 'big'),
+                 int.from_bytes(data[i + w:i + 2 * w], 'big'))
+                for i in range(0, len(data), 2 * w)]
+
+    def write(self, name, offset, msgs):
+        os.makedirs(self.path, exist_ok=True)
+        fd = os.open(self.file(name), os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            os.pwrite(fd, self.pack(msgs), offset * 2 * self.width)
+        finally:
+            os.close(fd)
+
+    def read(self, name, offset, size):
+        with open(self.file(name), 'rb') as f:
+            f.seek(offset * 2 * self.width)
+            return self.unpack(f.read(size * 2 * self.width))
+
+    def sequence(self, name, n):
+        return SpoolSequence(self, name, n)
+
+    def received(self, offset, n):
+        '''
+        Marks the n ciphertexts from offset as received and returns how
+        many ciphertexts have been received in total.
+        '''
+
+        os.makedirs(self.path, exist_ok=True)
+        open(self.file('received-{}-{}'.format(offset, n)), 'w').close()
+        return sum(int(f.split('-')[2]) for f in os.listdir(self.path)
+                   if f.startswith('received-'))
+
+    def claim(self, name):
+        '''
+        Returns True only for the first caller with this name, useful to
+        do something once when chunks are received concurrently.
+        '''
+
+        try:
+            os.close(os.open(self.file(name), os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return False
+        return True
+
+    def remove(self, name=None):
+        if name:
+            os.remove(self.file(name))
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class SpoolSequence:
+    '''
+    Read only sequence of the n first ciphertexts of a spool file,
+    memory-mapped so only the pages used are loaded.
+    '''
+
+    def __init__(self, spool, name, n):
+        self.width = spool.width
+        self.n = n
+        self.f = open(spool.file(name), 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        w = self.width
+        o = i * 2 * w
+        return (int.from_bytes(self.mm[o:o + w], 'big'),
+                int.from_bytes(self.mm[o + w:o + 2 * w], 'big'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.mm.close()
+        self.f.close()
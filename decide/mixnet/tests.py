@@ -1,12 +1,31 @@
+import doctest
+import os
+import tempfile
+import unittest
+from unittest import mock
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+from django.test import override_settings
 from django.conf import settings
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
+from mixnet import backend
+from mixnet import ec
+from mixnet import mixcrypt
+from mixnet import proofs
 from mixnet.mixcrypt import MixCrypt
 from mixnet.mixcrypt import ElGamal
+from mixnet.models import Mixnet, Group, ShuffleProof, DecryptProof
 
 from base import mods
+from base import wire
+from base.models import Key
+from voting.models import Question, Voting
 
 
 class MixnetCase(APITestCase):
@@ -26,6 +45,55 @@ class MixnetCase(APITestCase):
         cipher = [k.encrypt(i) for i in msgs]
         return cipher
 
+    def create_two_auths(self, clear, mode=None):
+        '''
+        Creates the mixnet of voting 1 with two auths, both of them in this
+        test db, and returns its public key and the clear messages
+        encrypted with it
+        '''
+
+        data = {
+            "voting": 1,
+            "voting_url": "http://localhost:8000",
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        if mode:
+            data["key"] = { "p": 0, "g": 0, "mode": mode }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+
+        pk = key["p"], key["g"], key["y"]
+        if key["mode"] == Key.EC:
+            k = ec.ECMixCrypt()
+            k.k = ec.ECKey(*pk)
+        else:
+            k = MixCrypt(bits=settings.KEYBITS, mode=key["mode"])
+            k.k = ElGamal.construct(pk)
+        return key, [k.encrypt(m) for m in clear]
+
+    def shuffle_chunks(self, encrypt, key, size=4):
+        '''
+        Sends a chunked shuffle to the first of two auths and returns the
+        output of the second one
+        '''
+
+        for offset in range(0, len(encrypt), size):
+            data = {
+                "msgs": encrypt[offset:offset + size],
+                "pk": key,
+                "session": "s1",
+                "offset": offset,
+                "total": len(encrypt),
+            }
+            response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.json()["position"], 1)
+
+        url = '/mixnet/shuffle/1/?session=s1&position=1&offset=0&size={}'
+        return self.client.get(url.format(len(encrypt)), format='json').json()
+
     def test_create(self):
         data = {
             "voting": 1,
@@ -44,6 +112,62 @@ class MixnetCase(APITestCase):
         self.assertEqual(type(key["p"]), int)
         self.assertEqual(type(key["y"]), int)
 
+    def test_create_modes(self):
+        self.test_create()
+        self.assertEqual(self.key["mode"], settings.KEYMODE)
+
+        data = {
+            "voting": 2,
+            "auths": [ { "name": "auth1", "url": "http://localhost:8000" } ],
+            "key": { "p": self.key["p"], "g": self.key["g"], "mode": "full" },
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["mode"], "full")
+        self.assertEqual(Mixnet.objects.get(voting_id=2).key.mode, "full")
+
+        data["voting"], data["key"]["mode"] = 3, "other"
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(KEYMODE='qr')
+    def test_decrypt_qr(self):
+        self.test_create()
+        self.assertEqual(self.key["mode"], "qr")
+
+        p, g, y = pk = self.key["p"], self.key["g"], self.key["y"]
+        k = MixCrypt(bits=settings.KEYBITS, mode=mixcrypt.QR)
+        k.k = ElGamal.construct(pk)
+        clear = list(range(2, 15))
+        encrypt = [k.encrypt(m) for m in clear]
+        self.assertEqual(mixcrypt.check_ciphertexts(encrypt, p, g, exponential=True), [])
+
+        mn = Mixnet.objects.get(voting_id=1)
+        self.assertLessEqual(int(mn.key.x).bit_length(),
+                             mixcrypt.exponent_bits(p, mixcrypt.QR))
+
+        response = self.client.post('/mixnet/shuffle/1/', { "msgs": encrypt }, format='json')
+        shuffled = response.json()
+        response = self.client.post('/mixnet/decrypt/1/', { "msgs": shuffled }, format='json')
+        self.assertEqual(response.status_code, 200)
+        clear2 = [mixcrypt.decode(m, p) for m in response.json()]
+        self.assertEqual(sorted(clear), sorted(clear2))
+
+    def test_create_group(self):
+        call_command('fillgroups', stock=1, stdout=StringIO())
+        group = Group.objects.get(bits=settings.KEYBITS)
+
+        self.test_create()
+        self.assertEqual(self.key["p"], int(group.p))
+        self.assertEqual(self.key["g"], int(group.g))
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            f.write('[{"p": 167, "g": 156}, {"p": 169, "g": 2}]')
+            f.flush()
+            with self.assertRaises(CommandError):
+                call_command('fillgroups', file=f.name, stdout=StringIO())
+        self.assertTrue(Group.objects.filter(bits=8).exists())
+
     def test_shuffle(self):
         self.test_create()
 
@@ -61,6 +185,31 @@ class MixnetCase(APITestCase):
 
         self.assertNotEqual(shuffled, encrypt)
 
+    def test_shuffle_binary(self):
+        self.test_create()
+
+        clear = [2, 3, 4, 5]
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+        data = {
+            "msgs": encrypt,
+            "pk": self.key
+        }
+
+        response = self.client.post('/mixnet/shuffle/1/', wire.dumps(data),
+                                    content_type=wire.MEDIA_TYPE,
+                                    HTTP_ACCEPT=wire.accept(compress=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], wire.MEDIA_TYPE)
+
+        shuffled = wire.loads(response.content)
+        self.assertEqual(len(shuffled), len(encrypt))
+        self.assertNotEqual(shuffled, encrypt)
+
+        data = { "msgs": shuffled, "pk": self.key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
     def test_shuffle2(self):
         self.test_create()
 
@@ -102,6 +251,182 @@ class MixnetCase(APITestCase):
 
         self.assertEqual(sorted(clear), sorted(clear2))
 
+    @override_settings(MIXNET_PROCESSES=2)
+    def test_decrypt_parallel(self):
+        self.test_create()
+
+        clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        data = { "msgs": encrypt }
+
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        shuffled = response.json()
+        self.assertNotEqual(shuffled, encrypt)
+
+        data = { "msgs": shuffled }
+
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        clear2 = response.json()
+
+        self.assertEqual(sorted(clear), sorted(clear2))
+
+    def test_shuffle_pool(self):
+        with self.settings(MIXNET_POOL_DIR=tempfile.mkdtemp()):
+            self.test_create()
+            call_command('fillpool', 1, stock=10, stdout=StringIO())
+
+            response = self.client.get('/mixnet/pool/1/', format='json')
+            self.assertEqual(response.status_code, 200)
+            stats = response.json()[0]
+            self.assertEqual(stats['size'], 10)
+            self.assertEqual(stats['remaining'], 10)
+
+            clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
+            pk = self.key["p"], self.key["g"], self.key["y"]
+            encrypt = self.encrypt_msgs(clear, pk)
+
+            data = { "msgs": encrypt }
+            response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            self.assertEqual(response.status_code, 200)
+            shuffled = response.json()
+
+            stats = Mixnet.objects.get(voting_id=1).pool().stats()
+            self.assertEqual(stats['used'], 10)
+            self.assertEqual(stats['remaining'], 0)
+
+            data = { "msgs": shuffled }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(sorted(clear), sorted(response.json()))
+
+    def test_multiple_auths_pool(self):
+        clear = [2, 3, 4, 5, 6, 7, 8]
+        key, encrypt = self.create_two_auths(clear)
+
+        # the second auth takes the voting key from the voting
+        mn = Mixnet.objects.get(voting_id=1, auth_position=1)
+        self.assertEqual(mn.voting_url, "http://localhost:8000")
+        q = Question.objects.create(desc='test question')
+        Voting.objects.create(id=1, name='test voting', question=q,
+                              pub_key=Key.objects.create(p=key["p"], g=key["g"], y=key["y"]))
+
+        with self.settings(MIXNET_POOL_DIR=tempfile.mkdtemp(),
+                           MIXNET_CHECKPOINT_DIR=tempfile.mkdtemp()):
+            call_command('fillpool', 1, stock=7, stdout=StringIO())
+            response = self.client.get('/mixnet/pool/1/', format='json')
+            self.assertEqual([s['remaining'] for s in response.json()], [7, 7])
+
+            data = { "msgs": encrypt, "pk": key }
+            response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            shuffled = response.json()
+            for mn in Mixnet.objects.filter(voting_id=1):
+                self.assertEqual(mn.pool().stats()['used'], 7)
+
+            data = { "msgs": shuffled, "pk": key }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(sorted(clear), sorted(response.json()))
+
+            # a pool for the key share of the second auth
+            mn = Mixnet.objects.get(voting_id=1, auth_position=1)
+            mn.pool().fill(mn.share(), 7)
+            response = self.client.get('/mixnet/pool/1/', format='json')
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['position'], 1)
+
+            # the shuffle goes on without it
+            data = { "msgs": encrypt, "pk": key }
+            with self.assertLogs('mixnet.models', 'WARNING'):
+                response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mn.pool().stats()['used'], 0)
+            data = { "msgs": response.json(), "pk": key }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(sorted(clear), sorted(response.json()))
+
+            # fillpool replaces it
+            call_command('fillpool', 1, stock=7, stdout=StringIO())
+            response = self.client.get('/mixnet/pool/1/', format='json')
+            self.assertEqual(response.status_code, 200)
+
+    def test_shuffle_chunked(self):
+        with self.settings(MIXNET_SPOOL_DIR=tempfile.mkdtemp(), MIXNET_CHUNK_SIZE=4):
+            self.test_create()
+
+            clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+            pk = self.key["p"], self.key["g"], self.key["y"]
+            encrypt = self.encrypt_msgs(clear, pk)
+
+            # chunks don't need to arrive in order
+            for offset in [4, 0, 8]:
+                data = {
+                    "msgs": encrypt[offset:offset + 4],
+                    "session": "s1",
+                    "offset": offset,
+                    "total": len(encrypt),
+                }
+                response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+                self.assertEqual(response.status_code, 200)
+            result = response.json()
+            self.assertEqual(result["total"], len(encrypt))
+            self.assertEqual(result["position"], 0)
+
+            url = '/mixnet/shuffle/1/?session=s1&position=0&offset={}&size=4'
+            shuffled = []
+            for offset in [0, 4, 8]:
+                response = self.client.get(url.format(offset), format='json')
+                self.assertEqual(response.status_code, 200)
+                shuffled += response.json()
+            self.assertEqual(len(shuffled), len(encrypt))
+            self.assertNotEqual(shuffled, encrypt)
+
+            data = { "msgs": shuffled }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(sorted(clear), sorted(response.json()))
+
+            data = { "session": "s1", "position": 0 }
+            response = self.client.delete('/mixnet/shuffle/1/', data, format='json')
+            self.assertEqual(response.status_code, 204)
+            response = self.client.get(url.format(0), format='json')
+            self.assertEqual(response.status_code, 404)
+
+    def test_multiple_auths_chunked(self):
+        clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+        key, encrypt = self.create_two_auths(clear)
+
+        with self.settings(MIXNET_SPOOL_DIR=tempfile.mkdtemp(), MIXNET_CHUNK_SIZE=4):
+            shuffled = self.shuffle_chunks(encrypt, key)
+
+        data = { "msgs": shuffled, "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+    def test_multiple_auths_ec(self):
+        clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+        key, encrypt = self.create_two_auths(clear, Key.EC)
+        self.assertEqual((key["mode"], key["p"], key["g"]), ("p256", ec.P, ec.G))
+
+        with self.settings(MIXNET_SPOOL_DIR=tempfile.mkdtemp(), MIXNET_CHUNK_SIZE=4,
+                           MIXNET_POOL_DIR=tempfile.mkdtemp(), MIXNET_PROCESSES=2):
+            Mixnet.objects.get(voting_id=1, auth_position=0).pool().fill(
+                (key["p"], key["g"], key["y"]), 4, mixcrypt.EC)
+            shuffled = self.shuffle_chunks(encrypt, key)
+            self.assertEqual(Mixnet.objects.get(voting_id=1, auth_position=0).pool().stats()['used'], 4)
+
+            data = { "msgs": shuffled, "pk": key }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(sorted(clear), sorted(ec.plaintext(m) for m in response.json()))
+
+            factors = []
+            for position in [0, 1]:
+                data = { "msgs": [a for a, b in shuffled], "position": position }
+                response = self.client.post('/mixnet/factors/1/', data, format='json')
+                factors.append(response.json())
+            decrypted = ec.combine_factors(shuffled, factors)
+            self.assertEqual(sorted(clear), sorted(ec.plaintext(m) for m in decrypted))
+
     def test_multiple_auths(self):
         '''
         This test emulates a two authorities shuffle and decryption.
@@ -158,24 +483,179 @@ class MixnetCase(APITestCase):
         self.assertNotEqual(clear, clear2)
         self.assertEqual(sorted(clear), sorted(clear2))
 
-    def test_multiple_auths_mock(self):
-        '''
-        This test emulates a two authorities shuffle and decryption.
-        '''
+    def test_multiple_auths_factors(self):
+        clear = [2, 3, 4, 5, 6, 7, 8]
+        key, encrypt = self.create_two_auths(clear)
+        alphas = [a for a, b in encrypt]
 
+        factors = []
+        for position in [0, 1]:
+            data = { "msgs": alphas, "position": position }
+            response = self.client.post('/mixnet/factors/1/', data, format='json')
+            self.assertEqual(response.status_code, 200)
+            factors.append(response.json())
+
+        self.assertEqual(clear, mixcrypt.combine_factors(encrypt, factors, key["p"]))
+
+        with self.settings(MIXNET_PROCESSES=2):
+            response = self.client.post('/mixnet/factors/1/', data, format='json')
+            self.assertEqual(response.json(), factors[1])
+
+    @override_settings(MIXNET_PARALLEL_KEYS=True)
+    def test_multiple_auths_parallel_keys(self):
         data = {
             "voting": 1,
             "auths": [
                 { "name": "auth1", "url": "http://localhost:8000" },
                 { "name": "auth2", "url": "http://127.0.0.1:8000" },
+                { "name": "auth3", "url": "http://127.0.0.2:8000" },
             ]
         }
-        response = self.client.post('/mixnet/', data, format='json')
+        # the test client can't be used from other threads
+        with mock.patch.object(mods, 'is_local', return_value=True):
+            response = self.client.post('/mixnet/', data, format='json')
         key = response.json()
+
+        mns = Mixnet.objects.filter(voting_id=1).order_by('auth_position')
+        self.assertEqual([mn.auth_position for mn in mns], [0, 1, 2])
+        self.assertEqual([mn.auths.count() for mn in mns], [3, 2, 1])
+        y = 1
+        for mn in mns:
+            y = y * mn.key.y % key["p"]
+        self.assertEqual(key["y"], y)
+
+        clear = [2, 3, 4, 5, 6, 7, 8]
+        pk = key["p"], key["g"], key["y"]
+        data = { "msgs": self.encrypt_msgs(clear, pk), "pk": key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        data = { "msgs": response.json(), "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+    def test_multiple_auths_resumed(self):
+        clear = [2, 3, 4, 5, 6, 7, 8]
+        key, encrypt = self.create_two_auths(clear)
+        data = { "msgs": encrypt, "pk": key }
+
+        shuffle = Mixnet.shuffle
+
+        def second_fails(mn, *args, **kwargs):
+            if mn.auth_position == 1:
+                raise RuntimeError('auth2 is down')
+            return shuffle(mn, *args, **kwargs)
+
+        def first_done(mn, *args, **kwargs):
+            if mn.auth_position == 0:
+                raise AssertionError('auth1 shuffled again')
+            return shuffle(mn, *args, **kwargs)
+
+        checkpoints = tempfile.mkdtemp()
+        with self.settings(MIXNET_CHECKPOINT_DIR=checkpoints):
+            with mock.patch.object(Mixnet, 'shuffle', second_fails):
+                with self.assertRaises(RuntimeError):
+                    self.client.post('/mixnet/shuffle/1/', data, format='json')
+            self.assertEqual(len(os.listdir(checkpoints)), 1)
+
+            # the first auth returns the saved output
+            with mock.patch.object(Mixnet, 'shuffle', first_done):
+                response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            self.assertEqual(response.status_code, 200)
+            shuffled = response.json()
+            self.assertEqual(os.listdir(checkpoints), [])
+
+            data = { "msgs": shuffled, "pk": key }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(sorted(clear), sorted(response.json()))
+
+    def test_checkpoints_disabled(self):
+        clear = [2, 3, 4, 5, 6, 7, 8]
+        key, encrypt = self.create_two_auths(clear)
         pk = key["p"], key["g"], key["y"]
+        first, last = Mixnet.objects.filter(voting_id=1).order_by('auth_position')
+
+        # the last auth has no next auth to fail
+        self.assertTrue(first.checkpoint("shuffle", encrypt, pk).path)
+        self.assertIsNone(last.checkpoint("shuffle", encrypt, pk).path)
+
+        with self.settings(MIXNET_CHECKPOINT_DIR=None):
+            self.assertIsNone(first.checkpoint("shuffle", encrypt, pk).path)
+
+            data = { "msgs": encrypt, "pk": key }
+            response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            data = { "msgs": response.json(), "pk": key }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(sorted(clear), sorted(response.json()))
+
+    @override_settings(MIXNET_SHUFFLE_PROOFS=True)
+    def test_multiple_auths_proofs(self):
+        # the proof doesn't bind the b of FULL keys
+        data = { "voting": 2, "auths": [ { "name": "auth1", "url": "http://localhost:8000" } ] }
+        with self.settings(KEYMODE='full'):
+            response = self.client.post('/mixnet/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+            with self.settings(MIXNET_SHUFFLE_PROOFS=False):
+                self.client.post('/mixnet/', data, format='json')
+        response = self.client.post('/mixnet/shuffle/2/', { "msgs": [[2, 3]] }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        clear = [2, 3, 4, 5, 6, 7, 8]
+        key, encrypt = self.create_two_auths(clear, Key.QR)
+        data = { "msgs": encrypt, "pk": key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        shuffled = response.json()
+
+        data = { "msgs": shuffled, "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        decrypted = [mixcrypt.decode(m, key["p"]) for m in response.json()]
+        self.assertEqual(sorted(clear), sorted(decrypted))
+
+        self.assertEqual(ShuffleProof.objects.count(), 2)
+        out = StringIO()
+        call_command('verifyshuffles', 1, stdout=out)
+        self.assertIn('Voting 1: 2 shuffles verified', out.getvalue())
+
+        # the output of the last auth doesn't match its proof
+        sp = ShuffleProof.objects.get(mixnet__auth_position=1)
+        sp.shuffled = wire.dumps(shuffled[1:] + shuffled[:1])
+        sp.save()
+        with self.assertRaisesRegex(CommandError, 'position 1'):
+            call_command('verifyshuffles', 1, stdout=StringIO())
+
+    @override_settings(MIXNET_DECRYPT_PROOFS=True)
+    def test_multiple_auths_decrypt_proofs(self):
+        clear = [2, 3, 4, 5, 6, 7, 8]
+        key, encrypt = self.create_two_auths(clear)
+        data = { "msgs": encrypt, "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        # not shuffled again
+        self.assertEqual(clear, response.json())
+
+        data = { "msgs": [a for a, b in encrypt], "position": 1 }
+        response = self.client.post('/mixnet/factors/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(DecryptProof.objects.count(), 3)
+        self.assertEqual(DecryptProof.objects.filter(factors=True).count(), 1)
+        out = StringIO()
+        call_command('verifydecryptions', 1, stdout=out)
+        self.assertIn('Voting 1: 3 decryptions verified', out.getvalue())
+
+        # a wrong plaintext in the output of the last auth
+        dp = DecryptProof.objects.get(mixnet__auth_position=1, factors=False)
+        dp.decrypted = wire.dumps([9] + clear[1:])
+        dp.save()
+        with self.assertRaisesRegex(CommandError, 'position 1'):
+            call_command('verifydecryptions', 1, stdout=StringIO())
+
+    def test_multiple_auths_mock(self):
+        '''
+        This test emulates a two authorities shuffle and decryption.
+        '''
 
         clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
-        encrypt = self.encrypt_msgs(clear, pk)
+        key, encrypt = self.create_two_auths(clear)
 
         data = { "msgs": encrypt, "pk": key }
         response = self.client.post('/mixnet/shuffle/1/', data, format='json')
@@ -188,3 +668,29 @@ class MixnetCase(APITestCase):
 
         self.assertNotEqual(clear, clear1)
         self.assertEqual(sorted(clear), sorted(clear1))
+
+
+class MixcryptDoctestCase(TestCase):
+
+    def run_doctests(self, name):
+        backend.use(name)
+        mixcrypt.fixed_base_tables.cache_clear()
+        try:
+            results = [doctest.testmod(m) for m in (mixcrypt, proofs, ec)]
+        finally:
+            backend.use(backend.DEFAULT)
+            mixcrypt.fixed_base_tables.cache_clear()
+            ec.fixed_base.cache_clear()
+        self.assertEqual([r.failed for r in results], [0, 0, 0])
+
+    def test_python_backend(self):
+        self.run_doctests('python')
+
+    @unittest.skipUnless(backend.gmpy2, 'gmpy2 is not installed')
+    def test_gmpy2_backend(self):
+        self.run_doctests('gmpy2')
+
+    def test_backend_reported(self):
+        with self.assertLogs('mixnet', 'INFO') as logs:
+            apps.get_app_config('mixnet').ready()
+        self.assertIn(backend.NAME, logs.output[0])
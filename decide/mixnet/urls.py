@@ -9,4 +9,6 @@ urlpatterns = [
     path('', include(router.urls)),
     path('shuffle/<int:voting_id>/', views.Shuffle.as_view(), name='shuffle'),
     path('decrypt/<int:voting_id>/', views.Decrypt.as_view(), name='decrypt'),
+    path('factors/<int:voting_id>/', views.Factors.as_view(), name='factors'),
+    path('pool/<int:voting_id>/', views.Pool.as_view(), name='pool'),
 ]
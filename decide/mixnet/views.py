@@ -1,11 +1,13 @@
 from django.conf import settings
 from django.shortcuts import get_object_or_404
-from rest_framework import viewsets
+from rest_framework import status, viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .serializers import MixnetSerializer
 from .models import Auth, Mixnet, Key
+from .pool import PoolKeyError
+from base import wire
 from base.serializers import KeySerializer, AuthSerializer
 
 
@@ -22,15 +24,23 @@ class MixnetViewSet(viewsets.ModelViewSet):
 
          * auths: [ {"name": str, "url": str} ]
          * voting: id
+         * voting_url: str / nullable, where the auths get the voting key
          * position: int / nullable
-         * key: { "p": int, "g": int } / nullable
+         * key: { "p": int, "g": int, "mode": str } / nullable
+         * chain: bool / nullable, false to not call the next auths
         """
 
         auths = request.data.get("auths")
         voting = request.data.get("voting")
-        key = request.data.get("key", {"p": 0, "g": 0})
+        key = request.data.get("key", {"p": 0, "g": 0, "mode": settings.KEYMODE})
         position = request.data.get("position", 0)
         p, g = int(key["p"]), int(key["g"])
+        mode = key.get("mode", Key.FULL)
+        if mode not in dict(Key.MODES):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        if settings.MIXNET_SHUFFLE_PROOFS and mode != Key.QR:
+            return Response({'detail': 'Shuffle proofs need a QR key'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
         dbauths = []
         for auth in auths:
@@ -40,23 +50,32 @@ class MixnetViewSet(viewsets.ModelViewSet):
                                               me=isme)
             dbauths.append(a)
 
-        mn = Mixnet(voting_id=voting, auth_position=position)
+        mn = Mixnet(voting_id=voting, auth_position=position,
+                    voting_url=request.data.get("voting_url") or "")
         mn.save()
 
         for a in dbauths:
             mn.auths.add(a)
 
-        mn.gen_key(p, g)
+        mn.gen_key(p, g, mode)
 
-        data = { "key": { "p": mn.key.p, "g": mn.key.g } }
-        # chained call to the next auth to gen the key
-        resp = mn.chain_call("/", data)
-        if resp:
-            y = (resp["y"] * mn.key.y) % mn.key.p
+        data = { "key": { "p": mn.key.p, "g": mn.key.g, "mode": mn.key.mode } }
+        if not request.data.get("chain", True):
+            ys = []
+        elif settings.MIXNET_PARALLEL_KEYS:
+            # the next auths gen their keys at the same time
+            ys = mn.next_keys(data)
+        else:
+            # chained call to the next auth to gen the key
+            resp = mn.chain_call("/", data)
+            ys = [resp["y"]] if resp else []
+
+        if ys:
+            y = mn.crypt().join_keys(ys + [mn.key.y]).y
         else:
             y = mn.key.y
 
-        pubkey = Key(p=mn.key.p, g=mn.key.g, y=y)
+        pubkey = Key(p=mn.key.p, g=mn.key.g, y=y, mode=mn.key.mode)
         pubkey.save()
         mn.pubkey = pubkey
         mn.save()
@@ -65,6 +84,7 @@ class MixnetViewSet(viewsets.ModelViewSet):
 
 
 class Shuffle(APIView):
+    parser_classes = wire.PARSERS
 
     def post(self, request, voting_id):
         """
@@ -72,6 +92,12 @@ class Shuffle(APIView):
          * msgs: [ [int, int] ]
          * pk: { "p": int, "g": int, "y": int } / nullable
          * position: int / nullable
+
+        Chunked shuffle, msgs is a chunk of the whole list:
+
+         * session: str
+         * offset: int, position of the chunk in the list
+         * total: int, number of messages in the list
         """
 
         position = request.data.get("position", 0)
@@ -84,7 +110,25 @@ class Shuffle(APIView):
         else:
             p, g, y = mn.key.p, mn.key.g, mn.key.y
 
-        msgs = mn.shuffle(msgs, (p, g, y))
+        session = request.data.get("session", None)
+        if session:
+            if not str(session).isalnum():
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            return self.shuffle_chunk(request, mn, session, msgs, (p, g, y))
+
+        # the output of a previous try, if a later auth failed
+        checkpoint = mn.checkpoint("shuffle", msgs, (p, g, y))
+        shuffled = checkpoint.load()
+        if shuffled is None:
+            if settings.MIXNET_SHUFFLE_PROOFS and msgs:
+                if not mn.shuffle_provable():
+                    return Response({'detail': 'Shuffle proofs need a QR key'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                shuffled = mn.shuffle_proved(msgs, (p, g, y))
+            else:
+                shuffled = mn.shuffle(msgs, (p, g, y), processes=settings.MIXNET_PROCESSES)
+            checkpoint.save(shuffled)
+        msgs = shuffled
 
         data = {
             "msgs": msgs,
@@ -94,11 +138,105 @@ class Shuffle(APIView):
         resp = mn.chain_call("/shuffle/{}/".format(voting_id), data)
         if resp:
             msgs = resp
+        checkpoint.remove()
 
         return  Response(msgs)
 
+    def shuffle_chunk(self, request, mn, session, msgs, pk):
+        """
+        The chunks are reencrypted as they arrive, and when the last one
+        is here, the whole list is permuted and sent in chunks to the next
+        auth. The last auth keeps the result, and returns where to get it.
+        """
+
+        offset = int(request.data.get("offset", 0))
+        total = int(request.data.get("total", len(msgs)))
+
+        done = mn.shuffle_chunk(session, offset, total, msgs, pk,
+                                processes=settings.MIXNET_PROCESSES)
+        if not done:
+            return Response({ "session": session, "received": len(msgs) })
+
+        p, g, y = pk
+        size = settings.MIXNET_CHUNK_SIZE or total
+        spool = mn.spool(session)
+        last = not mn.next_auths().exists()
+
+        resp = None
+        for i, chunk in enumerate(mn.shuffled_chunks(session, total, size)):
+            if last:
+                spool.write("out", i * size, chunk)
+                continue
+
+            data = {
+                "msgs": chunk,
+                "pk": { "p": p, "g": g, "y": y },
+                "session": session,
+                "offset": i * size,
+                "total": total,
+            }
+            resp = mn.chain_call("/shuffle/{}/".format(mn.voting_id), data)
+
+        if last:
+            spool.remove("in")
+            resp = {
+                "session": session,
+                "total": total,
+                "auth": settings.BASEURL,
+                "position": mn.auth_position,
+            }
+        else:
+            spool.remove()
+
+        return Response(resp)
+
+    def get(self, request, voting_id):
+        """
+        Result of a chunked shuffle, in the last auth
+
+         * session: str
+         * position: int
+         * offset: int
+         * size: int
+        """
+
+        position = request.GET.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+
+        session = request.GET.get("session", "")
+        if not session.isalnum():
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        offset = int(request.GET.get("offset", 0))
+        size = int(request.GET.get("size", 0))
+        try:
+            msgs = mn.spool(session).read("out", offset, size)
+        except FileNotFoundError:
+            return Response({}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(msgs)
+
+    def delete(self, request, voting_id):
+        """
+        Removes the result of a chunked shuffle
+
+         * session: str
+         * position: int
+        """
+
+        position = request.data.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+
+        session = str(request.data.get("session", ""))
+        if not session.isalnum():
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        mn.spool(session).remove()
+
+        return Response({}, status=status.HTTP_204_NO_CONTENT)
+
 
 class Decrypt(APIView):
+    parser_classes = wire.PARSERS
 
     def post(self, request, voting_id):
         """
@@ -124,7 +262,17 @@ class Decrypt(APIView):
         # useful for tests only, to override the last value
         last = request.data.get("force-last", last)
 
-        msgs = mn.decrypt(msgs, (p, g, y), last=last)
+        checkpoint = mn.checkpoint("decrypt-last" if last else "decrypt", msgs, (p, g, y))
+        decrypted = checkpoint.load()
+        if decrypted is None:
+            if settings.MIXNET_DECRYPT_PROOFS and msgs and mn.provable():
+                decrypted = mn.decrypt_proved(msgs, last=last,
+                                              processes=settings.MIXNET_PROCESSES)
+            else:
+                decrypted = mn.decrypt(msgs, (p, g, y), last=last,
+                                       processes=settings.MIXNET_PROCESSES)
+            checkpoint.save(decrypted)
+        msgs = decrypted
 
         data = {
             "msgs": msgs,
@@ -134,5 +282,50 @@ class Decrypt(APIView):
         resp = mn.chain_call("/decrypt/{}/".format(voting_id), data)
         if resp:
             msgs = resp
+        checkpoint.remove()
 
         return  Response(msgs)
+
+
+class Factors(APIView):
+    parser_classes = wire.PARSERS
+
+    def post(self, request, voting_id):
+        """
+        Partial decryption factors a^x of this auth, for a decryption
+        with all the auths at the same time
+
+         * voting_id: id
+         * msgs: [ int ], the a of each ciphertext
+         * position: int / nullable
+        """
+
+        position = request.data.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+
+        msgs = request.data.get("msgs", [])
+        if settings.MIXNET_DECRYPT_PROOFS and msgs and mn.provable():
+            factors = mn.factors_proved(msgs, processes=settings.MIXNET_PROCESSES)
+        else:
+            factors = mn.factors(msgs, processes=settings.MIXNET_PROCESSES)
+        return Response(factors)
+
+
+class Pool(APIView):
+
+    def get(self, request, voting_id):
+        """
+        Stock of precomputed reencryption factors for this voting, one
+        entry for each position of this auth. 409 if a pool isn't for the
+        voting key, the tally would fail with it.
+        """
+
+        stats = []
+        for mn in Mixnet.objects.filter(voting_id=voting_id).order_by('auth_position'):
+            try:
+                stats.append({'position': mn.auth_position,
+                              **mn.pool().stats(mn.voting_key())})
+            except PoolKeyError as e:
+                return Response({'position': mn.auth_position, 'detail': str(e)},
+                                status=status.HTTP_409_CONFLICT)
+        return Response(stats)
@@ -1,5 +1,16 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete, post_save
 
 
 class StoreConfig(AppConfig):
     name = 'store'
+
+    def ready(self):
+        # the cached windows of the votings of this deployment are dropped
+        # when they change
+        if apps.is_installed('voting'):
+            from . import windows
+            for signal in (post_save, post_delete):
+                signal.connect(windows.voting_changed, sender='voting.Voting')
+                signal.connect(windows.question_changed, sender='voting.Question')
+                signal.connect(windows.question_changed, sender='voting.QuestionOption')
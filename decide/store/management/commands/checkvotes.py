@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import Vote, check_votes
+from voting.models import Voting
+
+
+class Command(BaseCommand):
+    help = 'Check the ciphertexts of the stored votes of a voting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+        parser.add_argument('--batch', type=int, default=1000,
+                            help='number of votes checked together')
+
+    def handle(self, *args, **options):
+        voting_id = options['voting_id']
+        voting = Voting.objects.filter(pk=voting_id).first()
+        if not voting or not voting.pub_key:
+            raise CommandError('Voting {} has no public key'.format(voting_id))
+
+        pub_key = {'p': voting.pub_key.p, 'g': voting.pub_key.g, 'mode': voting.pub_key.mode}
+        votes = Vote.objects.filter(voting_id=voting_id).order_by('pk')
+        fields = ('voter_id', 'a', 'b', 'vector')
+
+        total = rejected = 0
+        batch = []
+
+        def check():
+            errors = check_votes(batch, pub_key, voting.homomorphic)
+            for i, reason in errors:
+                self.stdout.write('Voter {}: {}'.format(batch[i]['voter_id'], reason))
+            return len(errors)
+
+        for vote in votes.values(*fields).iterator():
+            batch.append(vote)
+            total += 1
+            if len(batch) == options['batch']:
+                rejected += check()
+                batch = []
+        if batch:
+            rejected += check()
+
+        self.stdout.write('Voting {}: {} votes, {} rejected'.format(
+            voting_id, total, rejected))
@@ -1,5 +1,8 @@
 from django.db import models
+from django.contrib.postgres.fields import JSONField
 from base.models import BigBigField
+from mixnet import ec
+from mixnet.mixcrypt import EC, check_ciphertexts
 
 
 class Vote(models.Model):
@@ -9,7 +12,41 @@ class Vote(models.Model):
     a = BigBigField()
     b = BigBigField()
 
+    # homomorphic votings, a ciphertext for each option
+    vector = JSONField(blank=True, null=True)
+
     voted = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return '{}: {}'.format(self.voting_id, self.voter_id)
+
+
+def check_votes(votes, pub_key, homomorphic=False):
+    '''
+    Checks the ciphertexts of a list of votes, dicts with "a" and "b", or
+    "vector" in homomorphic votings, for the voting pub_key {"p", "g",
+    "mode"}.
+
+    All the ciphertexts are checked in the same batch, and a list of
+    (index, reason) is returned for the rejected votes.
+    '''
+
+    msgs, owners = [], []
+    for i, v in enumerate(votes):
+        vector = v['vector'] if homomorphic else [(v['a'], v['b'])]
+        for option, (a, b) in enumerate(vector):
+            msgs.append((int(a), int(b)))
+            owners.append((i, option))
+
+    errors = {}
+    p, g = int(pub_key['p']), int(pub_key['g'])
+    if pub_key.get('mode') == EC:
+        invalid = ec.check_ciphertexts(msgs)
+    else:
+        invalid = check_ciphertexts(msgs, p, g, exponential=homomorphic)
+    for j, reason in invalid:
+        i, option = owners[j]
+        if homomorphic:
+            reason = 'option {}: {}'.format(option + 1, reason)
+        errors.setdefault(i, reason)
+    return sorted(errors.items())
@@ -1,19 +1,24 @@
 import datetime
 import random
+from io import StringIO
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.utils import timezone
 from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
+from . import windows
 from .models import Vote
 from .serializers import VoteSerializer
 from base import mods
 from base.models import Auth
 from base.tests import BaseTestCase
+from census import index
 from census.models import Census
 from mixnet.models import Key
-from voting.models import Question
+from voting.models import Question, QuestionOption
 from voting.models import Voting
 
 
@@ -21,6 +26,8 @@ class StoreTextCase(BaseTestCase):
 
     def setUp(self):
         super().setUp()
+        windows.invalidate()
+        index.invalidate()
         self.question = Question(desc='qwerty')
         self.question.save()
         self.voting = Voting(pk=5001,
@@ -193,3 +200,126 @@ class StoreTextCase(BaseTestCase):
         self.voting.save()
         response = self.client.post('/store/', data, format='json')
         self.assertEqual(response.status_code, 401)
+
+    def test_voting_window_cache(self):
+        census = Census(voting_id=5001, voter_id=1)
+        census.save()
+        user = self.get_or_create_user(1)
+        self.login(user=user.username)
+        data = { "voting": 5001, "voter": 1, "vote": { "a": 30, "b": 55 } }
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        window = windows.get(5001)
+        with self.assertNumQueries(0):
+            self.assertIs(windows.get(5001), window)
+
+        # a new option is seen at once, and changes the version of the voting
+        QuestionOption(question=self.question, option='new').save()
+        updated = Voting.objects.get(pk=5001).updated
+        self.assertGreater(updated, window['updated'])
+        window = windows.get(5001)
+        self.assertEqual(window['updated'], updated)
+
+        # other processes don't get the signals, they see the stop of the
+        # voting when the window expires, as they check the version
+        Voting.objects.filter(pk=5001).update(
+                end_date=timezone.now() - datetime.timedelta(days=1), updated=timezone.now())
+        self.assertIs(windows.get(5001), window)
+        window['expires'] = 0
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        # and this one at once
+        self.voting.end_date = None
+        self.voting.save()
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertIsNone(windows.get(9999))
+        self.assertIsNone(windows.get('x'))
+
+    def test_voting_window_remote(self):
+        apis = dict(settings.APIS, voting='http://voting.example.com')
+        with self.settings(APIS=apis):
+            window = windows.get(5001)
+            self.assertEqual(window['start_date'], self.voting.start_date)
+            self.assertIs(windows.get(5001), window)
+
+            # once expired, the voting answers that it's the same
+            window['expires'] = 0
+            self.assertIs(windows.get(5001), window)
+            self.assertGreater(window['expires'], 0)
+            response = self.client.get('/voting/5001/window/',
+                                       {'updated': window['version']})
+            self.assertEqual(response.status_code, 304)
+
+            self.voting.end_date = timezone.now()
+            self.voting.save()
+            window = windows.get(5001)
+            self.assertEqual(window['end_date'], self.voting.end_date)
+
+    def test_invalid_vote(self):
+        VOTING_PK = 345
+        census = Census(voting_id=VOTING_PK, voter_id=1)
+        census.save()
+        self.gen_voting(VOTING_PK)
+        voting = Voting.objects.get(pk=VOTING_PK)
+        voting.pub_key = Key.objects.create(p=167, g=4, y=150)
+        voting.save()
+        user = self.get_or_create_user(1)
+        self.login(user=user.username)
+
+        invalid = [
+            ({ "a": 0, "b": 55 }, 'a out of range'),
+            ({ "a": 18, "b": 167 }, 'b out of range'),
+            ({ "a": 53, "b": 55 }, 'a not in the key group'),
+            ({ "a": 18 }, None),
+        ]
+        for vote, reason in invalid:
+            data = { "voting": VOTING_PK, "voter": 1, "vote": vote }
+            response = self.client.post('/store/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+            if reason:
+                self.assertEqual(response.json(), { "detail": reason })
+        self.assertEqual(Vote.objects.count(), 0)
+
+        data = { "voting": VOTING_PK, "voter": 1, "vote": { "a": 18, "b": 55 } }
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_checkvotes(self):
+        self.voting.pub_key = Key.objects.create(p=167, g=4, y=150)
+        self.voting.save()
+        votes = [(18, 55), (53, 55), (150, 0), (122, 7)]
+        for voter, (a, b) in enumerate(votes, 1):
+            Vote.objects.create(voting_id=5001, voter_id=voter, a=a, b=b)
+
+        out = StringIO()
+        call_command('checkvotes', 5001, batch=3, stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'Voter 2: a not in the key group',
+            'Voter 3: b out of range',
+            'Voting 5001: 4 votes, 2 rejected',
+        ])
+
+    def test_aggregate(self):
+        vectors = [[(18, 55), (4, 16)], [(150, 4), (122, 1)]]
+        for voter, vector in enumerate(vectors, 1):
+            Vote.objects.create(voting_id=5001, voter_id=voter, a=0, b=0, vector=vector)
+        self.login()
+
+        # not homomorphic
+        response = self.client.get('/store/aggregate/?voting_id=5001')
+        self.assertEqual(response.status_code, 400)
+
+        self.voting.homomorphic = True
+        self.voting.pub_key = Key.objects.create(p=167, g=4, y=150)
+        self.voting.save()
+        # the modulus is the one of the voting key
+        response = self.client.get('/store/aggregate/?voting_id=5001&p=0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "count": 2,
+            "msgs": [[18 * 150 % 167, 55 * 4 % 167], [4 * 122 % 167, 16]],
+        })
@@ -4,4 +4,5 @@ from . import views
 
 urlpatterns = [
     path('', views.StoreView.as_view(), name='store'),
+    path('aggregate/', views.AggregateView.as_view(), name='aggregate'),
 ]
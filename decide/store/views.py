@@ -1,14 +1,16 @@
 from django.utils import timezone
-from django.utils.dateparse import parse_datetime
 import django_filters.rest_framework
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import generics
+from rest_framework.views import APIView
 
-from .models import Vote
+from . import windows
+from .models import Vote, check_votes
 from .serializers import VoteSerializer
 from base import mods
 from base.perms import UserIsStaff
+from mixnet import proofs
 
 
 class StoreView(generics.ListAPIView):
@@ -27,46 +29,133 @@ class StoreView(generics.ListAPIView):
          * voting: id
          * voter: id
          * vote: { "a": int, "b": int }
+
+        In homomorphic votings:
+
+         * vote: { "vector": [ [int, int] ], "proof": {} }, a ciphertext
+           for each option, by number, and the proof that each one is g^0
+           or g^1 and they're at most max_selections g^1, see
+           mixnet.proofs.prove_vector
+
+        The ciphertexts must be valid for the voting pub_key, otherwise
+        the vote is rejected with the reason in "detail".
         """
 
         vid = request.data.get('voting')
-        voting = mods.get('voting', params={'id': vid})
-        if not voting or not isinstance(voting, list):
+        uid = request.data.get('voter')
+        vote = request.data.get('vote')
+
+        voting = windows.get(vid)
+        if not voting:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
-        start_date = voting[0].get('start_date', None)
-        end_date = voting[0].get('end_date', None)
-        not_started = not start_date or timezone.now() < parse_datetime(start_date)
-        is_closed = end_date and parse_datetime(end_date) < timezone.now()
+        start_date = voting['start_date']
+        end_date = voting['end_date']
+        not_started = not start_date or timezone.now() < start_date
+        is_closed = end_date and end_date < timezone.now()
         if not_started or is_closed:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
-        uid = request.data.get('voter')
-        vote = request.data.get('vote')
-
         if not vid or not uid or not vote:
             return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.auth:
+            return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
-        # validating voter
+        # the voter and the census are asked at the same time, unless the
+        # census is in this deployment, then its index is checked here
         token = request.auth.key
-        voter = mods.post('authentication', entry_point='/getuser/', json={'token': token})
+        queries = [{'modname': 'authentication', 'entry_point': '/getuser/',
+                    'method': 'post', 'json': {'token': token}}]
+        local_census = mods.in_process('census')
+        if not local_census:
+            queries.append({'modname': 'census/{}'.format(vid), 'params': {'voter_id': uid},
+                            'response': True})
+        voter, *perms = mods.gather(*queries)
+
+        # validating voter
         voter_id = voter.get('id', None)
         if not voter_id or voter_id != uid:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
         # the user is in the census
-        perms = mods.get('census/{}'.format(vid), params={'voter_id': uid}, response=True)
-        if perms.status_code == 401:
+        if local_census:
+            from census import index
+            in_census = index.contains(vid, uid)
+        else:
+            in_census = perms[0].status_code != 401
+        if not in_census:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
         a = vote.get("a")
         b = vote.get("b")
 
-        defs = { "a": a, "b": b }
+        vector = None
+        if voting['homomorphic']:
+            try:
+                vector = [[int(a), int(b)] for a, b in vote.get("vector")]
+            except (TypeError, ValueError):
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            if len(vector) != voting['options']:
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            a, b = 0, 0
+        else:
+            try:
+                a, b = int(a), int(b)
+            except (TypeError, ValueError):
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        pub_key = voting['pub_key']
+        if pub_key:
+            data = {'vector': vector} if vector is not None else {'a': a, 'b': b}
+            errors = check_votes([data], pub_key, homomorphic=vector is not None)
+            if errors:
+                return Response({'detail': errors[0][1]}, status=status.HTTP_400_BAD_REQUEST)
+            if vector is not None:
+                pk = pub_key['p'], pub_key['g'], pub_key['y']
+                proof = vote.get('proof') or {}
+                if not proofs.verify_vector(vector, proof, voting['max_selections'], pk):
+                    return Response({'detail': 'invalid ballot proof'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+
+        defs = { "a": a, "b": b, "vector": vector }
         v, _ = Vote.objects.get_or_create(voting_id=vid, voter_id=uid,
                                           defaults=defs)
         v.a = a
         v.b = b
+        v.vector = vector
 
         v.save()
 
         return  Response({})
+
+
+class AggregateView(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def get(self, request):
+        """
+        Product of the votes of a homomorphic voting, a ciphertext for
+        each option, and the number of votes
+
+         * voting_id: id
+
+        The products are modulo p of the voting pub_key.
+        """
+
+        vid = request.GET.get('voting_id')
+        voting = windows.get(vid)
+        if not voting or not voting['homomorphic'] or not voting['pub_key']:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        p = int(voting['pub_key']['p'])
+
+        votes = Vote.objects.filter(voting_id=vid, vector__isnull=False)
+        msgs = []
+        count = 0
+        for vector in votes.values_list('vector', flat=True).iterator():
+            if not msgs:
+                msgs = [[1, 1] for i in vector]
+            for m, (a, b) in zip(msgs, vector):
+                m[0] = (m[0] * int(a)) % p
+                m[1] = (m[1] * int(b)) % p
+            count += 1
+
+        return Response({"count": count, "msgs": msgs})
@@ -0,0 +1,111 @@
+'''
+Cache of the voting windows, what the store checks the votes with: the
+dates of the voting, if it's homomorphic, its number of options and its
+pub_key. So the votes don't ask the voting module for the whole voting
+each time.
+
+A window is used as it is for STORE_WINDOW_TTL seconds. If the voting
+module is in this deployment, the window is dropped when the voting, its
+question or its options are saved, see StoreConfig.ready. After the TTL
+the window is checked against the version of the voting, the time it was
+last saved, which the changes of the question and the options update
+too, so the other processes see a stopped voting at most STORE_WINDOW_TTL
+seconds late. If the voting module is in this deployment the version is
+read from the database, otherwise voting/<id>/window/ is asked with the
+cached version and answers 304 if it's the same.
+'''
+
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from base import mods
+
+
+_windows = {}
+_generation = 0
+_lock = threading.Lock()
+
+
+def version(vid):
+    Voting = apps.get_model('voting', 'Voting')
+    return Voting.objects.filter(pk=vid).values_list('updated', flat=True).first()
+
+
+def keep(vid, window, generation):
+    # unless the voting was saved while it was checked
+    with _lock:
+        if generation == _generation:
+            window['expires'] = time.monotonic() + settings.STORE_WINDOW_TTL
+            _windows[vid] = window
+
+
+def get(vid):
+    '''
+    Window of the voting with id vid, a dict like the one of
+    voting/<id>/window/ with the dates parsed, or None if it doesn't exist
+    '''
+
+    try:
+        vid = int(vid)
+    except (TypeError, ValueError):
+        return None
+
+    with _lock:
+        window = _windows.get(vid)
+        generation = _generation
+    if window and window['expires'] > time.monotonic():
+        return window
+
+    params = None
+    if window and mods.in_process('voting'):
+        if version(vid) == window['updated']:
+            keep(vid, window, generation)
+            return window
+    elif window:
+        params = {'updated': window['version']}
+
+    response = mods.get('voting', entry_point='/{}/window/'.format(vid), params=params,
+                        response=True)
+    if response.status_code == 304:
+        keep(vid, window, generation)
+        return window
+    if response.status_code != 200:
+        invalidate(vid)
+        return None
+
+    window = mods.parse(response)
+    window['version'] = window['updated']
+    for date in ('start_date', 'end_date', 'updated'):
+        window[date] = parse_datetime(window[date]) if window[date] else None
+    keep(vid, window, generation)
+    return window
+
+
+def invalidate(vid=None):
+    '''
+    Drops the window of the voting vid, or all of them
+    '''
+
+    global _generation
+    with _lock:
+        _generation += 1
+        if vid is None:
+            _windows.clear()
+        else:
+            _windows.pop(vid, None)
+
+
+def voting_changed(sender, instance, **kwargs):
+    invalidate(instance.pk)
+
+
+def question_changed(sender, instance, **kwargs):
+    # a Question or a QuestionOption
+    qid = getattr(instance, 'question_id', instance.pk)
+    Voting = apps.get_model('voting', 'Voting')
+    for vid in Voting.objects.filter(question_id=qid).values_list('pk', flat=True):
+        invalidate(vid)
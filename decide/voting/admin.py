@@ -4,6 +4,8 @@ from django.utils import timezone
 from .models import QuestionOption
 from .models import Question
 from .models import Voting
+from .models import TallyJob
+from .models import TallyRunning
 
 from .filters import StartedFilter
 
@@ -24,7 +26,12 @@ def stop(ModelAdmin, request, queryset):
 def tally(ModelAdmin, request, queryset):
     for v in queryset.filter(end_date__lt=timezone.now()):
         token = request.session.get('auth-token', '')
-        v.tally_votes(token)
+        if v.tallied():
+            continue
+        try:
+            v.tally_async(token)
+        except TallyRunning:
+            pass
 
 
 class QuestionOptionInline(admin.TabularInline):
@@ -35,6 +42,13 @@ class QuestionAdmin(admin.ModelAdmin):
     inlines = [QuestionOptionInline]
 
 
+class TallyJobInline(admin.TabularInline):
+    model = TallyJob
+    readonly_fields = ('state', 'done', 'total', 'error', 'created', 'updated')
+    can_delete = False
+    extra = 0
+
+
 class VotingAdmin(admin.ModelAdmin):
     list_display = ('name', 'start_date', 'end_date')
     readonly_fields = ('start_date', 'end_date', 'pub_key',
@@ -42,6 +56,7 @@ class VotingAdmin(admin.ModelAdmin):
     date_hierarchy = 'start_date'
     list_filter = (StartedFilter,)
     search_fields = ('name', )
+    inlines = [TallyJobInline]
 
     actions = [ start, stop, tally ]
 
@@ -7,8 +7,9 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 
 from base import mods
-from base.models import Auth
+from base.models import Auth, Key
 from census.models import Census
+from mixnet.ec import ECKey, ECMixCrypt
 from mixnet.mixcrypt import MixCrypt
 from mixnet.mixcrypt import ElGamal
 from voting.models import Voting, Question, QuestionOption
@@ -21,8 +22,12 @@ class Command(BaseCommand):
     def encrypt_msg(self, msg, v, bits=settings.KEYBITS):
         pk = v.pub_key
         p, g, y = (pk.p, pk.g, pk.y)
-        k = MixCrypt(bits=bits)
-        k.k = ElGamal.construct((p, g, y))
+        if pk.mode == Key.EC:
+            k = ECMixCrypt()
+            k.k = ECKey(p, g, y)
+        else:
+            k = MixCrypt(bits=bits, mode=pk.mode)
+            k.k = ElGamal.construct((p, g, y))
         return k.encrypt(msg)
 
     def create_voting(self):
@@ -0,0 +1,27 @@
+# Generated by Django 2.0 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0005_voting_public'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TallyJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('fetching', 'Fetching votes'), ('shuffling', 'Shuffling'), ('decrypting', 'Decrypting'), ('postproc', 'Postprocessing'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=20)),
+                ('done', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tally_jobs', to='voting.Voting')),
+            ],
+        ),
+    ]
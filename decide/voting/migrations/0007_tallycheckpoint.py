@@ -0,0 +1,27 @@
+# Generated by Django 2.0 on 2026-10-18 20:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0006_tallyjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TallyCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phase', models.CharField(max_length=20)),
+                ('data', models.BinaryField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='voting.Voting')),
+            ],
+            options={
+                'unique_together': {('voting', 'phase')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0008_voting_homomorphic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='max_selections',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
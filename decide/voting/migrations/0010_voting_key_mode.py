@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0009_question_max_selections'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='key_mode',
+            field=models.CharField(blank=True, choices=[('full', 'Full exponents'), ('qr', 'Quadratic residues, short exponents'), ('p256', 'Elliptic curve P-256')], default='', max_length=4),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.0 on 2026-10-19 09:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0010_voting_key_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
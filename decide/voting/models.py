@@ -1,18 +1,80 @@
-from django.db import models
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
 from django.contrib.postgres.fields import JSONField
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
+from base import ballot
 from base import mods
+from base import wire
 from base.models import Auth, Key
+from mixnet import ec
+from mixnet.mixcrypt import combine_factors, decode, dlog
+
+
+def window_map(func, items, done=None):
+    '''
+    map with up to MIXNET_CHUNK_WINDOW calls running at the same time
+
+    done is called in this thread for each result, in order
+    '''
+
+    window = settings.MIXNET_CHUNK_WINDOW
+    pool = ThreadPoolExecutor(window) if window > 1 else None
+    try:
+        results = []
+        for r in (pool.map if pool else map)(func, items):
+            results.append(r)
+            if done:
+                done()
+        return results
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+class TallyCancelled(Exception):
+    pass
+
+
+class TallyError(Exception):
+    pass
+
+
+class TallyRunning(Exception):
+    pass
 
 
 class Question(models.Model):
     desc = models.TextField()
+    # options a voter can select, packed in one ballot, see base.ballot
+    max_selections = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return self.desc
 
+    def capacity(self, mode):
+        '''
+        Maximum number of selections of a ballot, with the numbers of the
+        options, so it fits in a plaintext of a key of the mode, up to
+        (p-1)/2 to be encoded in the quadratic residues
+        '''
+
+        numbers = [o.number or 0 for o in self.options.all()]
+        if not numbers:
+            return 0
+        bound = 2 ** (settings.KEYBITS - 2)
+        if mode == Key.EC:
+            bound = ec.MESSAGE_BOUND
+        return min(len(numbers), ballot.capacity(numbers, bound))
+
 
 class QuestionOption(models.Model):
     question = models.ForeignKey(Question, related_name='options', on_delete=models.CASCADE)
@@ -40,6 +102,9 @@ class Voting(models.Model):
     name = models.CharField(max_length=200)
     desc = models.TextField(blank=True, null=True)
     public = models.BooleanField(default = False)
+    homomorphic = models.BooleanField(default = False)
+    # mode of the voting key, KEYMODE if it's empty
+    key_mode = models.CharField(max_length=4, choices=Key.MODES, blank=True, default='')
     question = models.ForeignKey(Question, related_name='voting', on_delete=models.CASCADE)
 
     start_date = models.DateTimeField(blank=True, null=True)
@@ -51,71 +116,287 @@ class Voting(models.Model):
     tally = JSONField(blank=True, null=True)
     postproc = JSONField(blank=True, null=True)
 
+    # version of the voting for the caches of other modules, see store.windows
+    updated = models.DateTimeField(auto_now=True)
+
+    def clean(self):
+        # the homomorphic tally adds the plaintexts as exponents of g,
+        # there's no g^m to decrypt with EC keys
+        mode = self.key_mode or settings.KEYMODE
+        if self.homomorphic and mode == Key.EC:
+            raise ValidationError({'homomorphic': 'Homomorphic votings need a finite field key'})
+
+        # the options can be renumbered or added until the key is created
+        max_selections = self.question.max_selections if self.question_id else 1
+        if max_selections > 1 and max_selections > self.question.capacity(mode):
+            raise ValidationError({'question': 'The ballots of {} selections don\'t fit '
+                                               'in the key'.format(max_selections)})
+
     def create_pubkey(self):
         if self.pub_key or not self.auths.count():
             return
+        # KEYMODE or the options could have changed since the voting was saved
+        self.clean()
 
         auth = self.auths.first()
         data = {
             "voting": self.id,
+            "voting_url": settings.APIS.get('voting', settings.BASEURL),
             "auths": [ {"name": a.name, "url": a.url} for a in self.auths.all() ],
+            "key": {"p": 0, "g": 0, "mode": self.key_mode or settings.KEYMODE},
         }
         key = mods.post('mixnet', baseurl=auth.url, json=data)
-        pk = Key(p=key["p"], g=key["g"], y=key["y"])
+        pk = Key(p=key["p"], g=key["g"], y=key["y"], mode=key.get("mode", Key.FULL))
         pk.save()
         self.pub_key = pk
         self.save()
 
+    def tally_async(self, token=''):
+        '''
+        Queues a tally job for this voting and returns it. The job runs in
+        a background thread, or right now if TALLY_ASYNC is disabled.
+
+        The voting row is locked while the job is queued, so two requests
+        can't queue two jobs. TallyRunning is raised if a job is running,
+        a stale one is failed and replaced.
+        '''
+
+        with transaction.atomic():
+            Voting.objects.select_for_update().get(pk=self.pk)
+            job = self.tally_job()
+            if job and (job.running() or job.stale() and not job.take_over()):
+                raise TallyRunning()
+            job = TallyJob.objects.create(voting=self)
+
+        if settings.TALLY_ASYNC:
+            threading.Thread(target=job.run, args=(token, True), daemon=True).start()
+        else:
+            job.run(token)
+        return job
+
+    def tally_job(self):
+        return self.tally_jobs.order_by('-id').first()
+
     def get_votes(self, token=''):
         # gettings votes from store
-        votes = mods.get('store', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token)
+        votes = mods.get('store', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token,
+                binary=True)
         # anon votes
         return [[i['a'], i['b']] for i in votes]
 
-    def tally_votes(self, token=''):
+    def tallied(self):
+        return self.tally is not None and self.postproc is not None
+
+    def checkpoint(self, phase):
+        '''
+        Ciphertexts saved after the phase of a previous tally, or None
+        '''
+
+        c = self.checkpoints.filter(phase=phase).first()
+        return wire.loads(bytes(c.data)) if c else None
+
+    def save_checkpoint(self, phase, msgs):
+        TallyCheckpoint.objects.update_or_create(voting=self, phase=phase,
+                defaults={'data': wire.dumps(msgs, compress=True)})
+
+    def mixnet_post(self, url, data, auth=None):
+        auth = auth or self.auths.first()
+        response = mods.post('mixnet', entry_point=url, baseurl=auth.url,
+                json=data, response=True, binary=True)
+        return self.mixnet_result(url, response)
+
+    def mixnet_result(self, url, response):
+        if response.status_code != 200:
+            raise TallyError('mixnet {}: {}'.format(url, response.status_code))
+        return mods.parse(response)
+
+    def decrypt(self, msgs, auths=None):
+        '''
+        Decrypts the shuffled msgs in a chain through all the auths or,
+        with MIXNET_PARALLEL_DECRYPT, asking all the auths for their
+        decryption factors at the same time and combining them here
+        '''
+
+        auths = auths or list(self.auths.all())
+        if not settings.MIXNET_PARALLEL_DECRYPT:
+            return self.mixnet_post("/decrypt/{}/".format(self.id), {"msgs": msgs}, auths[0])
+        return self.decrypt_factors(msgs, auths)
+
+    def decrypt_factors(self, msgs, auths=None):
+        '''
+        Decrypts msgs with the decryption factors of all the auths, asked
+        at the same time, keeping the order of msgs
+        '''
+
+        auths = auths or list(self.auths.all())
+        if not msgs:
+            return []
+
+        # the mixnet of the auth in position i is the one of the i-th auth
+        alphas = [a for a, b in msgs]
+        url = "/factors/{}/".format(self.id)
+        queries = [{'modname': 'mixnet', 'entry_point': url, 'method': 'post',
+                    'baseurl': auth.url, 'json': {"msgs": alphas, "position": position},
+                    'response': True, 'binary': True}
+                   for position, auth in enumerate(auths)]
+
+        factors = [self.mixnet_result(url, r) for r in mods.gather(*queries)]
+        if self.pub_key.mode == Key.EC:
+            return ec.combine_factors(msgs, factors)
+        return combine_factors(msgs, factors, self.pub_key.p)
+
+    def tally_votes(self, token='', job=None):
         '''
         The tally is a shuffle and then a decrypt
+
+        The progress is reported in job, a new one if it's not given. The
+        votes and the shuffled votes are saved as checkpoints, so if the
+        tally fails, the next one goes on from the last completed phase.
         '''
 
-        votes = self.get_votes(token)
+        if not job:
+            job = TallyJob.objects.create(voting=self)
+
+        job.phase(TallyJob.FETCHING)
+        # if it's already decrypted, only the postproc failed
+        if self.tally is None:
+            if self.homomorphic:
+                self.tally = self.tally_homomorphic(token, job)
+            else:
+                self.tally = self.decode(self.tally_mixnet(token, job))
+            self.save()
+
+        job.phase(TallyJob.POSTPROC)
+        self.do_postproc()
+        self.checkpoints.all().delete()
+        job.phase(TallyJob.DONE)
+
+    def decode(self, plaintexts):
+        '''
+        The mixnet keeps the plaintexts of QR keys encoded, so the
+        decryptions can be proved, and the ones of EC keys as points
+        '''
+
+        if self.pub_key.mode == Key.EC:
+            return [ec.plaintext(m) for m in plaintexts]
+        if self.pub_key.mode != Key.QR:
+            return plaintexts
+        p = int(self.pub_key.p)
+        return [decode(m, p) for m in plaintexts]
+
+    def tally_mixnet(self, token, job):
+        votes = self.checkpoint(TallyCheckpoint.FETCHED)
+        if votes is None:
+            votes = self.get_votes(token)
+            self.save_checkpoint(TallyCheckpoint.FETCHED, votes)
+
+        if settings.MIXNET_CHUNK_SIZE:
+            return self.tally_chunked(votes, job)
 
-        auth = self.auths.first()
         shuffle_url = "/shuffle/{}/".format(self.id)
-        decrypt_url = "/decrypt/{}/".format(self.id)
-        auths = [{"name": a.name, "url": a.url} for a in self.auths.all()]
 
         # first, we do the shuffle
-        data = { "msgs": votes }
-        response = mods.post('mixnet', entry_point=shuffle_url, baseurl=auth.url, json=data,
-                response=True)
-        if response.status_code != 200:
-            # TODO: manage error
-            pass
+        job.phase(TallyJob.SHUFFLING, 1)
+        shuffled = self.checkpoint(TallyCheckpoint.SHUFFLED)
+        if shuffled is None:
+            shuffled = self.mixnet_post(shuffle_url, {"msgs": votes})
+            self.save_checkpoint(TallyCheckpoint.SHUFFLED, shuffled)
 
         # then, we can decrypt that
-        data = {"msgs": response.json()}
-        response = mods.post('mixnet', entry_point=decrypt_url, baseurl=auth.url, json=data,
-                response=True)
+        job.phase(TallyJob.DECRYPTING, 1)
+        return self.decrypt(shuffled)
+
+    def tally_homomorphic(self, token, job):
+        '''
+        In a homomorphic voting each vote is a list of ciphertexts, one
+        for each option by number, of g^1 for the selected option and g^0
+        for the rest. The store multiplies them, so only one ciphertext
+        for each option is decrypted, g^count, and the count is found with
+        a discrete log bounded by the number of votes.
+
+        The tally is a dict with the count of each option number.
+        '''
 
+        p, g = int(self.pub_key.p), int(self.pub_key.g)
+        response = mods.get('store', entry_point='/aggregate/',
+                params={'voting_id': self.id},
+                HTTP_AUTHORIZATION='Token ' + token, response=True, binary=True)
         if response.status_code != 200:
-            # TODO: manage error
-            pass
+            raise TallyError('store /aggregate/: {}'.format(response.status_code))
+        data = mods.parse(response)
 
-        self.tally = response.json()
-        self.save()
+        job.phase(TallyJob.DECRYPTING, 1)
+        options = [o.number for o in self.question.options.order_by('number')]
+        counts = [dlog(m, g, p, data['count']) for m in self.decrypt_factors(data['msgs'])]
+        if None in counts:
+            raise TallyError('invalid aggregated votes')
 
-        self.do_postproc()
+        tally = {str(n): 0 for n in options}
+        tally.update((str(n), c) for n, c in zip(options, counts))
+        return tally
+
+    def tally_chunked(self, votes, job):
+        '''
+        The shuffle and the decrypt in chunks of MIXNET_CHUNK_SIZE votes,
+        sending several chunks at the same time, so each auth only holds
+        a few chunks in memory and different auths work at the same time
+        '''
+
+        if not votes:
+            return []
+
+        # loaded here, so the threads don't query the db
+        auths = list(self.auths.all())
+        auth = auths[0]
+        self.pub_key
+        shuffle_url = "/shuffle/{}/".format(self.id)
+        size = settings.MIXNET_CHUNK_SIZE
+        session = uuid.uuid4().hex
+        offsets = range(0, len(votes), size)
+
+        def shuffle(offset):
+            data = {
+                "msgs": votes[offset:offset + size],
+                "session": session,
+                "offset": offset,
+                "total": len(votes),
+            }
+            return mods.post('mixnet', entry_point=shuffle_url, baseurl=auth.url, json=data,
+                    binary=True)
+
+        # the response to the chunk that completes the shuffle says where
+        # to get the result
+        job.phase(TallyJob.SHUFFLING, len(offsets))
+        shuffled = window_map(shuffle, offsets, job.advance)
+        result = [r for r in shuffled if "auth" in r][0]
+        params = {"session": session, "position": result["position"]}
+
+        def decrypt(offset):
+            msgs = mods.get('mixnet', entry_point=shuffle_url, baseurl=result["auth"],
+                    params=dict(params, offset=offset, size=size), binary=True)
+            return self.decrypt(msgs, auths)
+
+        job.phase(TallyJob.DECRYPTING, len(offsets))
+        tally = [m for chunk in window_map(decrypt, offsets, job.advance) for m in chunk]
+        mods.query('mixnet', entry_point=shuffle_url, method='delete', baseurl=result["auth"],
+                json=params, response=True)
+        return tally
 
     def do_postproc(self):
         tally = self.tally
         options = self.question.options.all()
 
+        counts = {}
+        if isinstance(tally, list):
+            numbers = [opt.number for opt in options if opt.number is not None]
+            counts = ballot.count(tally, numbers, self.question.max_selections)
+
         opts = []
         for opt in options:
-            if isinstance(tally, list):
-                votes = tally.count(opt.number)
+            if isinstance(tally, dict):
+                votes = tally.get(str(opt.number), 0)
             else:
-                votes = 0
+                votes = counts.get(opt.number, 0)
             opts.append({
                 'option': opt.option,
                 'number': opt.number,
@@ -130,3 +411,170 @@ class Voting(models.Model):
 
     def __str__(self):
         return self.name
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=QuestionOption)
+@receiver(post_delete, sender=QuestionOption)
+def question_changed(sender, instance, **kwargs):
+    # the options and max_selections are part of the version of the
+    # votings for the other modules, see store.windows
+    qid = getattr(instance, 'question_id', instance.pk)
+    Voting.objects.filter(question_id=qid).update(updated=timezone.now())
+
+
+class TallyJob(models.Model):
+    '''
+    A tally of a voting, with the phase it's in and the progress of the
+    phase, in done of total steps
+    '''
+
+    QUEUED = 'queued'
+    FETCHING = 'fetching'
+    SHUFFLING = 'shuffling'
+    DECRYPTING = 'decrypting'
+    POSTPROC = 'postproc'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    STATES = (
+        (QUEUED, 'Queued'),
+        (FETCHING, 'Fetching votes'),
+        (SHUFFLING, 'Shuffling'),
+        (DECRYPTING, 'Decrypting'),
+        (POSTPROC, 'Postprocessing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    )
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+    voting = models.ForeignKey(Voting, related_name='tally_jobs', on_delete=models.CASCADE)
+    state = models.CharField(max_length=20, choices=STATES, default=QUEUED)
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def running(self):
+        return self.state not in self.FINISHED and not self.stale()
+
+    def stale(self):
+        '''
+        True if the job isn't finished but hasn't reported progress, nor a
+        heartbeat, for TALLY_STALE seconds, so its worker is gone
+        '''
+
+        limit = timezone.now() - timedelta(seconds=settings.TALLY_STALE)
+        return self.state not in self.FINISHED and self.updated < limit
+
+    def take_over(self):
+        '''
+        Fails a stale job, so a new one can be queued. Returns False if it
+        has reported progress meanwhile.
+        '''
+
+        error = 'No progress in {} seconds, queued again'.format(settings.TALLY_STALE)
+        n = TallyJob.objects.filter(pk=self.pk, updated=self.updated).exclude(
+                state__in=self.FINISHED).update(state=self.FAILED, error=error)
+        if n:
+            self.state, self.error = self.FAILED, error
+        return bool(n)
+
+    def check_cancelled(self):
+        # cancelled, or failed by another job that took over
+        state = TallyJob.objects.values_list('state', flat=True).get(pk=self.pk)
+        if state in self.FINISHED:
+            self.state = state
+            raise TallyCancelled()
+
+    def phase(self, state, total=0):
+        self.check_cancelled()
+        self.state = state
+        self.done = total if state == self.DONE else 0
+        self.total = total
+        # only if it's not cancelled meanwhile
+        TallyJob.objects.filter(pk=self.pk).exclude(state=self.CANCELLED).update(
+                state=state, done=self.done, total=total, updated=timezone.now())
+
+    def advance(self):
+        self.check_cancelled()
+        self.done += 1
+        TallyJob.objects.filter(pk=self.pk).update(done=models.F('done') + 1,
+                                                   updated=timezone.now())
+
+    def cancel(self):
+        '''
+        Returns False if the job is already finished. A running job stops
+        the next time it reports progress.
+        '''
+
+        n = TallyJob.objects.filter(pk=self.pk).exclude(state__in=self.FINISHED).update(
+                state=self.CANCELLED, updated=timezone.now())
+        if n:
+            self.state = self.CANCELLED
+        return bool(n)
+
+    def beat(self, stop):
+        '''
+        Touches updated every TALLY_HEARTBEAT seconds until stop is set, so
+        a long step isn't taken as a dead worker
+        '''
+
+        try:
+            while not stop.wait(settings.TALLY_HEARTBEAT):
+                TallyJob.objects.filter(pk=self.pk).exclude(state__in=self.FINISHED).update(
+                        updated=timezone.now())
+        finally:
+            connection.close()
+
+    def run(self, token='', thread=False):
+        '''
+        Runs the tally, errors are saved in the job. In a background thread
+        the job sends heartbeats while it runs.
+        '''
+
+        stop = threading.Event()
+        if thread:
+            threading.Thread(target=self.beat, args=(stop,), daemon=True).start()
+        try:
+            self.voting.tally_votes(token, self)
+        except TallyCancelled:
+            pass
+        except Exception as e:
+            self.state = self.FAILED
+            self.error = str(e) or e.__class__.__name__
+            TallyJob.objects.filter(pk=self.pk).exclude(state=self.CANCELLED).update(
+                    state=self.FAILED, error=self.error, updated=timezone.now())
+        finally:
+            stop.set()
+            if thread:
+                connection.close()
+
+    def __str__(self):
+        return '{}: {}'.format(self.voting, self.state)
+
+
+class TallyCheckpoint(models.Model):
+    '''
+    Ciphertexts of a completed phase of a tally, in the binary format of
+    base.wire
+    '''
+
+    FETCHED = 'fetched'
+    SHUFFLED = 'shuffled'
+
+    voting = models.ForeignKey(Voting, related_name='checkpoints', on_delete=models.CASCADE)
+    phase = models.CharField(max_length=20)
+    data = models.BinaryField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('voting', 'phase'),)
+
+    def __str__(self):
+        return '{}: {}'.format(self.voting, self.phase)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Question, QuestionOption, Voting
+from .models import Question, QuestionOption, Voting, TallyJob
 from base.serializers import KeySerializer, AuthSerializer
 
 
@@ -14,7 +14,7 @@ class QuestionSerializer(serializers.HyperlinkedModelSerializer):
     options = QuestionOptionSerializer(many=True)
     class Meta:
         model = Question
-        fields = ('desc', 'options')
+        fields = ('desc', 'options', 'max_selections')
 
 
 class VotingSerializer(serializers.HyperlinkedModelSerializer):
@@ -25,7 +25,26 @@ class VotingSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Voting
         fields = ('id', 'name', 'desc', 'question', 'start_date',
-                  'end_date', 'pub_key', 'auths', 'tally', 'postproc')
+                  'end_date', 'pub_key', 'auths', 'tally', 'postproc',
+                  'homomorphic', 'key_mode')
+
+
+class VotingWindowSerializer(serializers.ModelSerializer):
+    '''
+    What the store checks the votes with, without the tally
+    '''
+
+    pub_key = KeySerializer()
+    options = serializers.SerializerMethodField()
+    max_selections = serializers.IntegerField(source='question.max_selections')
+
+    class Meta:
+        model = Voting
+        fields = ('id', 'start_date', 'end_date', 'homomorphic', 'options',
+                  'max_selections', 'pub_key', 'updated')
+
+    def get_options(self, voting):
+        return voting.question.options.count()
 
 
 class SimpleVotingSerializer(serializers.HyperlinkedModelSerializer):
@@ -34,3 +53,9 @@ class SimpleVotingSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Voting
         fields = ('name', 'desc', 'question', 'start_date', 'end_date')
+
+
+class TallyJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TallyJob
+        fields = ('id', 'state', 'done', 'total', 'error', 'created', 'updated')
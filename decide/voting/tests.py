@@ -1,19 +1,29 @@
 import random
 import itertools
+import tempfile
+from datetime import timedelta
+from unittest import mock
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.test import override_settings
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
+from base import ballot
 from base import mods
+from base.models import Key
 from base.tests import BaseTestCase
 from census.models import Census
+from mixnet.ec import ECKey, ECMixCrypt
 from mixnet.mixcrypt import ElGamal
 from mixnet.mixcrypt import MixCrypt
-from mixnet.models import Auth
-from voting.models import Voting, Question, QuestionOption
+from mixnet import proofs
+from mixnet.models import Auth, Mixnet
+from voting.models import Voting, Question, QuestionOption, TallyJob, TallyCheckpoint
+from voting.models import TallyCancelled
 
 # Imports para selenium
 """ from selenium.webdriver.firefox.options import Options
@@ -23,6 +33,7 @@ from selenium import webdriver
 import time  """
 
 
+@override_settings(TALLY_ASYNC=False)
 class VotingTestCase(BaseTestCase):
 
     def setUp(self):
@@ -48,8 +59,12 @@ class VotingTestCase(BaseTestCase):
     def encrypt_msg(self, msg, v, bits=settings.KEYBITS):
         pk = v.pub_key
         p, g, y = (pk.p, pk.g, pk.y)
-        k = MixCrypt(bits=bits)
-        k.k = ElGamal.construct((p, g, y))
+        if pk.mode == Key.EC:
+            k = ECMixCrypt()
+            k.k = ECKey(p, g, y)
+        else:
+            k = MixCrypt(bits=bits, mode=pk.mode)
+            k.k = ElGamal.construct((p, g, y))
         return k.encrypt(msg)
 
     def create_voting(self):
@@ -145,6 +160,202 @@ class VotingTestCase(BaseTestCase):
         for q in v.postproc:
             self.assertEqual(tally.get(q["number"], 0), q["votes"])
 
+        return v
+
+    @override_settings(KEYMODE='qr', WIRE_BINARY=True)
+    def test_complete_voting_qr_key(self):
+        v = self.test_complete_voting()
+        self.assertEqual(v.pub_key.mode, Key.QR)
+        self.assertEqual(Mixnet.objects.get(voting_id=v.id).key.mode, Key.QR)
+
+    def test_complete_multiple_selection_voting(self):
+        v = self.create_voting()
+        v.question.max_selections = 3
+        v.question.save()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        numbers = [opt.number for opt in v.question.options.all()]
+        ballots = [numbers[:1], numbers[1:3], numbers[::2], numbers[3:], numbers]
+        voters = list(Census.objects.filter(voting_id=v.id))
+        for selections, voter in zip(ballots, voters):
+            a, b = self.encrypt_msg(ballot.encode(selections, numbers, 3), v)
+            data = { 'voting': v.id, 'voter': voter.voter_id, 'vote': { 'a': a, 'b': b } }
+            user = self.get_or_create_user(voter.voter_id)
+            self.login(user=user.username)
+            mods.post('store', json=data)
+
+        self.login()
+        v.tally_votes(self.token)
+        self.assertEqual(len(v.tally), len(ballots))
+
+        # the last ballot has too many selections
+        expected = {n: sum(n in s for s in ballots[:-1]) for n in numbers}
+        for q in v.postproc:
+            self.assertEqual(q["votes"], expected[q["number"]])
+
+    def test_complete_voting_chunked(self):
+        with self.settings(MIXNET_CHUNK_SIZE=4, MIXNET_CHUNK_WINDOW=1,
+                           MIXNET_SPOOL_DIR=tempfile.mkdtemp()):
+            v = self.create_voting()
+            self.create_voters(v)
+
+            v.create_pubkey()
+            v.start_date = timezone.now()
+            v.save()
+
+            clear = self.store_votes(v)
+
+            self.login()  # set token
+            v.tally_votes(self.token)
+
+        tally = v.tally
+        tally.sort()
+        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+
+        for q in v.question.options.all():
+            self.assertEqual(tally.get(q.number, 0), clear.get(q.number, 0))
+
+        for q in v.postproc:
+            self.assertEqual(tally.get(q["number"], 0), q["votes"])
+
+    def test_complete_voting_parallel_decrypt(self):
+        with self.settings(MIXNET_PARALLEL_DECRYPT=True, MIXNET_CHUNK_WINDOW=1):
+            v = self.create_voting()
+            self.create_voters(v)
+
+            v.create_pubkey()
+            v.start_date = timezone.now()
+            v.save()
+
+            clear = self.store_votes(v)
+
+            self.login()  # set token
+            v.tally_votes(self.token)
+
+        tally = v.tally
+        tally.sort()
+        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+
+        for q in v.question.options.all():
+            self.assertEqual(tally.get(q.number, 0), clear.get(q.number, 0))
+
+    def test_complete_ec_voting(self):
+        with self.settings(MIXNET_PARALLEL_DECRYPT=True, MIXNET_CHUNK_WINDOW=1):
+            v = self.create_voting()
+            v.key_mode = Key.EC
+            v.save()
+            self.create_voters(v)
+
+            v.create_pubkey()
+            v.start_date = timezone.now()
+            v.save()
+            self.assertEqual(v.pub_key.mode, Key.EC)
+
+            clear = self.store_votes(v)
+
+            # a vote that isn't in the curve
+            voter = Census.objects.filter(voting_id=v.id).first()
+            a, b = self.encrypt_msg(1, v)
+            data = { 'voting': v.id, 'voter': voter.voter_id, 'vote': { 'a': 5, 'b': b } }
+            self.login(user=self.get_or_create_user(voter.voter_id).username)
+            response = mods.post('store', json=data, response=True)
+            self.assertEqual(response.status_code, 400)
+
+            self.login()  # set token
+            v.tally_votes(self.token)
+
+        tally = v.tally
+        tally.sort()
+        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+
+        for q in v.question.options.all():
+            self.assertEqual(tally.get(q.number, 0), clear.get(q.number, 0))
+
+    def test_complete_homomorphic_voting(self):
+        v = self.create_voting()
+        v.homomorphic = True
+        v.save()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        pk = v.pub_key.p, v.pub_key.g, v.pub_key.y
+
+        numbers = [o.number for o in v.question.options.order_by('number')]
+        voters = list(Census.objects.filter(voting_id=v.id))
+        clear = {n: 0 for n in numbers}
+        for voter in voters[:10]:
+            selected = random.choice(numbers)
+            clear[selected] += 1
+            vector, proof = proofs.encrypt_vector([int(n == selected) for n in numbers], pk)
+            data = {
+                'voting': v.id,
+                'voter': voter.voter_id,
+                'vote': { 'vector': vector, 'proof': proof },
+            }
+            user = self.get_or_create_user(voter.voter_id)
+            self.login(user=user.username)
+            response = mods.post('store', json=data, response=True)
+            self.assertEqual(response.status_code, 200)
+
+        # a vector without a ciphertext for each option
+        data['vote'] = { 'vector': vector[1:], 'proof': proof }
+        response = mods.post('store', json=data, response=True)
+        self.assertEqual(response.status_code, 400)
+
+        # without a proof, and with more than max_selections
+        data['vote'] = { 'vector': vector }
+        response = mods.post('store', json=data, response=True)
+        self.assertEqual(response.status_code, 400)
+        vector, proof = proofs.encrypt_vector([1, 1, 0, 0, 0], pk)
+        data['vote'] = { 'vector': vector, 'proof': proof }
+        response = mods.post('store', json=data, response=True)
+        self.assertEqual(response.json(), {'detail': 'invalid ballot proof'})
+
+        self.login()  # set token
+        with self.settings(MIXNET_CHUNK_WINDOW=1):
+            v.tally_votes(self.token)
+
+        for n in numbers:
+            self.assertEqual(v.tally[str(n)], clear[n])
+
+        for q in v.postproc:
+            self.assertEqual(clear[q["number"]], q["votes"])
+
+    def test_homomorphic_ec_key(self):
+        v = self.create_voting()
+        v.homomorphic = True
+        v.key_mode = Key.EC
+        with self.assertRaises(ValidationError):
+            v.full_clean()
+
+        # the default key mode when the key is created
+        v.key_mode = ''
+        v.full_clean()
+        with self.settings(KEYMODE=Key.EC):
+            with self.assertRaises(ValidationError):
+                v.create_pubkey()
+        self.assertIsNone(v.pub_key)
+
+    @override_settings(KEYBITS=64)
+    def test_question_capacity(self):
+        v = self.create_voting()
+        v.question.max_selections = 3
+        v.question.save()
+        v.full_clean()
+
+        # an option added after the voting was created
+        QuestionOption(question=v.question, option='other', number=2 ** 30).save()
+        with self.assertRaises(ValidationError):
+            v.create_pubkey()
+        self.assertIsNone(v.pub_key)
+
     def test_complete_binary_voting(self):
         v = self.create_binary_voting()
         self.create_voters(v)
@@ -168,6 +379,132 @@ class VotingTestCase(BaseTestCase):
         for q in v.postproc:
             self.assertEqual(tally.get(q["number"], 0), q["votes"])
 
+    def test_tally_resumed(self):
+        v = self.create_voting()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        clear = self.store_votes(v)
+
+        self.login()  # set token
+        with mock.patch.object(Mixnet, 'decrypt', side_effect=RuntimeError('decrypt failed')):
+            with self.assertRaises(RuntimeError):
+                v.tally_votes(self.token)
+        phases = set(v.checkpoints.values_list('phase', flat=True))
+        self.assertEqual(phases, {TallyCheckpoint.FETCHED, TallyCheckpoint.SHUFFLED})
+
+        # the votes aren't shuffled again
+        with mock.patch.object(Mixnet, 'shuffle', side_effect=AssertionError('shuffled again')):
+            v.tally_votes(self.token)
+        self.assertFalse(v.checkpoints.exists())
+
+        tally = v.tally
+        tally.sort()
+        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+
+        for q in v.question.options.all():
+            self.assertEqual(tally.get(q.number, 0), clear.get(q.number, 0))
+
+    def test_tally_job(self):
+        v = self.create_voting()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+        self.store_votes(v)
+        v.end_date = timezone.now()
+        v.save()
+
+        self.login()
+        response = self.client.get('/voting/{}/tally/'.format(v.pk))
+        self.assertEqual(response.status_code, 404)
+
+        data = {'action': 'tally'}
+        response = self.client.put('/voting/{}/'.format(v.pk), data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), 'Voting tallied')
+
+        response = self.client.get('/voting/{}/tally/'.format(v.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['state'], TallyJob.DONE)
+
+        # a finished job can't be cancelled
+        response = self.client.delete('/voting/{}/tally/'.format(v.pk))
+        self.assertEqual(response.status_code, 400)
+
+    def test_tally_job_cancelled(self):
+        v = self.create_voting()
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.end_date = timezone.now()
+        v.save()
+
+        self.login()
+        job = TallyJob.objects.create(voting=v)
+        response = self.client.delete('/voting/{}/tally/'.format(v.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['state'], TallyJob.CANCELLED)
+
+        job.run(self.token)
+        job.refresh_from_db()
+        v.refresh_from_db()
+        self.assertEqual(job.state, TallyJob.CANCELLED)
+        self.assertIsNone(v.tally)
+
+    def test_tally_job_stale(self):
+        v = self.create_voting()
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.end_date = timezone.now()
+        v.save()
+
+        self.login()
+        job = TallyJob.objects.create(voting=v, state=TallyJob.SHUFFLING)
+        data = {'action': 'tally'}
+        response = self.client.put('/voting/{}/'.format(v.pk), data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # the worker was killed an hour ago
+        TallyJob.objects.filter(pk=job.pk).update(updated=timezone.now() - timedelta(hours=1))
+        response = self.client.put('/voting/{}/'.format(v.pk), data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(v.tally_job().state, TallyJob.DONE)
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, TallyJob.FAILED)
+        self.assertTrue(job.error)
+        # and it stops if it comes back
+        with self.assertRaises(TallyCancelled):
+            job.phase(TallyJob.DECRYPTING)
+
+    def test_tally_job_failed(self):
+        v = self.create_voting()
+        job = TallyJob.objects.create(voting=v)
+        # without a staff token the store doesn't return the votes
+        job.run('')
+        job.refresh_from_db()
+        self.assertEqual(job.state, TallyJob.FAILED)
+        self.assertTrue(job.error)
+
+    def test_tally_job_failed_response(self):
+        # without a key the shuffle fails
+        v = self.create_voting()
+        v.start_date = timezone.now()
+        v.end_date = timezone.now()
+        v.save()
+
+        self.login()
+        data = {'action': 'tally'}
+        response = self.client.put('/voting/{}/'.format(v.pk), data, format='json')
+        self.assertEqual(response.status_code, 500)
+        job = v.tally_job()
+        self.assertEqual(job.state, TallyJob.FAILED)
+        self.assertEqual(response.json(), job.error)
+
     def test_create_voting_from_api(self):
         data = {'name': 'Example'}
         response = self.client.post('/voting/', data, format='json')
@@ -193,9 +530,29 @@ class VotingTestCase(BaseTestCase):
         response = self.client.post('/voting/', data, format='json')
         self.assertEqual(response.status_code, 201)
 
+        data['max_selections'] = 2
+        response = self.client.post('/voting/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Question.objects.last().max_selections, 2)
+
+        data['max_selections'] = 4
+        response = self.client.post('/voting/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        data['max_selections'] = 3
+        data['key_mode'] = Key.EC
+        response = self.client.post('/voting/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Voting.objects.last().key_mode, Key.EC)
+
+        data['homomorphic'] = True
+        response = self.client.post('/voting/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
 
     def test_update_voting(self):
         voting = self.create_voting()
+        voting.create_pubkey()
 
         data = {'action': 'start'}
         #response = self.client.post('/voting/{}/'.format(voting.pk), data, format='json')
@@ -274,6 +631,7 @@ class VotingTestCase(BaseTestCase):
 
     def test_update_binary_voting(self):
         voting = self.create_binary_voting()
+        voting.create_pubkey()
         #Nota: en esencia es el mismo test que update_voting, pero es necesario para probar las
         # diferentes posibles interacciones del sistema con las nuevas opciones en las pregutas.
 
@@ -5,4 +5,6 @@ from . import views
 urlpatterns = [
     path('', views.VotingView.as_view(), name='voting'),
     path('<int:voting_id>/', views.VotingUpdate.as_view(), name='voting'),
+    path('<int:voting_id>/tally/', views.TallyView.as_view(), name='tally'),
+    path('<int:voting_id>/window/', views.VotingWindow.as_view(), name='window'),
 ]
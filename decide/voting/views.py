@@ -1,14 +1,18 @@
 import django_filters.rest_framework
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, status
 from rest_framework.response import Response
 
-from .models import Question, QuestionOption, Voting
-from .serializers import SimpleVotingSerializer, VotingSerializer
+from .models import Question, QuestionOption, Voting, TallyJob, TallyRunning
+from .serializers import (SimpleVotingSerializer, VotingSerializer, TallyJobSerializer,
+                          VotingWindowSerializer)
 from base.perms import UserIsStaff
-from base.models import Auth
+from base.models import Auth, Key
 
 
 class VotingView(generics.ListCreateAPIView):
@@ -33,14 +37,29 @@ class VotingView(generics.ListCreateAPIView):
             if not data in request.data:
                 return Response({}, status=status.HTTP_400_BAD_REQUEST)
 
-        question = Question(desc=request.data.get('question'))
-        question.save()
-        for idx, q_opt in enumerate(request.data.get('question_opt')):
-            opt = QuestionOption(question=question, option=q_opt, number=idx)
-            opt.save()
+        key_mode = request.data.get('key_mode', '')
         voting = Voting(name=request.data.get('name'), desc=request.data.get('desc'),
-                question=question)
-        voting.save()
+                        homomorphic=request.data.get('homomorphic', False),
+                        key_mode=key_mode)
+        max_selections = int(request.data.get('max_selections', 1))
+        if key_mode and key_mode not in dict(Key.MODES) or max_selections < 1:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        # checked with the numbers the options get once saved
+        with transaction.atomic():
+            question = Question(desc=request.data.get('question'),
+                                max_selections=max_selections)
+            question.save()
+            for idx, q_opt in enumerate(request.data.get('question_opt')):
+                opt = QuestionOption(question=question, option=q_opt, number=idx)
+                opt.save()
+            voting.question = question
+            try:
+                voting.clean()
+            except ValidationError:
+                transaction.set_rollback(True)
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            voting.save()
 
         auth, _ = Auth.objects.get_or_create(url=settings.BASEURL,
                                           defaults={'me': True, 'name': 'test auth'})
@@ -89,13 +108,74 @@ class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
             elif not voting.end_date:
                 msg = 'Voting is not stopped'
                 st = status.HTTP_400_BAD_REQUEST
-            elif voting.tally:
+            elif voting.tallied():
                 msg = 'Voting already tallied'
                 st = status.HTTP_400_BAD_REQUEST
             else:
-                voting.tally_votes(request.auth.key)
-                msg = 'Voting tallied'
+                try:
+                    job = voting.tally_async(request.auth.key)
+                    if settings.TALLY_ASYNC:
+                        msg = 'Voting tally queued'
+                        st = status.HTTP_202_ACCEPTED
+                    elif job.state == TallyJob.DONE:
+                        msg = 'Voting tallied'
+                    elif job.state == TallyJob.CANCELLED:
+                        msg = 'Voting tally cancelled'
+                        st = status.HTTP_409_CONFLICT
+                    else:
+                        msg = job.error
+                        st = status.HTTP_500_INTERNAL_SERVER_ERROR
+                except TallyRunning:
+                    msg = 'Voting tally already running'
+                    st = status.HTTP_400_BAD_REQUEST
         else:
             msg = 'Action not found, try with start, stop or tally'
             st = status.HTTP_400_BAD_REQUEST
         return Response(msg, status=st)
+
+
+class VotingWindow(generics.RetrieveAPIView):
+    '''
+    Dates, key and number of options of a voting, for the store. With the
+    updated param, the version of the voting the store has, the answer is
+    a 304 if it's still the same.
+    '''
+
+    queryset = Voting.objects.select_related('pub_key')
+    serializer_class = VotingWindowSerializer
+    lookup_url_kwarg = 'voting_id'
+
+    def retrieve(self, request, voting_id, *args, **kwargs):
+        try:
+            updated = parse_datetime(request.GET.get('updated', ''))
+        except ValueError:
+            updated = None
+        if updated and Voting.objects.filter(pk=voting_id, updated=updated).exists():
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().retrieve(request, voting_id, *args, **kwargs)
+
+
+class TallyView(generics.GenericAPIView):
+    permission_classes = (UserIsStaff,)
+
+    def get(self, request, voting_id):
+        """
+        State and progress of the last tally job of the voting
+        """
+
+        voting = get_object_or_404(Voting, pk=voting_id)
+        job = voting.tally_job()
+        if not job:
+            return Response({}, status=status.HTTP_404_NOT_FOUND)
+        return Response(TallyJobSerializer(job).data)
+
+    def delete(self, request, voting_id):
+        """
+        Cancels the running tally job of the voting
+        """
+
+        voting = get_object_or_404(Voting, pk=voting_id)
+        job = voting.tally_job()
+        if not job or not job.cancel():
+            return Response('No tally running', status=status.HTTP_400_BAD_REQUEST)
+        return Response(TallyJobSerializer(job).data)